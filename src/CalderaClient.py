@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+'''
+Caldera REST client for CalderaPullPush.py.
+
+Keeps one pooled requests.Session per Caldera host, so every printer on a host reuses the same keep-alive connection
+instead of opening a new one per request.
+
+Job list requests are conditional. The ETag and Last-Modified values of each response are stored per URL and sent back
+as If-None-Match and If-Modified-Since, and a 304 Not Modified response is returned as "unchanged" without downloading
+the job list again. Servers that send neither header simply get a normal request every time.
+
+The /v1/devices list is requested once per host per cycle. Call begin_cycle() at the start of each loop to clear it.
+
+Optional long-poll mode: with long_poll_seconds > 0, job list requests also send "Prefer: wait=N" (RFC 7240) and allow
+the read to take that much longer. A server that supports it holds the request until the job list changes or N seconds
+pass; a server that doesn't ignores the header and answers immediately. Each long-polled printer can hold the loop for
+up to N seconds, so keep N below the printers' poll_seconds.
+'''
+
+import requests, logging
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CalderaClient:
+    CONNECT_TIMEOUT = 5 # seconds
+    READ_TIMEOUT = 30 # seconds
+    POOL_SIZE = 4 # connections kept open per host
+
+    def __init__(self, long_poll_seconds = 0):
+        self.long_poll_seconds = long_poll_seconds
+        self.sessions = {}      # "host:port" -> requests.Session
+        self.validators = {}    # url -> {"etag": str, "last_modified": str, "data": list}
+        self.devices = {}       # "host:port" -> devices list for the current cycle
+        self.request_count = 0
+
+    def begin_cycle(self):
+        """
+        Clears the per-cycle device lists, so the next get_devices() call for each host makes a fresh request.
+        """
+
+        self.devices.clear()
+
+    def session(self, host, port):
+        key = f"{host}:{port}"
+
+        if key not in self.sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions[key] = session
+
+        return self.sessions[key]
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+    def get_jobs(self, printer):
+        """
+        Gets the printer's finished nests, using a conditional request when the last response had validators.
+        Args:
+            printer (PrinterState): The printer to get nests for.
+        Returns:
+            tuple: A tuple containing the following elements:
+                - data (list or None): The job list, or None if the request failed.
+                - modified (bool): False if the server answered 304 Not Modified and data is the stored job list.
+        """
+
+        url = printer.jobs_url()
+        headers = {}
+        stored = self.validators.get(url)
+
+        if stored:
+            if stored['etag']:
+                headers['If-None-Match'] = stored['etag']
+            if stored['last_modified']:
+                headers['If-Modified-Since'] = stored['last_modified']
+
+        read_timeout = self.READ_TIMEOUT
+        if self.long_poll_seconds:
+            headers['Prefer'] = f"wait={self.long_poll_seconds}"
+            read_timeout += self.long_poll_seconds
+
+        try:
+            self.request_count += 1
+            response = self.session(printer.host, printer.port).get(
+                url, headers=headers, timeout=(self.CONNECT_TIMEOUT, read_timeout))
+            logger.info(f"get_jobs(): {response.status_code}, {url}")
+
+            if response.status_code == 304 and stored:
+                return stored['data'], False
+
+            response.raise_for_status()
+            data = response.json()
+
+        except Exception as e:
+            logger.error(f'get_jobs(): {e}')
+            return None, False
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if etag or last_modified:
+            self.validators[url] = {'etag': etag, 'last_modified': last_modified, 'data': data}
+        else:
+            self.validators.pop(url, None)
+
+        return data, True
+
+    def get_devices(self, host, port):
+        """
+        Gets the device list for a Caldera host. Only the first call per host in each cycle makes a request.
+        Args:
+            host (str): The Caldera host.
+            port (int): The Caldera REST port.
+        Returns:
+            list or None: The device list, or None if the request failed.
+        """
+
+        key = f"{host}:{port}"
+
+        if key in self.devices:
+            return self.devices[key]
+
+        url = f"http://{host}:{port}/v1/devices/"
+
+        try:
+            self.request_count += 1
+            response = self.session(host, port).get(url, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+            logger.info(f"get_devices(): {response.status_code}, {url}")
+            response.raise_for_status()
+            devices = response.json()
+        except Exception as e:
+            logger.error(f'get_devices(): {e}')
+            devices = None
+
+        self.devices[key] = devices # Failures are cached too, so a down host is only tried once a cycle.
+        return devices
+
+    def put_state(self, printer, state):
+        """
+        Sets a printer's device state, ie. "running".
+        Args:
+            printer (PrinterState): The printer to update.
+            state (str): The new state.
+        Returns:
+            requests.Response or None: The response, or None if the request failed.
+        """
+
+        url = f"{printer.devices_url()}{printer.printer_id}/state"
+
+        try:
+            self.request_count += 1
+            response = self.session(printer.host, printer.port).put(
+                url, json=state, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+            logger.info(f"put_state(): {response.status_code}")
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f'put_state(): {e}')
+            return None
+
+        return response
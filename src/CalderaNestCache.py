@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+'''
+Nest caches for CalderaPullPush.py.
+
+NestFingerprintCache remembers which Caldera nests have already been confirmed in Notion, so each poll only processes
+nests that are new or have changed since they were confirmed. Nests are keyed by Caldera `id` plus `idents.internal`,
+and fingerprinted on the fields process_data() uses (name, idents, input files and creation time).
+
+RelationCache remembers the full Jobs and Reprints relation lists of nest pages in Notion. Entries are keyed by nest
+page ID and dropped as soon as the page's `last_edited_time` changes, so a stable nest costs no property requests.
+'''
+
+import hashlib, json
+
+
+def nest_key(nest):
+    """
+    Returns the cache key of a Caldera nest, (id, idents.internal).
+    """
+
+    idents = nest.get('idents') or {}
+    return nest.get('id'), idents.get('internal')
+
+
+def nest_fingerprint(nest):
+    """
+    Returns a fingerprint of the parts of a Caldera nest that decide what gets written to Notion.
+    Args:
+        nest (dict): A single nest from the Caldera /v1/jobs response.
+    Returns:
+        str: A hex digest that changes whenever the nest's name, idents, input files or creation time change.
+    """
+
+    form = nest.get('form') or {}
+    origin = form.get('origin') or {}
+    evolution = form.get('evolution') or {}
+
+    relevant = {
+        'name': nest.get('name'),
+        'idents': nest.get('idents'),
+        'input': [rip_file.get('file') if isinstance(rip_file, dict) else rip_file for rip_file in origin.get('input') or []],
+        'creation': evolution.get('creation')
+        }
+
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class NestFingerprintCache:
+    """
+    Per-printer record of the Caldera nests that have been confirmed in Notion.
+    Attributes:
+        confirmed (dict): Maps nest_key() to the nest_fingerprint() the nest had when it was confirmed.
+    """
+
+    def __init__(self):
+        self.confirmed = {}
+
+    def __len__(self):
+        return len(self.confirmed)
+
+    def is_confirmed(self, nest):
+        return self.confirmed.get(nest_key(nest)) == nest_fingerprint(nest)
+
+    def confirm(self, nest):
+        self.confirmed[nest_key(nest)] = nest_fingerprint(nest)
+
+    def forget(self, nest):
+        self.confirmed.pop(nest_key(nest), None)
+
+    def pending(self, nests):
+        """
+        Filters a Caldera response down to the nests that are new or have changed since they were confirmed, and drops
+        confirmed nests that are no longer in the response so the cache stays the size of the pull limit.
+        Args:
+            nests (list): The Caldera /v1/jobs response.
+        Returns:
+            list: The nests that still need to be processed.
+        """
+
+        if not nests:
+            return []
+
+        live_keys = set()
+        pending = []
+
+        for nest in nests:
+            live_keys.add(nest_key(nest))
+
+            if not self.is_confirmed(nest):
+                pending.append(nest)
+
+        for key in list(self.confirmed):
+            if key not in live_keys:
+                del self.confirmed[key]
+
+        return pending
+
+
+class RelationCache:
+    """
+    Relation property results of Notion nest pages, invalidated on the page's last_edited_time.
+    Attributes:
+        pages (dict): Maps page ID (without hyphens) to (last_edited_time, {property ID: results list}).
+    """
+
+    def __init__(self):
+        self.pages = {}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def get(self, page_id, last_edited_time, prop_id):
+        """
+        Returns the cached results for a page property, or None if they are missing or the page has been edited since.
+        """
+
+        if last_edited_time is None:
+            return None
+
+        entry = self.pages.get(page_id.replace('-', ''))
+
+        if entry is None or entry[0] != last_edited_time:
+            return None
+
+        return entry[1].get(prop_id)
+
+    def set(self, page_id, last_edited_time, prop_id, results):
+        if last_edited_time is None: # Can't tell when the page changes, so don't cache it.
+            return
+
+        page_id = page_id.replace('-', '')
+        entry = self.pages.get(page_id)
+
+        if entry is None or entry[0] != last_edited_time:
+            entry = (last_edited_time, {})
+            self.pages[page_id] = entry
+
+        entry[1][prop_id] = results
+
+    def prune(self, page_ids):
+        """
+        Drops the pages that are not in page_ids, ie. nests that have aged out of the nest database query.
+        """
+
+        keep = {page_id.replace('-', '') for page_id in page_ids}
+
+        for page_id in list(self.pages):
+            if page_id not in keep:
+                del self.pages[page_id]
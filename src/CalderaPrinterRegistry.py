@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+'''
+Printer registry for CalderaPullPush.py.
+
+Loads the Epson printers from conf/CalderaPullPush_Printer_Conf.json and keeps one PrinterState object per printer,
+replacing the hard-coded ID_PRINTER_N / URL_PRINTER_N / pullStoreN module globals. Adding a printer only requires a new
+entry in the conf file.
+
+Each printer is polled on its own schedule. While a printer keeps finishing new nests it is polled every
+`poll_seconds`; every poll that returns no new data doubles the interval, up to `idle_poll_seconds`. This keeps the
+loop time flat as printers are added, since idle printers are skipped until they are due again.
+
+Example configuration file (CalderaPullPush_Printer_Conf.json):
+{
+    "port": 45344,                  # Caldera REST port, used for printers without their own "port".
+    "default_limit": 20,            # Number of finished nests to pull, used for printers without their own "limit".
+    "poll_seconds": 30,             # Fastest poll interval, used while the printer is actively finishing nests.
+    "idle_poll_seconds": 180,       # Slowest poll interval, reached after repeated polls with no new data.
+    "long_poll_seconds": 0,         # Optional. Long-poll wait for CalderaClient, 0 disables it.
+    "printers": [
+        {
+            "name": "EPSON_D",      # Short name used in logs.
+            "id": "...",            # Current Caldera device ID.
+            "old_id": "...",        # Device ID used before the Caldera migration. Nests in Notion may still use it.
+            "host": "192.168.0.52", # Caldera server the printer is attached to.
+            "limit": 20,            # Optional.
+            "poll_seconds": 30,     # Optional.
+            "idle_poll_seconds": 180, # Optional.
+            "check_state": true,    # Optional. Include the printer in the device state check. Defaults to true.
+            "enabled": true         # Optional. Defaults to true.
+        }
+    ]
+}
+'''
+
+import json, time, logging
+from CalderaNestCache import NestFingerprintCache
+
+JOBS_URL = 'http://#HOST#:#PORT#/v1/jobs?idents.device=#ID#&name=Autonest*&sort=idents.internal:desc&state=finished&limit=#LIMIT#'
+DEVICES_URL = 'http://#HOST#:#PORT#/v1/devices/'
+
+logger = logging.getLogger(__name__)
+
+
+class PrinterState:
+    """
+    Configuration and polling state for a single Caldera printer.
+    Attributes:
+        name (str): Short printer name, ie. EPSON_D.
+        printer_id (str): Current Caldera device ID.
+        old_id (str): Caldera device ID used before the migration.
+        host (str): IP address of the Caldera server the printer is attached to.
+        port (int): Caldera REST port.
+        limit (int): Number of finished nests to pull per poll.
+        poll_seconds (float): Poll interval while the printer is active.
+        idle_poll_seconds (float): Poll interval once the printer has gone idle.
+        check_state (bool): Whether the device state check includes this printer.
+        nest_cache (NestFingerprintCache): The nests from this printer that have been confirmed in Notion.
+        interval (float): The current poll interval.
+        next_poll (float): time.monotonic() value at which the printer is due again.
+    """
+
+    def __init__(self, name, printer_id, old_id, host, port, limit, poll_seconds, idle_poll_seconds, check_state = True):
+        self.name = name
+        self.printer_id = printer_id
+        self.old_id = old_id
+        self.host = host
+        self.port = port
+        self.limit = limit
+        self.poll_seconds = poll_seconds
+        self.idle_poll_seconds = max(idle_poll_seconds, poll_seconds)
+        self.check_state = check_state
+
+        self.nest_cache = NestFingerprintCache()
+        self.interval = poll_seconds
+        self.next_poll = 0.0 # Due immediately.
+
+    def __repr__(self):
+        return f"PrinterState({self.name}, {self.host}, every {self.interval}s)"
+
+    def jobs_url(self):
+        return (JOBS_URL.replace('#HOST#', self.host).replace('#PORT#', str(self.port))
+                .replace('#ID#', self.printer_id).replace('#LIMIT#', str(self.limit)))
+
+    def devices_url(self):
+        return DEVICES_URL.replace('#HOST#', self.host).replace('#PORT#', str(self.port))
+
+    def is_due(self, now):
+        return now >= self.next_poll
+
+    def record_poll(self, changed, now = None):
+        """
+        Schedules the next poll. A poll that found new data resets the interval to poll_seconds, a poll that did not
+        doubles it, capped at idle_poll_seconds.
+        Args:
+            changed (bool): Whether the poll returned new data.
+            now (float, optional): time.monotonic() value of the poll. Defaults to the current time.
+        Returns:
+            float: The new poll interval.
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        if changed:
+            self.interval = self.poll_seconds
+        else:
+            self.interval = min(self.interval * 2, self.idle_poll_seconds)
+
+        self.next_poll = now + self.interval
+        return self.interval
+
+
+class PrinterRegistry:
+    """
+    Holds the PrinterState objects for every enabled printer in the conf file.
+    Attributes:
+        printers (list): The PrinterState objects.
+        options (dict): The top level settings of the conf file, everything except "printers".
+    """
+
+    def __init__(self, printers, options = None):
+        self.printers = list(printers)
+        self.options = options or {}
+
+    def __iter__(self):
+        return iter(self.printers)
+
+    def __len__(self):
+        return len(self.printers)
+
+    @classmethod
+    def load(cls, conf_path):
+        """
+        Builds a registry from a printer configuration file.
+        Args:
+            conf_path (str): Path to the printer configuration JSON file.
+        Returns:
+            PrinterRegistry: The registry with one PrinterState per enabled printer.
+        """
+
+        with open(conf_path, 'r') as file:
+            conf = json.load(file)
+
+        return cls.from_dict(conf)
+
+    @classmethod
+    def from_dict(cls, conf):
+        port = conf.get('port', 45344)
+        default_limit = conf.get('default_limit', 20)
+        poll_seconds = conf.get('poll_seconds', 60)
+        idle_poll_seconds = conf.get('idle_poll_seconds', poll_seconds)
+
+        printers = []
+        for entry in conf.get('printers', []):
+            if not entry.get('enabled', True):
+                logger.info(f"Printer {entry.get('name')} is disabled. Skipping.")
+                continue
+
+            printers.append(PrinterState(
+                name = entry.get('name', entry['id']),
+                printer_id = entry['id'],
+                old_id = entry.get('old_id'),
+                host = entry['host'],
+                port = entry.get('port', port),
+                limit = entry.get('limit', default_limit),
+                poll_seconds = entry.get('poll_seconds', poll_seconds),
+                idle_poll_seconds = entry.get('idle_poll_seconds', idle_poll_seconds),
+                check_state = entry.get('check_state', True)
+                ))
+
+        return cls(printers, {key: value for key, value in conf.items() if key != 'printers'})
+
+    def get(self, name):
+        for printer in self.printers:
+            if printer.name == name:
+                return printer
+        return None
+
+    def hosts(self):
+        """
+        Groups the printers by Caldera server.
+        Returns:
+            dict: Maps (host, port) to the list of printers on that server.
+        """
+
+        hosts = {}
+        for printer in self.printers:
+            hosts.setdefault((printer.host, printer.port), []).append(printer)
+        return hosts
+
+    def due(self, now = None):
+        """
+        Returns the printers that are due to be polled, soonest first.
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        return sorted((printer for printer in self.printers if printer.is_due(now)), key=lambda p: p.next_poll)
+
+    def seconds_until_next(self, now = None):
+        """
+        Returns the number of seconds until the next printer is due. 0 if one is already due.
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        if not self.printers:
+            return None
+
+        return max(0.0, min(printer.next_poll for printer in self.printers) - now)
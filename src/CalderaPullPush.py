@@ -7,85 +7,60 @@ acorona@menoenterprises.com
 This script is designed to monitor and manage print jobs from Caldera to Notion. It performs the following tasks:
 1. **Initialization and Configuration:**
     - Imports necessary libraries and modules.
-    - Sets up constants and configurations, including printer IDs, IP addresses, URLs, and logging.
+    - Sets up constants and configurations, including logging.
+    - Loads the printer registry (printer IDs, hosts, pull limits and poll intervals) from conf/CalderaPullPush_Printer_Conf.json.
 2. **Helper Functions:**
-    - `parse_filename(filename)`: Parses a filename to extract a specific pattern defined by `ID_REGEX`.
+    - `parse_filename(filename)`: Parses a filename to extract a specific pattern defined by `ID_REGEX` in FilenameParser.py.
     - `catch_value(page, key)`: Retrieves the value associated with a given key from a dictionary-like object.
     - `check_for_nest(name, device, nest_db_data)`: Checks for a nest in the Notion database data.
     - `check_id_list(caldera_list, notion_list, update_check)`: Compares lists of IDs from Caldera and Notion.
     - `relation_packer(id_list, prop_name, package)`: Packs a relation property into a given package.
     - `repacker(prop_name, full_package, partial_package)`: Updates a dictionary with a value from another dictionary.
-    - `process_overlimit_relation(job_list, reprint_list, nest_db_id, package, nest_name)`: Processes job and reprint lists that exceed a certain limit.
+    - `chunk_relations(job_list, reprint_list, size)`: Splits job and reprint lists into paired batches of at most `size` items.
+    - `build_overlimit_packages(job_list, reprint_list, package, nest_name)`: Builds the additional nest packages for relation lists over the limit.
     - `fix_list(list)`: Processes a list of strings or dictionaries to remove hyphens.
     - `filter_bad_objects(list, device)`: Filters out bad objects from a list based on the device.
     - `create_notion_page(caldata, jobs_list_to_send, reps_list_to_send)`: Creates a new page in Notion for a given Caldera nest.
     - `parse_input(caldata)`: Parses input data to extract job and report IDs from filenames.
-    - `process_data(data, nest_db_data)`: Processes data from Caldera and compares it with the nest database data from Notion.
-    - `getRequest(urlRequest)`: Sends a GET request to a specified URL and returns the response.
-    - `putRequest(urlRequest, body)`: Sends a PUT request to a specified URL with a given body.
+    - `process_data(data, nest_db_data, old_printer_id, nest_cache)`: Processes data from Caldera and compares it with the nest database data from Notion.
     - `check_inactive_printers()`: Checks the status of printers and updates their state if necessary.
-    - `pullPush(urlPrinter, lastPull, nest_db_data)`: Pulls data from a specified URL and processes it if there is new data.
+    - `pullPush(printer, get_nest_db_data)`: Pulls data for a printer and processes the nests that are new or have changed.
+    - `run_cycle(due_printers)`: Runs one pass of the main loop over the printers that are due.
 3. **Main Loop:**
     - Continuously monitors and processes print jobs from Caldera.
+    - Polls each printer on its own schedule, faster while it is finishing nests and slower while it is idle.
     - Checks the status of printers and updates their state if necessary.
-    - Pulls data from Caldera and processes it if there is new data.
+    - Pulls data from Caldera and processes the nests that have not already been confirmed in Notion.
     - Logs information and handles garbage collection at regular intervals.
     - Stops the script within a specified time window.
-The script uses the `NotionApiHelper` class to interact with the Notion API and the `cronitor` library for monitoring.
+The script uses the `NotionApiHelper` class to interact with the Notion API, the `CalderaClient` class to interact with the
+Caldera REST API over pooled, conditional requests, and the `cronitor` library for monitoring.
 '''
 
 
 
-import gc, requests, time, cronitor, re, logging, os
+import gc, time, cronitor, logging, os
 from NotionApiHelper import NotionApiHelper
+from CalderaPrinterRegistry import PrinterRegistry
+from CalderaNestCache import RelationCache
+from CalderaClient import CalderaClient
+from FilenameParser import parse_rip_id
 from datetime import datetime
+from itertools import zip_longest
 
 STOP_TIME = ('23:52:00', '23:54:59') # Time window to stop the script
-ID_REGEX = r'^.*_(\w*)__\d*\.'
-PULL_TIMER = 60  # seconds
+PULL_TIMER = 60  # seconds, longest the loop will sleep between printer polls.
+PING_TIMER = 300 # seconds between cronitor pings.
+GC_TIMER = 10800 # seconds between garbage collections.
 WEBHOOK_URL = ''
 
-# idPrinter1 = 'bG9jYWxob3N0OjQ1MzQzfmNhbGRlcmFyaXB-RXBzb24tU3VyZUNvbG9yLUYxMDAwMC1B'  # Epson A
-ID_PRINTER_4_OLD = 'bG9jYWxob3N0OjQ1MzQzfmNhbGRlcmFyaXB-RXBzb24tU3VyZUNvbG9yLUYxMDAwMC1C'  # Epson B
-ID_PRINTER_4 = 'YlMweWZWZFlJMkZ2Tm1GbWJtYy1hbXM2TnlRfkVwc29uLVN1cmVDb2xvci1GMTAwMDAtQg'
-ID_PRINTER_1_OLD = 'bG9jYWxob3N0OjQ1MzQzfmNhbGRlcmFyaXB-RXBzb24tU3VyZUNvbG9yLUYxMDAwMC1E' # Epson D
-ID_PRINTER_1 = 'YlMweWZWZFlJMkZ2Tm1GbWJtYy1hbXM2TnlRfkVwc29uLVN1cmVDb2xvci1GMTAwMDAtRA'
-ID_PRINTER_3_OLD = 'bG9jYWxob3N0OjQ1MzQzfmNhbGRlcmFyaXB-RXBzb24tU3VyZUNvbG9yLUYxMDAwMC1G' # Epson F
-ID_PRINTER_3 = 'YlMweWZWZFlJMkZ2Tm1GbWJtYy1hbXM2TnlRfkVwc29uLVN1cmVDb2xvci1GMTAwMDAtRg'
-ID_PRINTER_2_OLD = 'bG9jYWxob3N0OjQ1MzQzfmNhbGRlcmFyaXB-RXBzb24tU3VyZUNvbG9yLUYxMDAwMC1F'   # Epson E
-ID_PRINTER_2 = 'YlMweWZWZFlJMkZ2Tm1GbWJtYy1hbXM2TnlRfkVwc29uLVN1cmVDb2xvci1GMTAwMDAtRQ'
-IP2 = '192.168.0.151'  # Master Dell PC IP
-IP1 = '192.168.0.52' # Secondary Dell PC IP
-# IP2 = '192.168.0.134' # Temporary PC for Epson F
-# ip2 = '192.168.0.151'  # Alienware, currently not relevant
-
-ACTIVE_PRINTERS = [(ID_PRINTER_1, IP1), (ID_PRINTER_2, IP1), (ID_PRINTER_3, IP1)]
-
-URL_PRINTER_1 = 'http://' + IP1 + ':45344/v1/jobs?idents.device=' + ID_PRINTER_1 + '&name=Autonest*&sort=idents.internal' \
-                                                                               ':desc&state=finished&limit=20'
-URL_PRINTER_2 = 'http://' + IP1 + ':45344/v1/jobs?idents.device=' + ID_PRINTER_2 + '&name=Autonest*&sort=idents.internal' \
-                                                                               ':desc&state=finished&limit=20'
-URL_PRINTER_3 = 'http://' + IP1 + ':45344/v1/jobs?idents.device=' + ID_PRINTER_3 + '&name=Autonest*&sort=idents.internal' \
-                                                                               ':desc&state=finished&limit=15'
-URL_PRINTER_4 = 'http://' + IP1 + ':45344/v1/jobs?idents.device=' + ID_PRINTER_4 + '&name=Autonest*&sort=idents.internal' \
-                                                                                 ':desc&state=finished&limit=15'
-                                                                               
-URL_DEVICE = 'http://#IPADDRESS#:45344/v1/devices/'                                                        
+# Printer IDs, hosts, pull limits and poll intervals are kept in the printer conf file.
+PRINTER_CONF_PATH = "conf/CalderaPullPush_Printer_Conf.json"
+CRONITOR_KEY_PATH = "conf/Cronitor_API_Key.txt"
 
 NEST_DB_ID = '36f1f2e349e147a69468af461c31ab00'
+RELATION_LIMIT = 100 # Max relations Notion accepts per property in a single request.
 NEST_DB_FILTER = {"timestamp": "created_time", "created_time": {"past_week": {}}}
-    
-pullStore1 = {}
-pullStore2 = {}  # If adding additional printers, add more of these variables.
-pullStore3 = {}    
-pullStore4 = {}
-                                                                               
-loopCount = 0
-
-with open("conf/Cronitor_API_Key.txt") as file:
-    cronitor_api_key = file.read()
-cronitor.api_key = cronitor_api_key
-MONITOR = cronitor.Monitor('wsoCXX')
 
 LOG_DIR = "logs"
 log_path = os.path.join(LOG_DIR, "CalderaPullPush.log")
@@ -99,25 +74,21 @@ file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelnam
 logger.addHandler(file_handler)
 
 notion_helper = NotionApiHelper()
+printer_registry = PrinterRegistry.load(PRINTER_CONF_PATH)
+relation_cache = RelationCache() # Jobs/Reprints relations of nest pages, keyed by nest page ID.
+caldera_client = CalderaClient(long_poll_seconds=printer_registry.options.get('long_poll_seconds', 0))
 
 
 def parse_filename(filename):
     """
-    Parses the given filename to extract a specific pattern defined by ID_REGEX.
+    Parses the given filename to extract a specific pattern defined by FilenameParser.ID_REGEX.
     Args:
         filename (str): The filename to be parsed.
     Returns:
         str or None: The extracted pattern if found, otherwise None.
     """
     
-    if filename is None:
-        return None
-    
-    match = re.search(ID_REGEX, filename)
-    if match:
-        return match.group(1)
-    
-    return None
+    return parse_rip_id(filename) # Precompiled and cached, Caldera returns the same rip files every poll.
 
 def catch_value(page, key):
     """
@@ -159,33 +130,32 @@ def check_for_nest(name, device, service, nest_db_data, old_printer_id):
             - found (bool): A boolean indicating whether the nest was found (True) or not (False).
     """
 
-    def _get_rest(url, id):
-        new_response = notion_helper.get_url_property(url, id)
+    def _get_results(property, page_id, last_edited_time):
+        # Relations only change when the nest page is edited, so reuse the last results until then.
+        cached = relation_cache.get(page_id, last_edited_time, property['id'])
         
-        if 'has_more' in new_response:
-            if new_response['has_more']:
-                new_response += _get_rest(new_response['property_item']['next_url'], id)
-                
-                if new_response.status_code != 200:
-                    return None
-                
-                if 'results' in new_response:
-                    return new_response['results']
-                
-        return new_response['results']
-    
-    def _get_results(property, page_id):
-        response = notion_helper.get_page_property(page_id, property['id'])
+        if cached is not None:
+            logging.debug(f"_get_results(): Using cached {property['id']} for {page_id}.")
+            return cached
         
-        if response is None:
-            return None
+        results = []
+        start_cursor = None
         
-        results = response['results']
-        
-        if 'has_more' in response:
-            if response['has_more']:
-                results += _get_rest(response['property_item']['next_url'], property['id'])
+        # Follow next_cursor until the full relation list has been collected.
+        while True:
+            response = notion_helper.get_page_property(page_id, property['id'], start_cursor)
+            
+            if not response:
+                return None
+            
+            results.extend(response.get('results', []))
+            
+            if not response.get('has_more') or not response.get('next_cursor'):
+                break
+            
+            start_cursor = response['next_cursor']
         
+        relation_cache.set(page_id, last_edited_time, property['id'], results)
         logging.debug(f"_get_results(): {results}")
         return results
         
@@ -200,6 +170,7 @@ def check_for_nest(name, device, service, nest_db_data, old_printer_id):
             device_id = notion_helper.return_property_value(properties['Device ID'], page_id)
             service_id = notion_helper.return_property_value(properties['Software service ID'], page_id)
             created = page['created_time']
+            last_edited = catch_value(page, 'last_edited_time')
             print_status = notion_helper.return_property_value(properties['Print Status'], page_id)
             
             # Check if the nest was created more than a week ago.
@@ -213,10 +184,12 @@ def check_for_nest(name, device, service, nest_db_data, old_printer_id):
             # Check if the nest name and device ID match the provided values.
             if nest_name == name and (device_id == device or device_id == old_printer_id) and service_id == service:
                 
+                jobs_list = reprints_list = None
+                
                 # Check for the Jobs and Reprints properties in the page.
                 if all(key in properties for key in ['Jobs', 'Reprints']):
-                    jobs_list = _get_results(properties['Jobs'], page_id)
-                    reprints_list = _get_results(properties['Reprints'], page_id)
+                    jobs_list = _get_results(properties['Jobs'], page_id, last_edited)
+                    reprints_list = _get_results(properties['Reprints'], page_id, last_edited)
                     
                     logger.info(f"check_for_nest(): Found Nest {name} in Notion.")
                     print(f"check_for_nest() - Jobs: {jobs_list}\nRep: {reprints_list}")
@@ -281,59 +254,55 @@ def repacker(prop_name, full_package, partial_package):
     full_package[prop_name] = partial_package[prop_name]
     return full_package
     
-def process_overlimit_relation(job_list, reprint_list, nest_db_id, package, nest_name):
+def chunk_relations(job_list, reprint_list, size = RELATION_LIMIT):
     """
-    Processes job and reprint lists that exceed a certain limit by creating and updating packages in batches.
+    Splits the job and reprint lists into batches of at most `size` items, pairing the Nth job batch with the Nth
+    reprint batch. The shorter list is padded with empty batches, so lists of different lengths are fully covered.
     Args:
-        job_list (list): List of job items to be processed.
-        reprint_list (list): List of reprint items to be processed.
-        nest_db_id (str): The database ID where the package will be updated.
-        package (dict): The initial package dictionary to be updated with job and reprint relations.
-        nest_name (str): The name of the nest to be used in the package name.
+        job_list (list): List of job IDs.
+        reprint_list (list): List of reprint IDs.
+        size (int, optional): The maximum number of relations per batch. Defaults to RELATION_LIMIT.
     Returns:
-        None
+        list: A list of (jobs_batch, reprints_batch) tuples. Empty if both lists are empty.
+    Example:
+        >>> chunk_relations(['a', 'b', 'c'], ['d'], 2)
+        [(['a', 'b'], ['d']), (['c'], [])]
     """
     
-    job_list_len = len(job_list)
-    reprint_list_len = len(reprint_list)
-    
-    # Determine the maximum list size to process.
-    max_list_size = job_list_len if job_list_len >= reprint_list_len else reprint_list_len
-    logging.info(f"process_overlimit_relation()\n Max List Size: {max_list_size}, Job List: {job_list_len}, Reprint List: {reprint_list_len}")
+    job_batches = [job_list[i:i+size] for i in range(0, len(job_list), size)]
+    reprint_batches = [reprint_list[i:i+size] for i in range(0, len(reprint_list), size)]
     
-    # Process the lists in batches of 100 items. Creates a new notion page for each batch.
-    for i in range(100, max_list_size, 100):
-        
-        time.sleep(.5)
+    return list(zip_longest(job_batches, reprint_batches, fillvalue=[]))
 
-        index = (i/100)+1
-        package['Name'] = notion_helper.rich_text_prop_gen('Name', "rich_text", [f"{nest_name}-{str(index)}"])['Name']
-        
-        # Remove the Jobs and Reprints properties from the package.
-        if 'Jobs' in package:
-            package.pop('Jobs')
-        if 'Reprints' in package:
-            package.pop('Reprints')
-        
-        if i + 100 > job_list_len:
-            jobs_list_to_send = job_list[i:]
-        else:
-            jobs_list_to_send = job_list[i:i+100]
-            
-        if i + 100 > reprint_list_len:
-            reps_list_to_send = reprint_list[i:]
-        else:
-            reps_list_to_send = reprint_list[i:i+100]
+def build_overlimit_packages(job_list, reprint_list, package, nest_name):
+    """
+    Builds one package per batch of job and reprint relations past the first RELATION_LIMIT items. Each package is a 
+    copy of the nest package with its own relation batch and the name "{nest_name}-{index}", starting at 2.
+    Args:
+        job_list (list): The full list of job IDs for the nest.
+        reprint_list (list): The full list of reprint IDs for the nest.
+        package (dict): The nest package, used as the template for the additional pages.
+        nest_name (str): The name of the nest to be used in the package name.
+    Returns:
+        list: The packages for the additional nest pages.
+    """
+    
+    batches = chunk_relations(job_list, reprint_list)[1:] # The first batch goes on the nest page itself.
+    logging.info(f"build_overlimit_packages()\n Batches: {len(batches)}, Job List: {len(job_list)}, Reprint List: {len(reprint_list)}")
+    
+    packages = []
+    for index, (jobs_list_to_send, reps_list_to_send) in enumerate(batches, start=2):
+        overlimit_package = {key: value for key, value in package.items() if key not in ['Jobs', 'Reprints']}
+        overlimit_package['Name'] = notion_helper.rich_text_prop_gen('Name', "rich_text", [f"{nest_name}-{index}"])['Name']
         
         if jobs_list_to_send:
-            package = relation_packer(jobs_list_to_send, 'Jobs', package)
+            overlimit_package = relation_packer(jobs_list_to_send, 'Jobs', overlimit_package)
         if reps_list_to_send:
-            package = relation_packer(reps_list_to_send, 'Reprints', package)
+            overlimit_package = relation_packer(reps_list_to_send, 'Reprints', overlimit_package)
             
-        logging.info(f"Package: {package}")
-        response = notion_helper.create_page(nest_db_id, package)
-        logger.info(f"Updated Nest {nest_db_id} with additional relations.")
-    pass
+        packages.append(overlimit_package)
+        
+    return packages
 
 def fix_list(list):
     """
@@ -386,11 +355,14 @@ def filter_bad_objects(list, device):
     1. If the item does not have associated data, it is removed from the list.
     2. If the item does not contain 'properties', it is removed from the list.
     3. If the 'Hot folder path' property is present:
-       - If the path is 'BroadPillow', 'SuedePillow', or 'BroadRunner' and the device is ID_PRINTER_1, the item is removed.
-       - If the path is not one of the above and the device is ID_PRINTER_2, the item is removed.
+       - If the path is 'BroadPillow', 'SuedePillow', or 'BroadRunner' and the device is EPSON_D, the item is removed.
+       - If the path is not one of the above and the device is EPSON_E, the item is removed.
     """
     
     
+    epson_d = printer_registry.get('EPSON_D')
+    epson_e = printer_registry.get('EPSON_E')
+    
     if list:
         for item in list:
             data = notion_helper.get_page(item)
@@ -405,10 +377,10 @@ def filter_bad_objects(list, device):
             
             if 'Hot folder path' in data['properties']:
                 if data['properties']['Hot folder path'] in ['BroadPillow', 'SuedePillow', 'BroadRunner']:
-                    if device == ID_PRINTER_1: # If the device is Epson D, remove the item.
+                    if epson_d and device == epson_d.printer_id: # If the device is Epson D, remove the item.
                         list.remove(item)
                 else: # If the hot folder path is not one of the above
-                    if device == ID_PRINTER_2: # If the device is Epson E, remove the item.
+                    if epson_e and device == epson_e.printer_id: # If the device is Epson E, remove the item.
                         list.remove(item)
                         
     return list                   
@@ -428,19 +400,19 @@ def create_notion_page(caldata, jobs_list_to_send, reps_list_to_send):
         jobs_list_to_send (list): A list of job objects to be related to the Notion page.
         reps_list_to_send (list): A list of reprint objects to be related to the Notion page.
     Returns:
-        None
+        bool: True if the nest page was created, otherwise False.
     Raises:
         Any exceptions raised by the Notion API or helper functions will propagate.
     Notes:
         - Filters out bad objects from the jobs and reprints lists based on the device.
         - If the jobs or reprints lists exceed 100 items, they are split into multiple packages.
         - Adds various properties to the Notion page package.
-        - Creates the Notion page and logs the creation.
-        - If the relation lists are oversized, processes the remaining items.
+        - Creates the Notion page, then the pages for any oversized relation batches concurrently.
     """
     
     
     oversized_relation = False
+    overlimit_packages = []
     logger.info(f"Creating package for Nest {caldata['name']}.")
     package = {}
     
@@ -450,12 +422,12 @@ def create_notion_page(caldata, jobs_list_to_send, reps_list_to_send):
     #        each = filter_bad_objects(each, caldata['device'])
     
     # If the relation lists are over 100 items, split them into multiple packages.
-    if len(jobs_list_to_send) >= 100 or len(reps_list_to_send) >= 100:
+    if len(jobs_list_to_send) > RELATION_LIMIT or len(reps_list_to_send) > RELATION_LIMIT:
         oversized_relation = True
         whole_jobs_list = jobs_list_to_send.copy()
         whole_reps_list = reps_list_to_send.copy()
-        jobs_list_to_send = whole_jobs_list[:100]
-        reps_list_to_send = whole_reps_list[:100]
+        jobs_list_to_send = whole_jobs_list[:RELATION_LIMIT]
+        reps_list_to_send = whole_reps_list[:RELATION_LIMIT]
     
     # Add the relation properties to the package.
     if jobs_list_to_send:
@@ -474,14 +446,29 @@ def create_notion_page(caldata, jobs_list_to_send, reps_list_to_send):
     package = repacker('Name', package, notion_helper.rich_text_prop_gen('Name', "rich_text", [caldata['name']]))
     package = repacker('Nest Creation Time', package, notion_helper.rich_text_prop_gen('Nest Creation Time', "rich_text", [str(caldata['creation'])]))
     
-    # The nest does not exist in Notion, create a new page.
+    # If the relation lists are over 100 items, the remaining batches go on additional pages.
+    if oversized_relation:
+        overlimit_packages = build_overlimit_packages(whole_jobs_list, whole_reps_list, package, caldata['name'])
+    
+    # The nest does not exist in Notion. The main page goes first: if it fails the nest is retried next poll, and no
+    # overflow pages may exist yet or the retry would duplicate them.
     print(package)
-    response = notion_helper.create_page(NEST_DB_ID, package)
+    if not notion_helper.create_page(NEST_DB_ID, package):
+        logger.error(f"Failed to create Nest {caldata['name']}")
+        return False
+    
     logger.info(f"Created Nest {caldata['name']}")
-        
-    # If the relation lists are over 100 items, split them into multiple packages.
-    if oversized_relation:
-        process_overlimit_relation(whole_jobs_list, whole_reps_list, NEST_DB_ID, package, caldata['name'])
+    
+    # The overflow pages are created together under the shared rate limiter.
+    responses = notion_helper.create_pages(NEST_DB_ID, overlimit_packages)
+    
+    for index, response in enumerate(responses, start=2):
+        if response:
+            logger.info(f"Created Nest {caldata['name']}-{index} with additional relations.")
+        else:
+            logger.error(f"Failed to create Nest {caldata['name']}-{index} with additional relations.")
+    
+    return True
 
 def parse_input(input_list):
     """
@@ -508,12 +495,15 @@ def parse_input(input_list):
                 
     return caldera_job_id_list, caldera_rep_id_list
 
-def process_data(data, nest_db_data, old_printer_id):
+def process_data(data, nest_db_data, old_printer_id, nest_cache = None):
     """
     Processes the data from Caldera and compares it with the nest database data from Notion.
     Args:
         data (list): The data retrieved from Caldera, expected to be a list of nests.
         nest_db_data (dict): The nest database data retrieved from Notion.
+        old_printer_id (str): The printer's device ID from before the Caldera migration.
+        nest_cache (NestFingerprintCache, optional): Nests that exist in Notion, or need nothing written, are confirmed
+            in the cache so later polls skip them.
     Returns:
         None
     The function performs the following steps:
@@ -544,7 +534,9 @@ def process_data(data, nest_db_data, old_printer_id):
         
         # Skip if the name does not contain 'Autonest'.
         if 'Autonest' not in name:
-            logger.info("{name} is not a nest. Continuing.")
+            logger.info(f"{name} is not a nest. Continuing.")
+            if nest_cache is not None:
+                nest_cache.confirm(nest)
             continue
         
         # Initialize variables for each nest.
@@ -574,12 +566,16 @@ def process_data(data, nest_db_data, old_printer_id):
         # Continue the loop of both lists in Caldera are empty.
         if all(not each for each in [caldera_job_id_list, caldera_rep_id_list]):
             logger.info(f"No files found for Nest {name}.\n")
+            if nest_cache is not None:
+                nest_cache.confirm(nest)
             continue
 
         # Nest exists in Notion, checks that all the job relations have been added to the nest in Notion.
         logger.info(f"ID: {bool(nest_page_id)}, Jobs: {bool(nest_notion_jobs_list)}, Reprints: {bool(nest_notion_reprints_list)}, Matches: {matches_internal}")
         if nest_page_id and (nest_notion_jobs_list or nest_notion_reprints_list) and matches_internal:
             logger.info(f"Nest {name} exists in Notion.\n")
+            if nest_cache is not None:
+                nest_cache.confirm(nest)
             continue
         
         # Nest does not exist in Notion, set variables to create a new page.
@@ -587,154 +583,167 @@ def process_data(data, nest_db_data, old_printer_id):
             logger.info(f"Nest {name} does not exist in Notion.")
             
             logger.info(f" {name}\nJobs: {caldera_job_id_list}\nReprints: {caldera_rep_id_list}\n")
-            create_notion_page(caldata, caldera_job_id_list, caldera_rep_id_list)
+            created = create_notion_page(caldata, caldera_job_id_list, caldera_rep_id_list)
+            
+            # Only confirm once the page exists, a failed create is retried on the next poll.
+            if created and nest_cache is not None:
+                nest_cache.confirm(nest)
         
     print("\n")
 
-def getRequest(urlRequest):
-    """
-    Sends a GET request to the specified URL and returns the response.
-    Args:
-        urlRequest (str): The URL to which the GET request is sent.
-    Returns:
-        requests.Response: The response object from the GET request if successful.
-        None: If an exception occurs during the request.
-    Logs:
-        Logs the status code of the response if the request is successful.
-        Logs the exception message if an error occurs.
-    """
-    
-    getReq = []
-    
-    try:
-        getReq = requests.get(urlRequest)
-        logger.info(f"getRequest(): {getReq.status_code}, {urlRequest}")
-        getReq.raise_for_status()
-    except Exception as e:
-        logger.error(f'getRequest(): {e}')
-        return None
-    
-    return getReq
-
-def putRequest(urlRequest, body):
-    """
-    Sends a PUT request to the specified URL with the given body.
-    Args:
-        urlRequest (str): The URL to which the PUT request is sent.
-        body (dict): The JSON body to be sent with the PUT request.
-    Returns:
-        requests.Response: The response object from the PUT request if successful.
-        None: If an exception occurs during the request.
-    Logs:
-        Logs the status code of the response if the request is successful.
-        Logs the exception message if an error occurs.
-    """
-    
-    putReq = []
-    
-    try:
-        putReq = requests.put(urlRequest, json=body)
-        logger.info(f"putRequest(): {putReq.status_code}")
-        putReq.raise_for_status()
-    except Exception as e:
-        logger.error(f'putRequest(): {e}')
-
 def check_inactive_printers():
     """
-    Checks the status of printers in the ACTIVE_PRINTERS list. For each printer, it sends a GET request to the 
-    corresponding endpoint to retrieve its status. If the printer is not running, it logs an info message and 
-    sends a PUT request to change the printer's state to 'running'.
+    Checks the status of the printers in the printer registry that have check_state enabled. The device list is
+    requested once per Caldera host, then each printer on that host is looked up in it. If a printer is not running,
+    it logs an info message and sends a PUT request to change the printer's state to 'running'.
     The function performs the following steps:
-    1. Iterates over each printer in the ACTIVE_PRINTERS list.
-    2. Replaces the placeholder in the URL_DEVICE with the printer's IP address.
-    3. Sends a GET request to the endpoint to get the printer's status.
-    4. Checks if the response contains an 'id' that matches the printer's ID.
-    5. If the printer's status is not 'running', logs an info message and sends a PUT request to update the printer's state.
+    1. Groups the printers with check_state enabled by Caldera host.
+    2. Gets the host's device list through the Caldera client, which only requests it once per cycle.
+    3. Checks if the response contains an 'id' that matches each printer's ID.
+    4. If the printer's status is not 'running', logs an info message and sends a PUT request to update the printer's state.
     Note:
-    - ACTIVE_PRINTERS is expected to be a list of tuples, where each tuple contains the printer's ID and IP address.
-    - URL_DEVICE is a string containing the endpoint URL with a placeholder for the IP address.
-    - getRequest and putRequest are functions used to send GET and PUT requests, respectively.
     - logger is used to log information messages.
     """
     
-    for printer in ACTIVE_PRINTERS:
-        endpoint = URL_DEVICE.replace("#IPADDRESS#", printer[1])
-        response = getRequest(endpoint)
+    for (host, port), printers in printer_registry.hosts().items():
+        printers = [printer for printer in printers if printer.check_state]
         
-        if response is None:
+        if not printers:
             continue
         
-        for each in response.json():
-            if 'id' in each:
-                if each['id'] == printer[0]:
-                    if each['state'] != 'running':
-                        logger.info(f"Starting printer {printer[0]}.")
-                        #putRequest(f"{endpoint}/{printer[0]}/state", "running")
-                    else:
-                        logger.info(f"Printer {printer[0]}: State: {each['state']}")
+        devices = caldera_client.get_devices(host, port)
+        
+        if devices is None:
+            continue
+        
+        for printer in printers:
+            for each in devices:
+                if 'id' in each:
+                    if each['id'] == printer.printer_id:
+                        if each['state'] != 'running':
+                            logger.info(f"Starting printer {printer.name}.")
+                            #caldera_client.put_state(printer, "running")
+                        else:
+                            logger.info(f"Printer {printer.name}: State: {each['state']}")
     
 
-def pullPush(urlPrinter, lastPull, nest_db_data, old_printer_id):
+def pullPush(printer, get_nest_db_data):
     """
-    Pulls data from a specified URL and processes it if there is new data.
+    Pulls data from the printer's Caldera jobs endpoint and processes the nests that are new or have changed since they
+    were last confirmed in Notion, then schedules the printer's next poll.
     Args:
-        urlPrinter (str): The URL to pull data from.
-        lastPull (dict): The last pulled data to compare with the new data.
-        nest_db_data (dict): The database data to be used in processing.
+        printer (PrinterState): The printer to pull data for.
+        get_nest_db_data (callable): Returns the nest database data to be used in processing. Only called when there
+            are nests to process.
     Returns:
-        dict: The latest pulled data from the URL.
+        bool: True if new or changed nests were found, otherwise False.
     """
     
-    caldera_response = getRequest(urlPrinter)
+    spoolerJson, modified = caldera_client.get_jobs(printer)
+    
+    # Request failed.
+    if spoolerJson is None:
+        printer.record_poll(False)
+        return False
     
-    if (caldera_response == []) or (caldera_response is None):
-        return lastPull
+    # On 304 Not Modified spoolerJson is the stored job list, which still holds any nests that failed last time.
+    pending_nests = printer.nest_cache.pending(spoolerJson)
+    changed = bool(pending_nests)
     
-    spoolerJson = caldera_response.json()
+    if not modified and not changed:
+        logger.info(f"No data change for {printer.name}.")
+        printer.record_poll(False)
+        return False
     
-    if lastPull != spoolerJson:
-        logger.info("New Caldera data detected, processing...")
-        process_data(spoolerJson, nest_db_data, old_printer_id)
+    if changed:
+        logger.info(f"{len(pending_nests)} new or changed nests detected for {printer.name}, processing...")
+        process_data(pending_nests, get_nest_db_data(), printer.old_id, printer.nest_cache)
         
     else:
-        logger.info("No data change.")
+        logger.info(f"No data change for {printer.name}.")
         
-    return spoolerJson
-
-
+    interval = printer.record_poll(changed)
+    logger.info(f"Next poll for {printer.name} in {interval} seconds.")
+    
+    return changed
 
-MONITOR.ping(state='run')
-gc.enable()
 
-while True:
-    nest_db_data = notion_helper.query(NEST_DB_ID, content_filter=NEST_DB_FILTER)
+def run_cycle(due_printers):
+    """
+    Runs one pass of the main loop over the printers that are due: checks printer states, then pulls and processes
+    each printer's nests.
+    Args:
+        due_printers (list): The PrinterState objects to poll.
+    Returns:
+        int: The number of printers that had new or changed nests.
+    """
+    
+    caldera_client.begin_cycle()
+    nest_db_store = {}
+    
+    # The nest database is only queried once a cycle, and only if a printer has new or changed nests.
+    def get_nest_db_data():
+        if 'data' not in nest_db_store:
+            nest_db_store['data'] = notion_helper.query(NEST_DB_ID, content_filter=NEST_DB_FILTER)
+            
+            if nest_db_store['data']:
+                relation_cache.prune(page['id'] for page in nest_db_store['data'])
+                
+        return nest_db_store['data']
+    
     check_inactive_printers()
     
-    logger.info(f"Getting Data: {ID_PRINTER_2}")
-    pullStore2 = pullPush(URL_PRINTER_2, pullStore2, nest_db_data, ID_PRINTER_2_OLD) 
-    logger.info(f"Getting Data: {ID_PRINTER_1}")
-    pullStore1 = pullPush(URL_PRINTER_1, pullStore1, nest_db_data, ID_PRINTER_1_OLD)
-    logger.info(f"Getting Data: {ID_PRINTER_3}")
-    pullStore3 = pullPush(URL_PRINTER_3, pullStore3, nest_db_data, ID_PRINTER_3_OLD)
-    logger.info(f"Getting Data: {ID_PRINTER_4}")
-    pullStore4 = pullPush(URL_PRINTER_4, pullStore4, nest_db_data, ID_PRINTER_4_OLD)
+    changed_printers = 0
+    for printer in due_printers:
+        logger.info(f"Getting Data: {printer.name} - {printer.printer_id}")
+        if pullPush(printer, get_nest_db_data):
+            changed_printers += 1
+            
+    return changed_printers
+
 
-    time.sleep(PULL_TIMER)
-    loopCount += 1
+def main():
+    with open(CRONITOR_KEY_PATH) as file:
+        cronitor_api_key = file.read()
+    cronitor.api_key = cronitor_api_key
+    monitor = cronitor.Monitor('wsoCXX')
     
-    if loopCount % 5 == 0:
-        print(f"pong at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        MONITOR.ping()
+    monitor.ping(state='run')
+    gc.enable()
+    
+    last_ping = last_gc = time.monotonic()
+    
+    while True:
+        due_printers = printer_registry.due()
+        
+        if due_printers:
+            run_cycle(due_printers)
         
-    if loopCount % 180 == 0:
-        gc.collect()
-        logger.info(str(datetime.now().strftime("%H:%M:%S")) + " - It's trash day.\n")
+        # Sleep until the next printer is due, capped so the stop window and pings are never skipped.
+        wait = printer_registry.seconds_until_next()
+        time.sleep(PULL_TIMER if wait is None else min(max(wait, 1), PULL_TIMER))
         
-    now = time.strftime('%H:%M:%S')
+        now_monotonic = time.monotonic()
+        
+        if now_monotonic - last_ping >= PING_TIMER:
+            print(f"pong at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            monitor.ping()
+            last_ping = now_monotonic
+            
+        if now_monotonic - last_gc >= GC_TIMER:
+            gc.collect()
+            logger.info(str(datetime.now().strftime("%H:%M:%S")) + " - It's trash day.\n")
+            last_gc = now_monotonic
+            
+        now = time.strftime('%H:%M:%S')
+        
+        if STOP_TIME[1] >= now and now >= STOP_TIME[0]:
+            logger.info("Time is within the stop window. Stopping the observer.")
+            break
     
-    if STOP_TIME[1] >= now and now >= STOP_TIME[0]:
-        logger.info("Time is within the stop window. Stopping the observer.")
-        MONITOR.ping(state='complete')
-        break
+    caldera_client.close()
+    monitor.ping(state='complete')
+
 
-MONITOR.ping(state='complete')
+if __name__ == "__main__":
+    main()
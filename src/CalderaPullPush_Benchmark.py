@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+'''
+Throughput benchmark for CalderaPullPush.py.
+
+Starts a CalderaReplayServer, points CalderaPullPush's printer registry, Caldera client and Notion helper at it, and
+drives CalderaPullPush.run_cycle() through N printers x M nests. For each cycle it reports the wall time, the requests
+made to each Caldera and Notion endpoint, and the peak Python memory (tracemalloc). The first cycle creates every nest
+in the fake Notion database; later cycles show the steady state, with --new-nests finished nests added per printer
+between cycles.
+
+NotionApiHelper's built in rate limiting sleeps are left in place, so the cycle times include them the same as in
+production.
+
+Usage (from the repository root):
+    python src/CalderaPullPush_Benchmark.py --printers 4 --nests 20 --jobs 10 --cycles 5 --new-nests 1
+    python src/CalderaPullPush_Benchmark.py --recording logs/Caldera_Recording.json --json output/bench.json
+'''
+
+import argparse, contextlib, io, json, logging, os, sys, time, tracemalloc
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+
+from CalderaReplayServer import ReplayServer, load_recording, synthetic_recording
+from CalderaPrinterRegistry import PrinterRegistry, PrinterState
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark CalderaPullPush against a local replay server.")
+    parser.add_argument('--printers', type=int, default=4, help="Printers in the synthetic recording.")
+    parser.add_argument('--nests', type=int, default=20, help="Finished nests per printer.")
+    parser.add_argument('--jobs', type=int, default=10, help="Jobs per synthetic nest.")
+    parser.add_argument('--reprints', type=int, default=0, help="Reprints per synthetic nest.")
+    parser.add_argument('--cycles', type=int, default=5, help="Pull cycles to run.")
+    parser.add_argument('--new-nests', type=int, default=0, help="Nests each printer finishes between cycles.")
+    parser.add_argument('--recording', help="Replay a recorded Caldera response instead of a synthetic one.")
+    parser.add_argument('--no-etags', action='store_true', help="Replay server sends no ETags.")
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--verbose', action='store_true', help="Keep CalderaPullPush's output and logging.")
+    return parser.parse_args()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def main():
+    args = parse_args()
+    os.chdir(REPO_DIR) # CalderaPullPush opens its conf, log and header files relative to the repository root.
+
+    if args.recording:
+        recording = load_recording(args.recording)
+    else:
+        recording = synthetic_recording(args.printers, args.nests, args.jobs, args.reprints)
+
+    server = ReplayServer(recording, etags=not args.no_etags)
+    server.start()
+
+    import CalderaPullPush
+
+    if not args.verbose:
+        logging.disable(logging.WARNING) # Keep benchmark runs out of logs/CalderaPullPush.log.
+
+    host, port = server.server_address
+    limit = max((len(nests) for nests in recording['jobs'].values()), default=20)
+    registry = PrinterRegistry([
+        PrinterState(f"BENCH_{index}", device_id, None, host, port, limit, 0, 0)
+        for index, device_id in enumerate(recording['jobs'], start=1)
+        ])
+
+    CalderaPullPush.printer_registry = registry
+    CalderaPullPush.notion_helper.endPoint = f"{server.base_url}/v1"
+
+    print(f"Printers: {len(registry)}, nests per printer: {limit}, cycles: {args.cycles}, etags: {not args.no_etags}")
+    print(f"{'cycle':>5} {'seconds':>9} {'changed':>8} {'caldera':>8} {'notion':>7} {'py peak MB':>11}  requests")
+
+    results = []
+    tracemalloc.start()
+
+    for cycle in range(1, args.cycles + 1):
+        if cycle > 1 and args.new_nests:
+            for device_id in recording['jobs']:
+                server.add_nests(device_id, args.new_nests, args.jobs, args.reprints)
+
+        before = server.snapshot_counts()
+        tracemalloc.reset_peak()
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+        start = time.perf_counter()
+        with output:
+            changed = CalderaPullPush.run_cycle(registry.due())
+        elapsed = time.perf_counter() - start
+
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        counts = server.snapshot_counts()
+        counts.subtract(before)
+        counts = {route: count for route, count in sorted(counts.items()) if count}
+        caldera_calls = sum(count for route, count in counts.items() if ' /v1/jobs' in route or ' /v1/devices' in route)
+        notion_calls = sum(counts.values()) - caldera_calls
+
+        results.append({'cycle': cycle, 'seconds': round(elapsed, 4), 'changed_printers': changed,
+                        'caldera_requests': caldera_calls, 'notion_requests': notion_calls,
+                        'python_peak_mb': round(peak, 3), 'requests': counts})
+        print(f"{cycle:>5} {elapsed:>9.3f} {changed:>8} {caldera_calls:>8} {notion_calls:>7} {peak:>11.3f}  {counts}")
+
+    tracemalloc.stop()
+    server.stop()
+    CalderaPullPush.caldera_client.close()
+
+    summary = {
+        'printers': len(registry), 'nests_per_printer': limit, 'etags': not args.no_etags,
+        'total_seconds': round(sum(result['seconds'] for result in results), 4),
+        'notion_pages': len(server.pages), 'peak_rss_mb': peak_rss_mb(), 'cycles': results
+        }
+    rss = f"{summary['peak_rss_mb']:.1f} MB" if summary['peak_rss_mb'] else "n/a"
+    print(f"Total: {summary['total_seconds']} s, Notion pages: {summary['notion_pages']}, peak RSS: {rss}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
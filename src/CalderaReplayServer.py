@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+
+'''
+Local stand-in for Caldera and Notion, used to measure CalderaPullPush.py without live printers or a Notion workspace.
+
+The server replays recorded Caldera /v1/jobs and /v1/devices responses and fakes the handful of Notion endpoints
+CalderaPullPush and the preflight use. Notion pages created through it are kept in memory, so a second pull cycle sees
+the nests the first one created, the same as production. Pages can also be seeded with add_page(), see
+Preflight_Backlog_Benchmark.py. Every request is counted by route, see ReplayServer.counts.
+
+With notion_rate set, Notion requests over that average rate (a token bucket of notion_burst requests) are answered
+429 with a Retry-After header, as Notion does past its limit of 3 requests per second. They are counted as "429".
+
+Caldera endpoints:
+    GET  /v1/jobs?idents.device=ID&limit=N      Recorded nests for the device, newest first. Sends an ETag and honours
+                                                If-None-Match unless the server was started with etags=False.
+    GET  /v1/devices/                           Recorded device list.
+Notion endpoints:
+    POST /v1/databases/{id}/query               Every page in the database. An "or" filter of formula or rich_text
+                                                "contains" conditions is applied, other filters are ignored.
+    POST /v1/pages                              Creates a page.
+    GET  /v1/pages/{id}                         Returns a page.
+    PATCH /v1/pages/{id}                        Updates a page's properties.
+    GET  /v1/pages/{id}/properties/{prop_id}    Returns a property item, relations paginated 25 at a time.
+
+Recording format (JSON):
+{
+    "jobs": {"<device id>": [<nest>, ...]},     # The /v1/jobs response for each device.
+    "devices": [<device>, ...]                  # The /v1/devices response.
+}
+
+Usage:
+    Record the live Caldera responses for the printers in the printer conf:
+        python src/CalderaReplayServer.py record logs/Caldera_Recording.json
+    Serve a recording, or a synthetic one when no path is given:
+        python src/CalderaReplayServer.py serve [recording.json] [--port 45344]
+'''
+
+import json, sys, threading, hashlib, uuid, argparse, time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, quote
+
+NOTION_PAGE_SIZE = 25 # Relations per property item page, same as Notion.
+
+
+def load_recording(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_recording(recording, path):
+    with open(path, 'w') as file:
+        json.dump(recording, file, indent=4)
+
+
+def synthetic_nest(device_id, internal, jobs_per_nest, reprints_per_nest = 0):
+    """
+    Builds a finished Caldera nest in the shape of the /v1/jobs response, with one rip file per job and reprint.
+    """
+
+    creation = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    rip_files = [{'file': f"PR--JOB-{internal}{n}_1-1_SKU_{uuid.uuid4().hex}__1.jpg"} for n in range(jobs_per_nest)]
+    rip_files += [{'file': f"PR--REP-{internal}{n}_1-1_SKU_{uuid.uuid4().hex}__1.jpg"} for n in range(reprints_per_nest)]
+
+    return {
+        'id': f"{device_id}-{internal}",
+        'name': f"Autonest #{internal}",
+        'state': 'finished',
+        'idents': {'internal': internal, 'service': 'BENCHMARK-SERVICE', 'device': device_id},
+        'form': {'origin': {'input': rip_files}, 'evolution': {'creation': creation}}
+        }
+
+
+def synthetic_recording(printer_count, nest_count, jobs_per_nest, reprints_per_nest = 0):
+    """
+    Builds a recording for printer_count printers with nest_count finished nests each.
+    Returns:
+        dict: The recording, see the module docstring for the format.
+    """
+
+    recording = {'jobs': {}, 'devices': []}
+
+    for printer in range(1, printer_count + 1):
+        device_id = f"BENCHMARK-PRINTER-{printer}"
+        recording['devices'].append({'id': device_id, 'state': 'running'})
+        recording['jobs'][device_id] = [
+            synthetic_nest(device_id, internal, jobs_per_nest, reprints_per_nest)
+            for internal in range(nest_count, 0, -1)
+            ]
+
+    return recording
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the recording, the fake Notion pages and the request counts.
+    Attributes:
+        recording (dict): The Caldera responses being replayed.
+        etags (bool): Whether /v1/jobs responses carry an ETag and honour If-None-Match.
+        notion_rate (float or None): Average Notion requests per second before answering 429. None for no limit.
+        notion_burst (int): Notion requests allowed at once before the average applies.
+        pages (dict): Notion pages created so far, keyed by page ID without hyphens.
+        counts (collections.Counter): Requests served, keyed by "METHOD /route".
+    """
+
+    daemon_threads = True
+
+    def __init__(self, recording, host = '127.0.0.1', port = 0, etags = True, notion_rate = None, notion_burst = 3):
+        super().__init__((host, port), ReplayHandler)
+        self.recording = recording
+        self.etags = etags
+        self.notion_rate = notion_rate
+        self.notion_burst = notion_burst
+        self.tokens = notion_burst
+        self.last_token = time.monotonic()
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def add_nests(self, device_id, count, jobs_per_nest, reprints_per_nest = 0):
+        """
+        Adds newly finished nests to the front of a device's job list, as if the printer had just finished them.
+        """
+
+        with self.lock:
+            nests = self.recording['jobs'].setdefault(device_id, [])
+            newest = max((nest['idents']['internal'] for nest in nests), default=0)
+            new_nests = [synthetic_nest(device_id, newest + n, jobs_per_nest, reprints_per_nest) for n in range(count, 0, -1)]
+            self.recording['jobs'][device_id] = new_nests + nests
+
+    def add_page(self, database_id, properties, page_id = None):
+        """
+        Adds a Notion page, as if it already existed in the workspace. Properties are given in response form, with
+        their "id" and "type", so property IDs like Notion's own ("iegJ") can be used.
+        Returns:
+            str: The page ID.
+        """
+
+        now = _notion_now()
+        page_id = page_id or str(uuid.uuid4())
+        page = {
+            'object': 'page', 'id': page_id, 'created_time': now, 'last_edited_time': now,
+            'parent': {'database_id': database_id}, 'properties': properties
+            }
+
+        with self.lock:
+            self.pages[page_id.replace('-', '')] = page
+        return page_id
+
+    def count(self, method, route):
+        with self.lock:
+            self.counts[f"{method} {route}"] += 1
+
+    def take_notion_token(self):
+        """
+        Returns:
+            bool: False if the request is over the Notion rate limit and should be answered 429.
+        """
+
+        if self.notion_rate is None:
+            return True
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.notion_burst, self.tokens + (now - self.last_token) * self.notion_rate)
+            self.last_token = now
+            if self.tokens < 1:
+                self.counts['429'] += 1
+                return False
+            self.tokens -= 1
+            return True
+
+    def snapshot_counts(self):
+        with self.lock:
+            return Counter(self.counts)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so pooled sessions behave like they do against Caldera.
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_empty(self, status, headers = None):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _rate_limited(self):
+        # Answers 429 and returns True when the request is over the Notion rate limit.
+        if self.server.take_notion_token():
+            return False
+        self._send_json(429, {'object': 'error', 'status': 429, 'code': 'rate_limited'},
+                        {'Retry-After': str(max(1, round(1 / self.server.notion_rate)))})
+        return True
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+
+        if parts[:2] == ['v1', 'jobs']:
+            self.server.count('GET', '/v1/jobs')
+            return self._caldera_jobs(query)
+
+        if parts[:2] == ['v1', 'devices']:
+            self.server.count('GET', '/v1/devices')
+            return self._send_json(200, self.server.recording.get('devices', []))
+
+        if parts[:2] == ['v1', 'pages'] and len(parts) == 5 and parts[3] == 'properties':
+            self.server.count('GET', '/v1/pages/{id}/properties/{prop_id}')
+            if self._rate_limited():
+                return
+            return self._notion_property(parts[2], parts[4], query)
+
+        if parts[:2] == ['v1', 'pages'] and len(parts) == 3:
+            self.server.count('GET', '/v1/pages/{id}')
+            if self._rate_limited():
+                return
+            page = self.server.pages.get(parts[2].replace('-', ''))
+            return self._send_json(200, page) if page else self._send_json(404, {'object': 'error'})
+
+        self.server.count('GET', 'unknown')
+        self._send_json(404, {'object': 'error'})
+
+    def do_POST(self):
+        parts = [part for part in urlsplit(self.path).path.split('/') if part]
+        body = self._read_json()
+
+        if parts[:2] == ['v1', 'databases'] and parts[-1] == 'query':
+            self.server.count('POST', '/v1/databases/{id}/query')
+            if self._rate_limited():
+                return
+            return self._notion_query(parts[2], body)
+
+        if parts == ['v1', 'pages']:
+            self.server.count('POST', '/v1/pages')
+            if self._rate_limited():
+                return
+            return self._notion_create(body)
+
+        self.server.count('POST', 'unknown')
+        self._send_json(404, {'object': 'error'})
+
+    def do_PATCH(self):
+        parts = [part for part in urlsplit(self.path).path.split('/') if part]
+        body = self._read_json()
+
+        if parts[:2] == ['v1', 'pages'] and len(parts) == 3:
+            self.server.count('PATCH', '/v1/pages/{id}')
+            if self._rate_limited():
+                return
+            with self.server.lock:
+                page = self.server.pages.get(parts[2].replace('-', ''))
+                if page is None:
+                    return self._send_json(404, {'object': 'error'})
+                page['properties'].update(_normalize_properties(body.get('properties', {})))
+                page['last_edited_time'] = _notion_now()
+            return self._send_json(200, page)
+
+        self.server.count('PATCH', 'unknown')
+        self._send_json(404, {'object': 'error'})
+
+    def _caldera_jobs(self, query):
+        device_id = (query.get('idents.device') or [None])[0]
+        limit = int((query.get('limit') or [20])[0])
+
+        with self.server.lock:
+            nests = self.server.recording.get('jobs', {}).get(device_id, [])[:limit]
+            body = json.dumps(nests)
+
+        if not self.server.etags:
+            return self._send_json(200, nests)
+
+        etag = '"' + hashlib.sha1(body.encode('utf-8')).hexdigest() + '"'
+
+        if self.headers.get('If-None-Match') == etag:
+            return self._send_empty(304, {'ETag': etag})
+
+        self._send_json(200, nests, {'ETag': etag})
+
+    def _notion_query(self, database_id, body):
+        page_size = body.get('page_size', 100)
+        start = int(body.get('start_cursor') or 0)
+        database_id = database_id.replace('-', '')
+
+        with self.server.lock:
+            pages = [
+                page for page in reversed(self.server.pages.values()) # Newest first.
+                if (page.get('parent') or {}).get('database_id', '').replace('-', '') == database_id
+                and _matches(page, body.get('filter'))
+                ]
+
+        results = pages[start:start + page_size]
+        has_more = start + page_size < len(pages)
+        self._send_json(200, {
+            'object': 'list', 'results': results, 'has_more': has_more,
+            'next_cursor': str(start + page_size) if has_more else None
+            })
+
+    def _notion_create(self, body):
+        now = _notion_now()
+        page_id = str(uuid.uuid4())
+        page = {
+            'object': 'page', 'id': page_id, 'created_time': now, 'last_edited_time': now,
+            'parent': body.get('parent'), 'properties': _normalize_properties(body.get('properties', {}))
+            }
+
+        with self.server.lock:
+            self.server.pages[page_id.replace('-', '')] = page
+
+        self._send_json(200, page)
+
+    def _notion_property(self, page_id, prop_id, query):
+        page = self.server.pages.get(page_id.replace('-', ''))
+        prop = None
+
+        if page:
+            for value in page['properties'].values():
+                if value['id'] == prop_id:
+                    prop = value
+
+        if prop is None:
+            return self._send_json(404, {'object': 'error'})
+
+        if prop['type'] != 'relation':
+            return self._send_json(200, {'object': 'property_item', 'id': prop_id, 'type': prop['type'],
+                                         prop['type']: prop[prop['type']]})
+
+        start = int((query.get('start_cursor') or [0])[0])
+        relations = prop['relation']
+        results = [{'object': 'property_item', 'id': prop_id, 'type': 'relation', 'relation': {'id': relation['id']}}
+                   for relation in relations[start:start + NOTION_PAGE_SIZE]]
+        has_more = start + NOTION_PAGE_SIZE < len(relations)
+
+        self._send_json(200, {
+            'object': 'list', 'results': results, 'has_more': has_more,
+            'next_cursor': str(start + NOTION_PAGE_SIZE) if has_more else None,
+            'type': 'property_item', 'property_item': {'id': prop_id, 'type': 'relation', 'relation': {}}
+            })
+
+
+def _matches(page, content_filter):
+    """
+    Applies an "or" filter of "contains" conditions on formula strings or rich_text. Other filters match every page.
+    """
+
+    if not content_filter or 'or' not in content_filter:
+        return True
+
+    for condition in content_filter['or']:
+        prop = page['properties'].get(condition.get('property'))
+        if prop is None:
+            continue
+        if 'formula' in condition:
+            value = (prop.get('formula') or {}).get('string') or ''
+            contains = condition['formula'].get('string', {}).get('contains')
+        elif 'rich_text' in condition:
+            value = "".join(text.get('plain_text', '') for text in prop.get('rich_text') or [])
+            contains = condition['rich_text'].get('contains')
+        else:
+            return True
+        if contains is not None and contains in value:
+            return True
+
+    return False
+
+
+def _notion_now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _normalize_properties(properties):
+    """
+    Turns request properties, ie. {"Name": {"rich_text": [...]}}, into response properties with "id" and "type".
+    """
+
+    normalized = {}
+
+    for name, value in properties.items():
+        prop_type = next(key for key in value if key not in ['id', 'type'])
+        prop = {'id': quote(name), 'type': prop_type, prop_type: value[prop_type]}
+
+        if prop_type == 'relation':
+            prop['has_more'] = False
+
+        normalized[name] = prop
+
+    return normalized
+
+
+def record(conf_path, output_path):
+    """
+    Records the live /v1/jobs response of every printer in the printer conf, and the /v1/devices response of each host.
+    """
+
+    from CalderaPrinterRegistry import PrinterRegistry
+    from CalderaClient import CalderaClient
+
+    registry = PrinterRegistry.load(conf_path)
+    client = CalderaClient()
+    recording = {'jobs': {}, 'devices': []}
+
+    for (host, port), printers in registry.hosts().items():
+        recording['devices'].extend(client.get_devices(host, port) or [])
+
+        for printer in printers:
+            data, _ = client.get_jobs(printer)
+            recording['jobs'][printer.printer_id] = data or []
+
+    client.close()
+    save_recording(recording, output_path)
+    print(f"Recorded {len(recording['jobs'])} printers to {output_path}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caldera/Notion replay server for CalderaPullPush.py.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="Record live Caldera responses.")
+    record_parser.add_argument('output')
+    record_parser.add_argument('--conf', default="conf/CalderaPullPush_Printer_Conf.json")
+
+    serve_parser = commands.add_parser('serve', help="Serve a recording.")
+    serve_parser.add_argument('recording', nargs='?')
+    serve_parser.add_argument('--port', type=int, default=45344)
+    serve_parser.add_argument('--printers', type=int, default=4)
+    serve_parser.add_argument('--nests', type=int, default=20)
+    serve_parser.add_argument('--jobs', type=int, default=10)
+    serve_parser.add_argument('--no-etags', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.conf, args.output)
+        return
+
+    recording = load_recording(args.recording) if args.recording else synthetic_recording(args.printers, args.nests, args.jobs)
+    server = ReplayServer(recording, port=args.port, etags=not args.no_etags)
+    print(f"Serving {len(recording['jobs'])} printers at {server.base_url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
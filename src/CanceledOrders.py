@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+'''
+Canceled order registry for CheckImageThenHotfolder.py.
+
+Canceled orders are kept in a set for O(1) lookups, backed by an append-only text file with one order page ID per
+line (output/MOD_Canceled_Orders.txt). Every preflight worker thread shares one registry, and other preflight
+processes using the same file are picked up by reading whatever was appended since the last read, at most every
+refresh_seconds. If the file was replaced or shrank (compacted by another process), it is read again from the start.
+The file read is kept open, so its inode can't be reused by the file replacing it and the swap always shows.
+
+Compaction rewrites the file without duplicates or blank lines once COMPACT_MIN_LINES lines are wasted, checked at
+start up and after each add. The new file is written to "<name>.~#~" and swapped in with os.replace(). Appends and
+compaction both hold a lock file, "<name>.lock", created with O_EXCL the same way PreflightPipeline claims files, so
+no process appends between compaction's last read and the replace and an append is never dropped. Lock files older
+than STALE_LOCK_SECONDS are left over from a crash and are taken over. If the lock can't be had within
+LOCK_TIMEOUT_SECONDS, an append goes ahead without it (so a cancelation is never lost here) and compaction waits for
+the next add.
+
+Classes:
+    CanceledOrderRegistry: The set of canceled order IDs and its file.
+'''
+
+import os, time, threading, logging
+from contextlib import contextmanager
+
+REFRESH_SECONDS = 5
+COMPACT_MIN_LINES = 1000 # Duplicate or blank lines before the file is compacted.
+TEMP_SUFFIX = ".~#~"
+LOCK_SUFFIX = ".lock"
+LOCK_TIMEOUT_SECONDS = 10
+STALE_LOCK_SECONDS = 60
+
+
+class CanceledOrderRegistry:
+    """
+    Args:
+        path (str): The canceled orders file. Created if missing.
+        refresh_seconds (float): How often lookups check the file for orders added by other processes.
+    """
+
+    def __init__(self, path, refresh_seconds = REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.orders = set()
+        self.offset = 0         # Bytes of the file already read.
+        self.file = None        # The file read, kept open to notice it being replaced.
+        self.lines = 0          # Lines read, including duplicates and blanks.
+        self.last_refresh = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self.lock:
+            self._refresh()
+            self._compact()
+
+    def __contains__(self, order_id):
+        with self.lock:
+            if time.monotonic() - self.last_refresh >= self.refresh_seconds:
+                self._refresh()
+            return order_id in self.orders
+
+    def __len__(self):
+        with self.lock:
+            return len(self.orders)
+
+    def add(self, order_id):
+        """
+        Records a canceled order, in memory and in the file.
+        Returns:
+            bool: False if it was already recorded.
+        """
+
+        order_id = order_id.strip()
+        with self.lock:
+            self._refresh()
+            if order_id in self.orders:
+                return False
+
+            # One write per line in append mode, so lines from different processes don't interleave.
+            with self._file_lock() as locked:
+                if not locked:
+                    logging.warning(f"Couldn't lock {self.path}, appending {order_id} without the lock.")
+                with open(self.path, 'a') as file:
+                    file.write(f"{order_id}\n")
+            self.orders.add(order_id)
+
+            self._refresh()
+            self._compact()
+            return True
+
+    def _refresh(self):
+        """
+        Reads lines appended since the last read. Call with the lock held.
+        """
+
+        self.last_refresh = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            open(self.path, 'a').close()
+            stat = os.stat(self.path)
+
+        if self.file is None or not os.path.samestat(os.fstat(self.file.fileno()), stat):
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, 'rb')
+            self.offset = 0
+
+        if os.fstat(self.file.fileno()).st_size < self.offset: # Truncated, read it all again.
+            self.offset = 0
+
+        if self.offset == 0:
+            self.orders.clear()
+            self.lines = 0
+
+        self.file.seek(self.offset)
+        data = self.file.read()
+        if not data:
+            return
+
+        end = data.rfind(b"\n") + 1 # A line still being written is read next time.
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            self.lines += 1
+            if line.strip():
+                self.orders.add(line.strip())
+        self.offset += end
+
+    def _compact(self):
+        """
+        Rewrites the file without duplicate or blank lines. Call with the lock held.
+        """
+
+        if self.lines - len(self.orders) < COMPACT_MIN_LINES:
+            return
+
+        temp_path = self.path + TEMP_SUFFIX
+        with self._file_lock() as locked:
+            if not locked:
+                return
+
+            self._refresh() # Appends made before the lock was taken.
+            try:
+                with open(temp_path, 'w') as file:
+                    file.writelines(f"{order_id}\n" for order_id in sorted(self.orders))
+
+                if os.path.getsize(self.path) != self.offset: # Appended to without the lock, try on the next add.
+                    os.remove(temp_path)
+                    return
+
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.error(f"Error compacting {self.path}: {e}")
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                return
+
+        logging.info(f"Compacted {self.path} from {self.lines} lines to {len(self.orders)}.")
+        self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Holds the lock file shared with other processes. Yields False if it couldn't be had in LOCK_TIMEOUT_SECONDS.
+        """
+
+        lock_path = self.path + LOCK_SUFFIX
+        deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+        locked = False
+
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, f"{os.getpid()} {time.time()}".encode())
+                os.close(fd)
+                locked = True
+                break
+
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS
+                except OSError:
+                    continue # Released in the meantime, try again.
+
+                if stale:
+                    logging.info(f"Taking over stale lock {lock_path}.")
+                    try:
+                        os.remove(lock_path)
+                    except OSError:
+                        pass
+                    continue
+
+            except OSError as e:
+                logging.error(f"Error locking {self.path}: {e}")
+                break
+
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+        try:
+            yield locked
+        finally:
+            if locked:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
@@ -2,18 +2,25 @@
 # Aria Corona Oct. 29th, 2024
 # This script is designed to monitor a hotfolder for new files, check if they are images, and process them for preflight.
 
-import time, os, re, shutil, cronitor, gc
+import time, os, re, cronitor, gc, threading, multiprocessing
 # from watchdog.observers import Observer
 # from watchdog.events import FileSystemEventHandler
 from NotionApiHelper import NotionApiHelper
 from AutomatedEmails import AutomatedEmails
+from PreflightPipeline import FileClaims, PreflightPipeline
+from HopperWatcher import create_watcher
+from ImageProbe import probe_image
+from PreflightContext import PreflightContextLoader
+from PreflightPlanner import plan_preflight
+from FilenameParser import parse_filename
+from PreflightColor import load_color_settings
+from CanceledOrders import CanceledOrderRegistry
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from pathlib import Path
-from PIL import Image
 import json
 import logging
-import warnings
-import subprocess
+import PreflightImageOps
 
 '''
 Dependencies:
@@ -21,6 +28,12 @@ Dependencies:
     pip install cronitor
     NotionApiHelper.py
     AutomatedEmails.py
+    PreflightPipeline.py
+    PreflightImageOps.py
+    HopperWatcher.py
+    ImageProbe.py
+    Optional: pip install watchdog (event driven watching of local Hopper paths)
+    Optional: pip install pyvips (streaming of oversize images, needs libvips)
 Property Dependencies:
     MOD Jobs Database:
         - Log
@@ -48,9 +61,10 @@ Image correction logic:
     3. Check if file is a reprint. If so, send it straight to a hotfolder.
     4. Get job information from Notion.
     5. Get product information from Notion.
+    Steps 4 and 5 are prefetched for each batch of Hopper files, see Concurrency.
     6. Get image size and DPI.
 
-    7. Preflight checks:
+    7. Preflight checks, decided by PreflightPlanner.plan_preflight():
         1. Determine rotation based off which aspect ratio is closer to target aspect ratio.
         2. Check if image aspect ratio is within 5% of target aspect ratio. If not, trash the file and report the error.
         3. Check if image size matches target size within 38 pixels (1/4 inch) at 150 DPI.
@@ -60,11 +74,53 @@ Image correction logic:
             a. If customer is on approved preflight list, scale image, crop to correct aspect ratio and move to hotfolder.
             b. If customer is not on approved preflight list, report error and trash file. Order and related jobs are canceled and the customer is notified.
             c. If customer is on the no-preflight list, crop to correct aspect ratio and size without scaling and move to hotfolder.
+
+Concurrency:
+    Hopper files are processed by a pool of NOTION_WORKERS threads (see PreflightPipeline.py), each file claimed so
+    only one worker takes it. Resizing, cropping and DPI changes run in a separate pool of IMAGE_WORKERS processes, so
+    a large image doesn't hold up the Notion lookups for other files. Both counts can be set in
+    conf/MOD_Preflight_Conf.json:
+        {"notion_workers": 4, "image_workers": 2}
+    Setting image_workers to 0 runs image work in the calling thread.
+    When a batch of files is queued, a PreflightContextLoader (see PreflightContext.py) queries their jobs in bulk and
+    fetches the orders' customers, the customers' preflight approval and the products once each, on notion_workers
+    threads, so workers mostly read from its cache.
+
+Hopper watching:
+    Files are handed to the pipeline by a HopperWatcher once they have finished copying, either renamed from their
+    ".~#~" temp name or unchanged in size and mtime for settle_seconds. The watcher backend is set in the same conf
+    file ("auto", "inotify" or "polling", see HopperWatcher.py):
+        {"watcher": "auto", "settle_seconds": 2, "rescan_seconds": 60}
+
+Oversize images:
+    Images of stream_pixels or more are streamed through libvips when pyvips is installed, and each image worker refuses
+    smaller images that would need more than memory_budget_mb, setting the job to Error with the reason in its log.
+    Without pyvips every image is processed with Pillow, and the image workers take images over memory_budget_mb one
+    at a time. See PreflightImageOps.py.
+        {"stream_pixels": 150000000, "memory_budget_mb": 2048}
+
+Color conversion:
+    Off by default. When on, resized, cropped and DPI fixed images are converted to the printer profile in the image
+    workers, with transforms cached per source profile. See PreflightColor.py.
+        {"color": {"enabled": true, "target_profile": "conf/profiles/printer.icc", "intent": "perceptual"}}
 '''
 
 CRONITOR_KEY_PATH = "conf/Cronitor_API_Key.txt"
 PING_CYCLE = 100
 GC_CYCLE = 3600
+PREFLIGHT_CONF_PATH = "conf/MOD_Preflight_Conf.json"
+NOTION_WORKERS = 4 # Files processed at once.
+IMAGE_WORKERS = 2 # Processes for Pillow work.
+PREFLIGHT_CONF_DEFAULTS = {
+    'notion_workers': NOTION_WORKERS,
+    'image_workers': IMAGE_WORKERS,
+    'watcher': 'auto',
+    'settle_seconds': 2,
+    'rescan_seconds': 60,
+    'stream_pixels': PreflightImageOps.STREAM_PIXELS,
+    'memory_budget_mb': PreflightImageOps.MEMORY_BUDGET_MB,
+    'color': {'enabled': False, 'target_profile': None, 'intent': 'perceptual'}
+    }
 STOP_TIME = '23:59:00' # Time to stop the script
 PATH = r"\\192.168.0.178\meno\Hotfolders\Hopper"  # Replace with the path to your hotfolder
 
@@ -77,17 +133,18 @@ logging.basicConfig(level=logging.INFO,
 
 
 class HotfolderHandler():
-    def __init__(self):
-        self.notion_helper = NotionApiHelper()
+    def __init__(self, image_workers = 0, stream_pixels = PreflightImageOps.STREAM_PIXELS,
+                 memory_budget_mb = PreflightImageOps.MEMORY_BUDGET_MB, notion_workers = NOTION_WORKERS,
+                 color_settings = None):
+        self.local = threading.local() # Each worker thread gets its own NotionApiHelper.
+        self.context = PreflightContextLoader(notion_workers)
+        self.email_lock = threading.Lock()
         self.automated_emails = AutomatedEmails()
         self.EMAIL_CONFIG_PATH = r"conf/MOD_Preflight_Error_Conf.json"
         self.BLANK_CONFIG_PATH = r"conf/Blank_To_Email_Conf.json"
         self.TEMP_CONFIG_PATH = r"conf/Temp_To_Email_Conf.json"
         self.HOTFOLDER_PATH = "//192.168.0.178/meno/Hotfolders"
         self.CANCELED_ORDER_PATH = r"output/MOD_Canceled_Orders.txt"
-        self.EXTENSION_REGEX = r"(.+)\.(jpg|jpeg|png)$"
-        self.DATABASE_REGEX = r".*_(.*)__\d*"
-        self.REPRINT_REGEX = r".*--(REP)-\d*_.*"
         self.EMAIL_ADDRESS_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
         self.DUPLICATE_FILE_REGEX = r".*\(\d{1,4}\).*"
         self.ACCEPTED_EXTENSIONS = ['jpg', 'jpeg', 'png', 'tif', 'tiff']
@@ -105,40 +162,95 @@ class HotfolderHandler():
         self.JOB_NESTING_PACKAGE = {'Job status': {'select': {'name': 'Nesting'}}}
         self.REPRINT_NESTING_PACKAGE = {'Reprint status': {'select': {'name': 'Nesting'}}}
         
-        with open(self.CANCELED_ORDER_PATH, 'r') as file:
-            self.canceled_orders = file.readlines()
+        self.canceled_orders = CanceledOrderRegistry(self.CANCELED_ORDER_PATH) # Order page IDs, shared by the workers.
               
-        warnings.simplefilter('ignore', Image.DecompressionBombWarning) # Suppresses DecompressionBombWarning
-        Image.MAX_IMAGE_PIXELS = 600000000     # Ups the max image size to account for large 300DPI images.
+        # Suppresses DecompressionBombWarning and ups the max image size to account for large 300DPI images.
+        self.image_settings = (PreflightImageOps.MAX_IMAGE_PIXELS, stream_pixels, memory_budget_mb)
+        self.color_settings = color_settings
+        PreflightImageOps.init_worker(*self.image_settings, limit_memory=False, color=color_settings)
+
+        self.image_workers = image_workers
+        self.image_pool_lock = threading.Lock()
+        self.image_pool = self.create_image_pool() if image_workers > 0 else None
+
+
+    def create_image_pool(self):
+        # A new pool gets a new oversize lock, as a worker killed while holding the old one never releases it.
+        return ProcessPoolExecutor(
+            max_workers=self.image_workers, initializer=PreflightImageOps.init_worker,
+            initargs=(*self.image_settings, True, self.color_settings, multiprocessing.Lock())
+            )
+
 
+    @property
+    def notion_helper(self):
+        if not hasattr(self.local, 'notion_helper'):
+            self.local.notion_helper = NotionApiHelper()
+        return self.local.notion_helper
+
+
+    def run_image_task(self, task, *args):
+        """
+        Runs a PreflightImageOps function in the image process pool and waits for its result. Runs it in the calling
+        thread when there is no pool. Errors raised by the task are raised here.
+        """
+        
+        if self.image_pool is None:
+            return task(*args)
 
-    def check_directory(self, directory_path):
+        pool = self.image_pool
         try:
-            # List all files in the directory
-            files = [f for f in os.listdir(directory_path) if os.path.isfile(os.path.join(directory_path, f))]
-            return files
-        except Exception as e:
-            logging.error(f"Error accessing directory {directory_path}: {e}")
-            return []
+            return pool.submit(task, *args).result()
+        except BrokenProcessPool:
+            # A worker died, ie. killed for running out of memory. Replace the pool so the next file can run.
+            logging.error(f"Image worker pool broke running {task.__name__}. Restarting it.")
+            with self.image_pool_lock:
+                if self.image_pool is pool:
+                    self.image_pool = self.create_image_pool()
+            raise
+
+
+    def shutdown(self):
+        self.context.shutdown(wait=False)
+        if self.image_pool is not None:
+            self.image_pool.shutdown(wait=True)
+
+
+    def prefetch_context(self, file_names):
+        """
+        Starts loading the Notion context for Hopper files about to be processed. Reprints, duplicates and names
+        without a job ID are left out, they don't use it.
+        Args:
+            file_names (list): File names in the Hopper.
+        """
+
+        job_ids = []
+        for file_name in file_names:
+            name_info = parse_filename(file_name)
+            if name_info.job_id and name_info.extension and not (name_info.reprint or name_info.duplicate):
+                job_ids.append(name_info.job_id)
+
+        if job_ids:
+            self.context.prefetch(job_ids)
 
 
     def get_image_info(self, image_path):
         print(f"Getting image info for {image_path}.")
         try:
-            image = self.open_image(image_path)
-            size = image.size
-            dpi = image.info.get('dpi')
+            image_info = probe_image(image_path) # Reads only the header, pixels are decoded later if needed.
+            size = image_info.size
+            dpi = image_info.dpi
         except Exception as e:
             logging.error(f"Error getting image info: {e}")
             return None, -1
         return size, dpi
     
     
-    def adjust_dpi_and_move(self, image, hotfolder, file_name, job_id):
+    def adjust_dpi_and_move(self, file_path, hotfolder, file_name, job_id):
         """
         Adjusts the DPI of the given image to 150 and moves it to the specified hotfolder.
         Parameters:
-        image (PIL.Image.Image): The image to be processed.
+        file_path (str): The path of the image to be processed.
         hotfolder (str): The name of the hotfolder where the image will be moved.
         file_name (str): The name of the file to be saved.
         job_id (str): The job identifier associated with the image.
@@ -147,30 +259,22 @@ class HotfolderHandler():
         """
               
         logging.info(f"Adjusting DPI to 150 and moving to {hotfolder}.")
-        new_path = f"{self.HOTFOLDER_PATH}/{hotfolder}/{file_name}"
-        if os.path.exists(new_path):
-            logging.info(f"File {file_name} already exists in {hotfolder}. Removing old file.")
-            self.remove_file(new_path)
-            time.sleep(5) # Wait for Caldera to recognize the file is gone.        
-        image.save(new_path, dpi=(150, 150)) # Force saves the image to 150 DPI. Doesn't actually do anything to the image, just changes the EXIF data
-        self.copy_image(job_id, f"{self.HOTFOLDER_PATH}/tmp/{file_name}", new_path)
+        try:
+            self.save_image(PreflightImageOps.set_dpi, file_path, hotfolder, file_name) # Only changes the DPI metadata.
+        except Exception as e:
+            logging.error(f"Error saving image: {e}")
+            self.report_error(job_id, f"Error saving image: {e}", self.STOP_JOB_ERROR)
     
     
-    def resize_image(self, image, hotfolder, image_file_name, target_xpix, target_ypix, original_size, job_id, existing_job_log):
+    def resize_image(self, file_path, hotfolder, image_file_name, target_xpix, target_ypix, original_size, job_id, existing_job_log):
         try:
             logging.info(f"Resizing image to {target_xpix},{target_ypix} and moving to {hotfolder}.")
-            scale_factor_width = target_xpix / original_size[0]
-            scale_factor_height = target_ypix / original_size[1]
-            scale_factor = max(scale_factor_width, scale_factor_height)       
-            
+            scale_factor = max(target_xpix / original_size[0], target_ypix / original_size[1])
             logging.info(f"Scaling image by {scale_factor}.")
-            scaled_image = image.resize(
-                (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor)), Image.LANCZOS
-                ) # Resize image to target size
 
-            # Crop the image and save it to the hotfolder.
-            self.crop_and_move(
-                scaled_image, hotfolder, image_file_name, target_xpix, target_ypix, job_id, existing_job_log
+            # Scale, crop and save the image to the hotfolder in the image pool.
+            self.save_image(
+                PreflightImageOps.resize_and_crop, file_path, hotfolder, image_file_name, target_xpix, target_ypix
                 )
 
         except Exception as e:
@@ -188,31 +292,13 @@ class HotfolderHandler():
         pass
 
 
-    def crop_and_move(self, image, hotfolder, file_name, target_xpix, target_ypix, job_id, job_log):
-        print(f"Checking if image needs to be cropped.")
+    def crop_and_move(self, file_path, hotfolder, file_name, target_xpix, target_ypix, job_id, job_log):
+        print(f"Cropping image to {target_xpix},{target_ypix} if needed.")
         try:
-            icc_profile = image.info.get('icc_profile') if 'icc_profile' in image.info else None
-            
-            left = (image.size[0] - target_xpix) / 2
-            top = (image.size[1] - target_ypix) / 2
-            right = (image.size[0] + target_xpix) / 2
-            bottom = (image.size[1] + target_ypix) / 2
-            
-            if left == 0 and top == 0 and right == image.size[0] and bottom == image.size[1]:
-                logging.info(f"Image does not need to be cropped. Saving to {hotfolder}.")
-                self.save_image(job_id, image, f"{self.HOTFOLDER_PATH}/{hotfolder}/{file_name}", icc_profile)
-                self.copy_image(
-                    job_id, f"{self.HOTFOLDER_PATH}/tmp/{file_name}", f"{self.HOTFOLDER_PATH}/{hotfolder}/{file_name}"
-                    )
-                
-            else:
-                logging.info(f"Image needs to be cropped. Cropping to {target_xpix},{target_ypix}.")
-                cropped_image = image.crop((int(left), int(top), int(right), int(bottom)))
-                new_path = f"{self.HOTFOLDER_PATH}/{hotfolder}/{file_name}"
-                
-                self.save_image(job_id, cropped_image, new_path, icc_profile)
-                logging.info(f"Corrected {file_name} image to {target_xpix},{target_ypix} and moved to {hotfolder}.")
-                self.copy_image(job_id, f"{self.HOTFOLDER_PATH}/tmp/{file_name}", new_path)
+            self.save_image(
+                PreflightImageOps.crop_to_target, file_path, hotfolder, file_name, target_xpix, target_ypix
+                )
+            logging.info(f"Corrected {file_name} image to {target_xpix},{target_ypix} and moved to {hotfolder}.")
                 
         except Exception as e:
             
@@ -239,34 +325,18 @@ class HotfolderHandler():
         pass
 
 
-    def save_image(self, job_id, image, path, icc_profile = None):
-        if os.path.exists(path):
-                    logging.info(f"File already exists in {path}. Removing old file.")
-                    self.remove_file(path)
-                    time.sleep(5)
-        try:
-            if icc_profile:
-                image.save(path, dpi=(150, 150), icc_profile=icc_profile)
-            else:
-                image.save(path, dpi=(150, 150))
-                
-            logging.info(f"Image saved to {path}.")
-            time.sleep(1)
-        except Exception as e:
-            logging.error(f"Error saving image: {e}")
-            self.report_error(job_id, f"Error saving image: {e}", self.STOP_JOB_ERROR)
-        pass
-    
-    
-    def copy_image(self, job_id, new_path, current_path):
-        try:
-            logging.info(f"Copying image to {new_path}.")
-            time.sleep(2)
-            shutil.copy(current_path, new_path)
-        except Exception as e:
-            logging.error(f"Error copying image: {e}")
-            self.report_error(job_id, f"Error copying image: {e}", self.STOP_JOB_ERROR)
-        pass
+    def save_image(self, task, file_path, hotfolder, file_name, *args):
+        """
+        Runs a PreflightImageOps task that encodes the image once and writes it to the hotfolder and to Hotfolders/tmp
+        together. Each copy is written under a temp name and renamed into place, replacing any older file of the same
+        name, so Caldera never picks up a partial file. Errors from the task are raised to the caller, which reports
+        them.
+        """
+
+        dst_paths = [f"{self.HOTFOLDER_PATH}/{hotfolder}/{file_name}", f"{self.HOTFOLDER_PATH}/tmp/{file_name}"]
+        result = self.run_image_task(task, file_path, dst_paths, *args)
+        logging.info(f"Image saved to {dst_paths}.")
+        return result
 
 
     # Report error to Notion and log file. Report_error will handle writing all errors to the log file.
@@ -418,9 +488,6 @@ class HotfolderHandler():
             blank_to_email_conf = json.load(file)
             
         blank_to_email_conf['to_email'] = customer_email_list # Add customer email to config.
-        
-        with open(self.TEMP_CONFIG_PATH, 'w') as temp_file:
-            json.dump(blank_to_email_conf, temp_file, indent=4) # Write to temp config file.
 
         subject = f"Order Cancelation Notice: {order_number}"
         body = f"""
@@ -434,42 +501,31 @@ class HotfolderHandler():
 
         If you have any questions, please contact customer support at ondemand@menoenterprises.com.
         """
-        self.automated_emails.send_email(self.TEMP_CONFIG_PATH, subject, body)
+        with self.email_lock: # The temp config file is shared, one cancelation email at a time.
+            with open(self.TEMP_CONFIG_PATH, 'w') as temp_file:
+                json.dump(blank_to_email_conf, temp_file, indent=4) # Write to temp config file.
+            self.automated_emails.send_email(self.TEMP_CONFIG_PATH, subject, body)
         logging.info(f"Cancelation email sent to {customer_email_list}.")
 
         # Record canceled order in file
-        with open(self.CANCELED_ORDER_PATH, 'a') as file:
-            file.write(f"{order_id}\n")
-        self.canceled_orders.append(order_id)
+        self.canceled_orders.add(order_id)
         
         logging.info(f"Order {order_id} has been canceled. SKU: {sku}")
         pass
 
 
-    def open_image(self, image_path):
-        try:
-            image = Image.open(image_path)
-        except Exception as e:
-            logging.error(f"Error opening image: {e}")
-            return None
-        return image
-
-
     def process_new_file(self, file_path):
         # Log the file path
         logging.info(f"Processing new file: {file_path}")
         
-        if ".~#~" in file_path:  
-            print(f"File {file_path} is a temporary file. Waiting.")
-            old_path = file_path
-            file_path = file_path.replace(".~#~", "")
-            time.sleep(1)
-            
-            if os.path.exists(file_path) == False: # Loops until the file is finished copying.
-                self.process_new_file(old_path)
-                return None
+        if ".~#~" in file_path: # Still copying. The watcher reports the file once it is renamed.
+            logging.info(f"File {file_path} is a temporary file. Skipping.")
+            return None
             
-        if "(1)" in file_path:
+        file_name = os.path.basename(file_path)
+        name_info = parse_filename(file_name) # Job ID, extension, reprint and duplicate flags in one pass.
+
+        if name_info.duplicate:
             logging.info(f"File {file_path} is a duplicate. Removing.")
             self.remove_file(file_path)
             return None
@@ -477,37 +533,23 @@ class HotfolderHandler():
         allow_alter = 0
         now = time.strftime('%Y-%m-%d %H:%M:%S')
         print(f"{now} - Processing file: {file_path}")
-        file_name = os.path.basename(file_path)
 
-        try:
-            job_id = re.search(self.DATABASE_REGEX, file_name, re.IGNORECASE).group(1)
-            print(f"Job ID: {job_id}")
-            extension = re.search(self.EXTENSION_REGEX, file_name, re.IGNORECASE).group(2)
-            print(f"Extension: {extension}")
-
-            # Check if database ID is present in file name
-            if job_id == None: 
-                logging.error(f"Could not find database ID in {file_name}. Skipping.")
-                return None
-
-            # Check if file is an image
-            if extension is None or extension.lower() not in self.ACCEPTED_EXTENSIONS: 
-                logging.info(f"File {file_name} is not an accepted image type. Skipping.")
-                self.report_error(job_id, f"{now} - File {file_name} is not an accepted image type. Skipping.", self.STOP_JOB_ERROR)
-                return None
-            
-        except AttributeError:
+        job_id = name_info.job_id
+        extension = name_info.extension
+        if job_id is None or extension is None:
             logging.error(f"Could not find database ID or image extension in {file_name}. Skipping.")
-            return None        
-       
+            return None
+        print(f"Job ID: {job_id}")
+        print(f"Extension: {extension}")
+
+        # Check if file is an image
+        if extension.lower() not in self.ACCEPTED_EXTENSIONS: 
+            logging.info(f"File {file_name} is not an accepted image type. Skipping.")
+            self.report_error(job_id, f"{now} - File {file_name} is not an accepted image type. Skipping.", self.STOP_JOB_ERROR)
+            return None
         
         # Check if file is a reprint, sends it straight to a hotfolder.
-        try:  
-            reprint_match = re.search(self.REPRINT_REGEX, file_name, re.IGNORECASE).group(1)
-        except AttributeError:
-            reprint_match = None
-        
-        if reprint_match:
+        if name_info.reprint:
             logging.info(f"File {file_name} is a reprint. Pushing to hotfolder.")
             reprint_output = self.notion_helper.get_page(job_id)
             job_log = ""
@@ -531,7 +573,7 @@ class HotfolderHandler():
         
         # Get job information from Notion
         print("Querying Notion API for job information...")
-        job_output = self.notion_helper.get_page(job_id) 
+        job_output = self.context.get_job(job_id)
 
         job_log = ""
         try:
@@ -556,13 +598,13 @@ class HotfolderHandler():
             self.remove_file(file_path)
             return None
 
-        if order_number in self.canceled_orders:
+        if order_id in self.canceled_orders: # Recorded by page ID, not the order number.
             logging.info(f"Order {order_number} has been canceled. Skipping.")
             self.remove_file(file_path)
             return
         
         print(f"Getting customer ID.")
-        customer_id_response = self.notion_helper.get_page_property(order_id, r"iegJ")
+        customer_id_response = self.context.get_order_customer(order_id)
         try:
             customer_id = customer_id_response['results'][0]['relation']['id']
         except Exception as e:
@@ -572,7 +614,7 @@ class HotfolderHandler():
             return None
         
         print(f"Getting customer preflight information.")
-        customer_preflight_approval = self.notion_helper.get_page_property(customer_id, r"I%3E%7Cy")
+        customer_preflight_approval = self.context.get_customer_preflight(customer_id)
         
         try:
             customer_preflight_approval = customer_preflight_approval['select']['name']
@@ -585,7 +627,7 @@ class HotfolderHandler():
             self.remove_file(file_path)
             return None
 
-        product_output = self.notion_helper.get_page(product_id) # Get product information from Notion
+        product_output = self.context.get_product(product_id) # Get product information from Notion
 
         try:    # @Aria: Assign product variables here.
             xpix = product_output['properties']['xpix']['number']
@@ -614,20 +656,17 @@ class HotfolderHandler():
             self.remove_file(file_path)
             return None
         
-        # Determine which aspect ratio is closer to target aspect ratio.
-        if abs(xpix - size[0]) + abs(ypix - size[1]) > abs(xpix - size[1]) + abs(ypix - size[0]): 
-            xpix, ypix = ypix, xpix     # Swap xpix and ypix to match rotation. Removes needing to account for rotation probably.
-        image_aspect = size[0] / size[1]
-        target_aspect = xpix / ypix
+        plan = plan_preflight(size, dpi, xpix, ypix, allow_alter)
+        xpix, ypix = plan.xpix, plan.ypix # Turned to match the image's orientation.
 
-        logging.info(f"Image size: {size} at {dpi} DPI, AR: {image_aspect}. Target size: {xpix},{ypix} at 150 DPI, AR: {target_aspect}.")
+        logging.info(f"Image size: {size} at {dpi} DPI, AR: {plan.image_aspect}. Target size: {xpix},{ypix} at 150 DPI, AR: {plan.target_aspect}. Action: {plan.action}.")
 
         # Check if image aspect ratio is within 5% of target aspect ratio. If not, trash the file and report the error.
-        if image_aspect <= target_aspect * 0.95 or image_aspect >= target_aspect * 1.05: 
+        if plan.reason == 'aspect_ratio': 
             logging.info(f"Image aspect ratio is outside acceptable fixable range.")
             self.report_error(job_id, f"{job_log}{now} - Image aspect ratio is outside acceptable fixable range.", 3)
             
-            if allow_alter == 2:
+            if plan.action == 'cancel':
                 order_id = job_output['properties']['Order']['relation'][0]['id']
                 reason_canceled = f"Image aspect ratio is outside fixable range."
                 self.cancel_order(order_id, sku, reason_canceled, image_source)
@@ -635,37 +674,30 @@ class HotfolderHandler():
             self.remove_file(file_path)
             return None
         
-        # Check if image size matches target size within 38 pixels (1/4 inch) at 150 DPI. 
-        if((xpix - 38 <= size[0] <= xpix + 38 and ypix - 38 <= size[1] <= ypix + 38) or 
-            (xpix - 38 <= size[1] <= xpix + 38 and ypix - 38 <= size[0] <= ypix + 38)): 
-            
-            if(dpi != (150, 150)): # Correct Size, but DPI is wrong. Adjust DPI and move to hotfolder.
-                logging.info(f"Image size matches target size, but DPI does not. Adjusting DPI to 150 and moving to {hotfolder}.")
-                image = self.open_image(file_path)
-                self.adjust_dpi_and_move(image, hotfolder, file_name, job_id)
-                self.report_error(job_id, f"{job_log}{now} - Image DPI {dpi} does not match target DPI. Adjusting to 150 DPI and moving to hotfolder.", 1)            
-                self.remove_file(file_path) # Remove original file
-                return None
+        if plan.action == 'dpi_fix': # Correct Size, but DPI is wrong. Adjust DPI and move to hotfolder.
+            logging.info(f"Image size matches target size, but DPI does not. Adjusting DPI to 150 and moving to {hotfolder}.")
+            self.adjust_dpi_and_move(file_path, hotfolder, file_name, job_id)
+            self.report_error(job_id, f"{job_log}{now} - Image DPI {dpi} does not match target DPI. Adjusting to 150 DPI and moving to hotfolder.", 1)            
+            self.remove_file(file_path) # Remove original file
+            return None
             
-            else: # Image is correct size and DPI
-                logging.info(f"Image size and DPI match target size. Moving to {hotfolder}.")
-                self.move_to_hotfolder(hotfolder, file_name)
-                return None
+        elif plan.action == 'move': # Image is correct size and DPI
+            logging.info(f"Image size and DPI match target size. Moving to {hotfolder}.")
+            self.move_to_hotfolder(hotfolder, file_name)
+            return None
             
-        elif(allow_alter == 1): # Image size does not match target size. Resize and move to hotfolder.
+        elif plan.action == 'resize': # Image size does not match target size. Resize and move to hotfolder.
             logging.info(f"Image size does not match target size. Resizing and moving to {hotfolder}.")
-            image = self.open_image(file_path)
-            self.resize_image(image, hotfolder, file_name, xpix, ypix, size, job_id, job_log)
+            self.resize_image(file_path, hotfolder, file_name, xpix, ypix, size, job_id, job_log)
             self.report_error(job_id,
                               f"{job_log}{now} - Image size {size} does not match target size ({xpix},{ypix})."+
                               "Customer is on approved preflight list, resizing.", 2)
             self.remove_file(file_path) # Remove original file
             return None
         
-        elif(allow_alter == 3): # Image size does not match target size. Crop and move to hotfolder.
+        elif plan.action == 'crop': # Image size does not match target size. Crop and move to hotfolder.
             logging.info(f"Image size does not match target size. Cropping and moving to {hotfolder}.")
-            image = self.open_image(file_path)
-            self.crop_and_move(image, hotfolder, file_name, xpix, ypix, job_id, job_log)
+            self.crop_and_move(file_path, hotfolder, file_name, xpix, ypix, job_id, job_log)
             self.report_error(job_id, f"{job_log}{now} - Image size {size} does not match target size ({xpix},{ypix})."+
                               "Customer on the let it run list, cropping.", -1)
             self.remove_file(file_path) # Remove original file
@@ -686,8 +718,39 @@ class HotfolderHandler():
             return None
         
 
+def load_preflight_conf(conf_path = PREFLIGHT_CONF_PATH):
+    """
+    Loads the preflight conf file. Missing keys fall back to PREFLIGHT_CONF_DEFAULTS.
+    Returns:
+        dict: The preflight settings.
+    """
+
+    conf = dict(PREFLIGHT_CONF_DEFAULTS)
+    if os.path.exists(conf_path):
+        try:
+            with open(conf_path, 'r') as file:
+                conf.update(json.load(file))
+        except Exception as e:
+            logging.error(f"Error loading {conf_path}, using defaults: {e}")
+
+    conf['notion_workers'] = max(1, int(conf['notion_workers']))
+    conf['image_workers'] = max(0, int(conf['image_workers']))
+    return conf
+
+
 if __name__ == "__main__":
-    EVENT_HANDLER = HotfolderHandler()
+    PREFLIGHT_CONF = load_preflight_conf()
+    notion_workers, image_workers = PREFLIGHT_CONF['notion_workers'], PREFLIGHT_CONF['image_workers']
+    EVENT_HANDLER = HotfolderHandler(
+        image_workers, PREFLIGHT_CONF['stream_pixels'], PREFLIGHT_CONF['memory_budget_mb'], notion_workers,
+        load_color_settings(PREFLIGHT_CONF['color'])
+        )
+    CLAIMS = FileClaims(f"{EVENT_HANDLER.HOTFOLDER_PATH}/Preflight_Claims")
+    PIPELINE = PreflightPipeline(EVENT_HANDLER, PATH, CLAIMS, notion_workers)
+    WATCHER = create_watcher(
+        PATH, PREFLIGHT_CONF['watcher'], PREFLIGHT_CONF['settle_seconds'], PREFLIGHT_CONF['rescan_seconds']
+        )
+    backlog = [] # Ready files waiting for a free worker.
 
     gc.enable()
     
@@ -697,16 +760,15 @@ if __name__ == "__main__":
     cronitor.api_key = cronitor_api_key
     MONITOR = cronitor.Monitor("MOD Preflight Script")
     MONITOR.ping(state='run')
-    logging.info(f"Monitoring directory: {PATH}")
+    logging.info(f"Monitoring directory: {PATH} with {notion_workers} workers, {image_workers} image processes.")
     tick = 0
  
     try:
         while True:
             tick += 1
-            file_list = EVENT_HANDLER.check_directory(PATH)
+            file_list = backlog + WATCHER.ready()
             if file_list:
-                if file_list[0] != "Thumbs.db":
-                    EVENT_HANDLER.process_new_file(f"{PATH}/{file_list[0]}")
+                backlog = PIPELINE.submit(file_list)
             
             time.sleep(1)
             
@@ -730,4 +792,9 @@ if __name__ == "__main__":
 
     except Exception as e:
         logging.error(f"Critical Error: {e}")
-        MONITOR.ping(state='fail')
\ No newline at end of file
+        MONITOR.ping(state='fail')
+
+    finally:
+        WATCHER.stop()
+        PIPELINE.shutdown(wait=True) # Let files already being processed finish.
+        EVENT_HANDLER.shutdown()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''
+Shared filename parsing for the preflight and Caldera scripts.
+
+Hopper and rip file names carry the Notion page ID of their job or reprint, ie.
+    PR--JOB-1234_1-1_SKU_0123456789abcdef0123456789abcdef__1.jpg
+    PR--REP-1234_1-1_SKU_0123456789abcdef0123456789abcdef__1.jpg
+
+parse_filename() reads everything preflight needs from a name at once with string methods, giving the same results as
+the regular expressions CheckImageThenHotfolder.py used:
+    job_id: DATABASE_REGEX, the text between the last "_" before the last "__" and that "__".
+    extension: EXTENSION_REGEX, the extension if it is jpg, jpeg or png (any case), otherwise None.
+    reprint: REPRINT_REGEX, "--REP-" (any case) followed by digits and "_".
+    duplicate: "(1)" is in the name, a second copy made by Windows.
+
+parse_rip_id() is CalderaPullPush's ID_REGEX, precompiled. Caldera returns the same rip files every poll, so its results
+are cached.
+
+FilenameParser_Benchmark.py compares both with the regular expressions they replace.
+
+Classes:
+    FilenameInfo: The parsed fields of a name, a slotted record.
+Functions:
+    parse_filename(file_name): Returns a FilenameInfo.
+    parse_rip_id(file_name): Returns the page ID in a rip file name, or None.
+'''
+
+import re
+from functools import lru_cache
+
+DATABASE_REGEX = re.compile(r".*_(.*)__\d*", re.IGNORECASE)
+EXTENSION_REGEX = re.compile(r"(.+)\.(jpg|jpeg|png)$", re.IGNORECASE)
+REPRINT_REGEX = re.compile(r".*--(REP)-\d*_.*", re.IGNORECASE)
+ID_REGEX = re.compile(r'^.*_(\w*)__\d*\.')
+
+IMAGE_EXTENSIONS = frozenset(('jpg', 'jpeg', 'png'))
+DUPLICATE_MARKER = "(1)"
+RIP_ID_CACHE_SIZE = 8192
+
+
+class FilenameInfo:
+    __slots__ = ('name', 'job_id', 'extension', 'reprint', 'duplicate')
+
+    def __init__(self, name, job_id, extension, reprint, duplicate):
+        self.name = name
+        self.job_id = job_id
+        self.extension = extension
+        self.reprint = reprint
+        self.duplicate = duplicate
+
+    def __repr__(self):
+        return (f"FilenameInfo(name={self.name!r}, job_id={self.job_id!r}, extension={self.extension!r}, "
+                f"reprint={self.reprint}, duplicate={self.duplicate})")
+
+
+def parse_filename(file_name):
+    """
+    Parses a Hopper file name.
+    Args:
+        file_name (str): The file name, without its directory.
+    Returns:
+        FilenameInfo: job_id and extension are None when the name doesn't have them.
+    """
+
+    # DATABASE_REGEX: the greedy ".*_" takes the last "_" that still has a "__" after it, and "(.*)" runs to the
+    # last "__".
+    job_id = None
+    end = file_name.rfind("__")
+    if end > 0:
+        start = file_name.rfind("_", 0, end)
+        if start >= 0:
+            job_id = file_name[start + 1:end]
+
+    head, dot, extension = file_name.rpartition(".")
+    if not head or extension.lower() not in IMAGE_EXTENSIONS:
+        extension = None
+
+    return FilenameInfo(file_name, job_id, extension, _is_reprint(file_name), DUPLICATE_MARKER in file_name)
+
+
+def _is_reprint(file_name):
+    lowered = file_name.lower()
+    position = lowered.find("--rep-")
+
+    while position >= 0:
+        index = position + 6
+        while index < len(lowered) and lowered[index].isdecimal(): # Same as \d
+            index += 1
+        if index < len(lowered) and lowered[index] == "_":
+            return True
+        position = lowered.find("--rep-", position + 1)
+
+    return False
+
+
+@lru_cache(maxsize=RIP_ID_CACHE_SIZE)
+def parse_rip_id(file_name):
+    """
+    Gets the page ID from a Caldera rip file name.
+    Returns:
+        str or None: The ID, or None if the name doesn't match ID_REGEX.
+    """
+
+    if file_name is None:
+        return None
+
+    match = ID_REGEX.search(file_name)
+    return match.group(1) if match else None
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+'''
+Microbenchmark for FilenameParser.py.
+
+Builds a corpus of file names shaped like the Hopper and rip file names (jobs, reprints, Windows duplicates, other
+extensions, and names with extra underscores), then times:
+    preflight_regex: The three re.search() calls with string patterns that process_new_file() made for each file.
+    parse_filename: FilenameParser.parse_filename().
+    caldera_regex: re.search() with CalderaPullPush's ID_REGEX string, once per rip file.
+    parse_rip_id: FilenameParser.parse_rip_id().
+The rip ID methods run over the first --rip-files names --polls times, as Caldera returns the same rip files every poll.
+Before timing, every name is parsed both ways and the results compared, and the script exits with status 1 if any
+differ.
+
+Usage (from the repository root):
+    python src/FilenameParser_Benchmark.py
+    python src/FilenameParser_Benchmark.py --names 100000 --repeat 5 --rip-files 2000 --polls 50
+'''
+
+import argparse, random, re, sys, time, uuid
+
+import FilenameParser
+
+DATABASE_REGEX = r".*_(.*)__\d*"
+EXTENSION_REGEX = r"(.+)\.(jpg|jpeg|png)$"
+REPRINT_REGEX = r".*--(REP)-\d*_.*"
+ID_REGEX = r'^.*_(\w*)__\d*\.'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark filename parsing against the regular expressions.")
+    parser.add_argument('--names', type=int, default=100000, help="File names in the corpus.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per method, the fastest is reported.")
+    parser.add_argument('--rip-files', type=int, default=5000, help="Names the rip ID methods are run over.")
+    parser.add_argument('--polls', type=int, default=20, help="Passes over the rip files for the rip ID methods.")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def make_corpus(count, seed):
+    rng = random.Random(seed)
+    extensions = ['jpg', 'jpg', 'jpg', 'png', 'jpeg', 'JPG', 'PNG', 'tif', 'pdf']
+
+    names = []
+    for index in range(count):
+        page_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        kind = rng.choice(('JOB', 'JOB', 'JOB', 'REP', 'rep'))
+        sku = rng.choice(('SKU', 'MUG_11OZ', 'TEE-BLK_L', 'CANVAS'))
+        name = f"PR--{kind}-{rng.randint(1, 99999)}_{rng.randint(1, 9)}-{rng.randint(1, 9)}_{sku}_{page_id}__1"
+        name += f".{rng.choice(extensions)}"
+
+        roll = rng.random()
+        if roll < 0.03:
+            name = name.replace("__1.", "__1 (1).")
+        elif roll < 0.05:
+            name = name.replace("__", "_") # No job ID.
+        elif roll < 0.06:
+            name = f"__{name}_x__2.jpg"
+        names.append(name)
+
+    return names
+
+
+def preflight_regex(file_name):
+    job_id = re.search(DATABASE_REGEX, file_name, re.IGNORECASE)
+    extension = re.search(EXTENSION_REGEX, file_name, re.IGNORECASE)
+    reprint = re.search(REPRINT_REGEX, file_name, re.IGNORECASE)
+    return (job_id and job_id.group(1), extension and extension.group(2), bool(reprint), "(1)" in file_name)
+
+
+def parse_filename(file_name):
+    info = FilenameParser.parse_filename(file_name)
+    return (info.job_id, info.extension, info.reprint, info.duplicate)
+
+
+def caldera_regex(file_name):
+    match = re.search(ID_REGEX, file_name)
+    return match.group(1) if match else None
+
+
+def verify(names):
+    failures = 0
+    for name in names:
+        if preflight_regex(name) != parse_filename(name) or caldera_regex(name) != FilenameParser.parse_rip_id(name):
+            failures += 1
+            if failures <= 10:
+                print(f"Mismatch: {name!r}: {preflight_regex(name)} != {parse_filename(name)} or "
+                      f"{caldera_regex(name)!r} != {FilenameParser.parse_rip_id(name)!r}")
+    return failures
+
+
+def best_time(function, names, repeat, passes = 1):
+    times = []
+    for _ in range(repeat):
+        FilenameParser.parse_rip_id.cache_clear()
+        re.purge() # The string pattern methods start from an empty re module cache, as after a restart.
+        start = time.perf_counter()
+        for _ in range(passes):
+            for name in names:
+                function(name)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    args = parse_args()
+    names = make_corpus(args.names, args.seed)
+
+    failures = verify(names)
+    if failures:
+        print(f"{failures} of {len(names)} names parsed differently.")
+        sys.exit(1)
+    print(f"All {len(names)} names parse the same as the regular expressions.")
+    rip_files = names[:args.rip_files]
+
+    results = [
+        ('preflight_regex', best_time(preflight_regex, names, args.repeat), len(names)),
+        ('parse_filename', best_time(FilenameParser.parse_filename, names, args.repeat), len(names)),
+        ('caldera_regex', best_time(caldera_regex, rip_files, args.repeat, args.polls), len(rip_files) * args.polls),
+        ('parse_rip_id', best_time(FilenameParser.parse_rip_id, rip_files, args.repeat, args.polls),
+         len(rip_files) * args.polls),
+        ]
+
+    print(f"{'method':<16} {'names':>9} {'seconds':>8} {'ns per name':>12}")
+    for method, seconds, parsed in results:
+        print(f"{method:<16} {parsed:>9} {seconds:>8.3f} {seconds / parsed * 1e9:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+'''
+Hopper watchers for CheckImageThenHotfolder.py.
+
+A watcher reports files in the Hopper once they have finished copying, so the preflight pipeline never opens a half
+written image. Two backends share the same debounce logic:
+
+    InotifyWatcher: Uses watchdog's native observer (inotify on Linux) and only looks at files that had events. Local
+        change notifications don't see writes made by other machines to an SMB share, so this is for local paths.
+    PollingWatcher: Lists the directory with os.scandir(), which returns each entry's type without a stat call per
+        file on Windows. Works everywhere, including network shares.
+
+A file is ready when either:
+    - It appeared under its final name after its ".~#~" temp copy was seen, ie. the copy finished with a rename.
+    - Its size and mtime have not changed for settle_seconds.
+Files whose names contain ".~#~" are never reported. Each file is reported once; it is reported again only if it is
+deleted and comes back, or when a full rescan runs (every rescan_seconds) and it is still there. The rescan catches
+events missed by the observer and files skipped earlier, and the pipeline ignores files it is already working on.
+
+Functions:
+    create_watcher(path, backend, settle_seconds, rescan_seconds): Returns a watcher for the path. backend is "auto",
+        "inotify" or "polling". "auto" picks inotify on Linux for local paths when watchdog is installed.
+'''
+
+import os, sys, time, threading, logging
+from abc import ABC, abstractmethod
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+TEMP_MARKER = ".~#~"
+SETTLE_SECONDS = 2
+RESCAN_SECONDS = 60
+
+
+class HopperWatcher(ABC):
+    """
+    Abstract base class holding the debounce state. Subclasses feed it observations through _observe() and _forget().
+    Args:
+        path (str): The Hopper directory.
+        settle_seconds (float): How long a file's size and mtime must hold still before it is ready.
+        rescan_seconds (float): How often to list the whole directory and report every ready file again.
+    """
+
+    def __init__(self, path, settle_seconds = SETTLE_SECONDS, rescan_seconds = RESCAN_SECONDS):
+        self.path = path
+        self.settle_seconds = settle_seconds
+        self.rescan_seconds = rescan_seconds
+        self.lock = threading.Lock()
+        self.pending = {}       # name -> ((size, mtime), first time seen with that size and mtime)
+        self.reported = set()
+        self.renamed = set()    # Final names of temp files that have been seen.
+        self.last_rescan = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    @abstractmethod
+    def ready(self):
+        """
+        Returns the names of files that have finished copying and haven't been reported yet.
+        """
+
+    def _observe(self, name, size, mtime, now):
+        if TEMP_MARKER in name:
+            self.renamed.add(name.replace(TEMP_MARKER, ""))
+            return
+
+        if name in self.reported:
+            return
+
+        signature = (size, mtime)
+        seen = self.pending.get(name)
+
+        if seen is None or seen[0] != signature:
+            self.pending[name] = (signature, now)
+
+    def _forget(self, name):
+        self.pending.pop(name, None)
+        self.reported.discard(name)
+
+    def _collect(self, now):
+        ready = []
+
+        for name, (signature, since) in list(self.pending.items()):
+            if name in self.renamed or now - since >= self.settle_seconds:
+                del self.pending[name]
+                self.renamed.discard(name)
+                self.reported.add(name)
+                ready.append(name)
+
+        return ready
+
+    def _scan(self):
+        """
+        Lists the directory, yielding (name, size, mtime) for each file.
+        """
+
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            yield entry.name, stat.st_size, stat.st_mtime
+                    except OSError: # Removed while listing.
+                        continue
+        except OSError as e:
+            logging.error(f"Error accessing directory {self.path}: {e}")
+
+    def _rescan_due(self, now):
+        if now - self.last_rescan < self.rescan_seconds:
+            return False
+        self.last_rescan = now
+        return True
+
+
+class PollingWatcher(HopperWatcher):
+    def ready(self):
+        now = time.monotonic()
+
+        with self.lock:
+            if self._rescan_due(now):
+                self.reported.clear()
+
+            entries = list(self._scan())
+            present = {name for name, size, mtime in entries}
+            self.renamed &= present # Temp names still present are added back by _observe().
+
+            for name, size, mtime in entries:
+                self._observe(name, size, mtime, now)
+
+            for name in (set(self.pending) | self.reported) - present:
+                self._forget(name)
+
+            return self._collect(now)
+
+
+class _HopperEventHandler(FileSystemEventHandler):
+    IGNORED_EVENTS = ('opened', 'closed_no_write') # Reading a file doesn't change it.
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type in self.IGNORED_EVENTS:
+            return
+
+        with self.watcher.lock:
+            if event.event_type == 'deleted':
+                self.watcher._forget(os.path.basename(event.src_path))
+                return
+
+            if event.event_type == 'moved':
+                self.watcher._forget(os.path.basename(event.src_path))
+                self.watcher.dirty.add(os.path.basename(event.dest_path))
+                return
+
+            self.watcher.dirty.add(os.path.basename(event.src_path))
+
+
+class InotifyWatcher(HopperWatcher):
+    def __init__(self, path, settle_seconds = SETTLE_SECONDS, rescan_seconds = RESCAN_SECONDS):
+        if not WATCHDOG_AVAILABLE:
+            raise ImportError("InotifyWatcher requires watchdog. pip install watchdog")
+
+        super().__init__(path, settle_seconds, rescan_seconds)
+        self.dirty = set() # Names with events since the last ready() call.
+        self.observer = None
+
+    def start(self):
+        self.observer = Observer()
+        self.observer.schedule(_HopperEventHandler(self), self.path, recursive=False)
+        self.observer.start()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def ready(self):
+        now = time.monotonic()
+
+        with self.lock:
+            if self._rescan_due(now):
+                self.reported.clear()
+                for name, size, mtime in self._scan():
+                    self._observe(name, size, mtime, now)
+
+            # Only files with events, or still settling, are looked at.
+            for name in self.dirty | set(self.pending):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    self._forget(name)
+                    continue
+
+                if name in self.dirty:
+                    self.reported.discard(name) # Written to again after it was reported.
+                self._observe(name, stat.st_size, stat.st_mtime, now)
+
+            self.dirty.clear()
+            return self._collect(now)
+
+
+def is_network_path(path):
+    return path.startswith('\\\\') or path.startswith('//')
+
+
+def create_watcher(path, backend = 'auto', settle_seconds = SETTLE_SECONDS, rescan_seconds = RESCAN_SECONDS):
+    """
+    Creates and starts a Hopper watcher.
+    Args:
+        path (str): The Hopper directory.
+        backend (str): "inotify", "polling" or "auto".
+        settle_seconds (float): How long a file must hold still before it is ready.
+        rescan_seconds (float): How often to report every ready file again.
+    Returns:
+        HopperWatcher: The started watcher.
+    """
+
+    if backend == 'auto':
+        use_inotify = WATCHDOG_AVAILABLE and sys.platform.startswith('linux') and not is_network_path(path)
+        backend = 'inotify' if use_inotify else 'polling'
+
+    if backend == 'inotify':
+        watcher = InotifyWatcher(path, settle_seconds, rescan_seconds)
+    elif backend == 'polling':
+        watcher = PollingWatcher(path, settle_seconds, rescan_seconds)
+    else:
+        raise ValueError(f"Unknown watcher backend: {backend}")
+
+    watcher.start()
+    logging.info(f"Watching {path} with {type(watcher).__name__}.")
+    return watcher
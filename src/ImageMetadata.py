@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+'''
+Metadata only DPI rewrites for PreflightImageOps.set_dpi().
+
+Changing an image's DPI with Pillow decodes and re-encodes every pixel, which is slow for large images and costs JPEG
+quality. These functions patch the resolution fields in the encoded bytes instead and copy everything else unchanged,
+so they run in milliseconds no matter how large the image is.
+
+    JPEG: The JFIF APP0 density is set to 150x150 inches, and the EXIF XResolution, YResolution and ResolutionUnit
+        are set to match when present. The EXIF Orientation is set to 1, so the image shows as its pixels are stored,
+        the same as after a re-encode, which drops EXIF. A JPEG with no JFIF segment gets one inserted after SOI, which is where Pillow
+        writes it. JPEGs with an Adobe APP14 segment, or with other than 1 or 3 components, are left to the re-encode
+        path, since adding JFIF to them can change how decoders read their color space.
+    PNG: The pHYs chunk is rewritten, or inserted after IHDR, with its CRC. Pillow writes the same values. PNGs with
+        an eXIf chunk are left to the re-encode path, which drops it along with any orientation it holds.
+
+Everything else, ICC profiles and the rest of EXIF included, is kept.
+
+Functions:
+    can_patch(header): Returns whether the image starting with these bytes is a format set_dpi_bytes() handles.
+    set_dpi_bytes(data, dpi): Returns the image bytes with the new DPI, or None if the format isn't supported.
+'''
+
+import struct, zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+TAG_X_RESOLUTION = 282
+TAG_Y_RESOLUTION = 283
+TAG_RESOLUTION_UNIT = 296
+TAG_ORIENTATION = 274
+
+
+class MetadataError(Exception):
+    pass
+
+
+def can_patch(header):
+    return header[:3] == b"\xff\xd8\xff" or header[:8] == PNG_SIGNATURE
+
+
+def set_dpi_bytes(data, dpi = (150, 150)):
+    """
+    Rewrites the resolution metadata of an encoded JPEG or PNG.
+    Args:
+        data (bytes): The encoded image.
+        dpi (tuple): The new (x, y) DPI, whole numbers.
+    Returns:
+        bytes or None: The patched image, or None if it isn't a JPEG or PNG this can patch.
+    """
+
+    try:
+        if data[:3] == b"\xff\xd8\xff":
+            return _set_jpeg_dpi(data, dpi)
+        if data[:8] == PNG_SIGNATURE:
+            return _set_png_dpi(data, dpi)
+    except (MetadataError, struct.error, IndexError):
+        return None
+    return None
+
+
+def _jfif_segment(dpi):
+    # APP0, length 16, "JFIF\0", version 1.01, units 1 (inches), densities, no thumbnail.
+    return b"\xff\xe0" + struct.pack(">H5sBBBHHBB", 16, b"JFIF\x00", 1, 1, 1, int(dpi[0]), int(dpi[1]), 0, 0)
+
+
+def _set_jpeg_dpi(data, dpi):
+    data = bytearray(data)
+    position = 2
+    jfif_offset = None
+    components = None
+    adobe = False
+    exif_offsets = []
+
+    while True:
+        if data[position] != 0xFF:
+            raise MetadataError("Expected JPEG marker")
+        while data[position] == 0xFF: # Fill bytes
+            position += 1
+        marker = data[position]
+        position += 1
+
+        if marker == 0xDA or marker == 0xD9: # Start of scan, the headers are done.
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01: # No length field.
+            continue
+
+        length = struct.unpack(">H", data[position:position + 2])[0]
+        segment = position + 2
+        if length < 2 or position + length > len(data):
+            raise MetadataError("Bad JPEG segment length")
+
+        if marker == 0xE0 and data[segment:segment + 5] == b"JFIF\x00" and length >= 14 and jfif_offset is None:
+            jfif_offset = segment
+        elif marker == 0xE1 and data[segment:segment + 6] == b"Exif\x00\x00":
+            exif_offsets.append((segment + 6, position + length))
+        elif marker == 0xEE and data[segment:segment + 5] == b"Adobe":
+            adobe = True
+        elif marker in JPEG_SOF_MARKERS:
+            components = data[segment + 5]
+
+        position += length
+
+    if components is None:
+        raise MetadataError("No JPEG frame header")
+
+    for start, end in exif_offsets:
+        _set_exif_dpi(data, start, end, dpi)
+
+    if jfif_offset is not None:
+        struct.pack_into(">BHH", data, jfif_offset + 7, 1, int(dpi[0]), int(dpi[1]))
+        return bytes(data)
+
+    if adobe or components not in (1, 3):
+        raise MetadataError("Adding JFIF could change this JPEG's color space")
+
+    return bytes(data[:2]) + _jfif_segment(dpi) + bytes(data[2:])
+
+
+def _set_exif_dpi(data, start, end, dpi):
+    """
+    Patches the resolution tags of an EXIF block's first IFD in place, and resets its orientation to 1. Tags that aren't
+    there aren't added, and a malformed block is left alone.
+    """
+
+    try:
+        byte_order = bytes(data[start:start + 4])
+        if byte_order == b"II*\x00":
+            endian = "<"
+        elif byte_order == b"MM\x00*":
+            endian = ">"
+        else:
+            return
+
+        ifd = start + struct.unpack_from(endian + "I", data, start + 4)[0]
+        count = struct.unpack_from(endian + "H", data, ifd)[0]
+        if ifd + 2 + count * 12 > end:
+            return
+
+        for index in range(count):
+            entry = ifd + 2 + index * 12
+            tag, field_type, value_count = struct.unpack_from(endian + "HHI", data, entry)
+
+            if tag in (TAG_X_RESOLUTION, TAG_Y_RESOLUTION) and field_type == 5 and value_count == 1:
+                value = start + struct.unpack_from(endian + "I", data, entry + 8)[0]
+                if value + 8 <= end:
+                    struct.pack_into(endian + "II", data, value, int(dpi[0 if tag == TAG_X_RESOLUTION else 1]), 1)
+
+            elif tag == TAG_RESOLUTION_UNIT and field_type == 3:
+                struct.pack_into(endian + "H", data, entry + 8, 2) # Inches
+
+            elif tag == TAG_ORIENTATION and field_type == 3:
+                struct.pack_into(endian + "H", data, entry + 8, 1) # Top left, as stored.
+    except struct.error:
+        return
+
+
+def _png_chunk(chunk_type, body):
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def _set_png_dpi(data, dpi):
+    # Pillow writes pixels per meter rounded to the nearest whole number.
+    phys = _png_chunk(b"pHYs", struct.pack(">IIB", int(dpi[0] / 0.0254 + 0.5), int(dpi[1] / 0.0254 + 0.5), 1))
+    position = 8
+    after_ihdr = None
+    phys_chunk = None
+
+    while position + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[position:position + 8])
+        chunk_end = position + 12 + length
+        if chunk_end > len(data):
+            raise MetadataError("Truncated PNG chunk")
+
+        if chunk_type == b"IHDR":
+            after_ihdr = chunk_end
+        elif chunk_type == b"pHYs":
+            phys_chunk = (position, chunk_end)
+        elif chunk_type == b"eXIf":
+            raise MetadataError("PNG EXIF can hold an orientation")
+        elif chunk_type in (b"IDAT", b"IEND"):
+            break
+
+        position = chunk_end
+
+    if after_ihdr is None:
+        raise MetadataError("PNG has no IHDR")
+    if phys_chunk is not None:
+        return data[:phys_chunk[0]] + phys + data[phys_chunk[1]:]
+
+    return data[:after_ihdr] + phys + data[after_ihdr:]
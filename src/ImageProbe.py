@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+'''
+Header only image probing for CheckImageThenHotfolder.py.
+
+probe_image() reads just the bytes needed for an image's format, pixel size, DPI and whether it has an embedded ICC
+profile, instead of having Pillow parse the file. JPEG markers, PNG chunks and the first TIFF IFD are walked with
+seeks, so over SMB only a few small reads are made no matter how large the image is. Pixel data is never read.
+
+DPI follows Pillow's rules so the preflight checks behave the same as with Image.open().info['dpi']:
+    JPEG: The JFIF density if its unit is inches (1) or centimeters (2, converted). Otherwise the EXIF XResolution
+        and ResolutionUnit, or (72, 72) when the EXIF has no usable resolution. None if there is neither.
+    PNG: The pHYs chunk if its unit is meters, converted to DPI. Otherwise None.
+    TIFF: XResolution/YResolution (default 1) when ResolutionUnit is inches, centimeters (converted) or missing.
+Images larger than twice Image.MAX_IMAGE_PIXELS raise Image.DecompressionBombError, the same as Image.open().
+
+Results are memoized per (path, size, mtime), so repeated probes of an unchanged file don't touch the disk beyond the
+stat. Any other format, or a header that can't be parsed, falls back to Pillow.
+
+Functions:
+    probe_image(path): Returns an ImageInfo for the image.
+    clear_cache(): Empties the memo.
+'''
+
+import os, struct, threading
+from collections import OrderedDict, namedtuple
+from PIL import Image
+
+ImageInfo = namedtuple('ImageInfo', ['format', 'size', 'dpi', 'has_icc'])
+
+CACHE_SIZE = 512
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_X_RESOLUTION = 282
+TAG_Y_RESOLUTION = 283
+TAG_RESOLUTION_UNIT = 296
+TAG_ICC_PROFILE = 34675
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class HeaderError(Exception):
+    pass
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def probe_image(path):
+    """
+    Gets an image's format, size, DPI and ICC presence from its header.
+    Args:
+        path (str): The image path.
+    Returns:
+        ImageInfo: A namedtuple of format (str), size (tuple), dpi (tuple or None) and has_icc (bool).
+    Raises:
+        OSError: If the file can't be read or isn't an image.
+        Image.DecompressionBombError: If the image is over the pixel limit.
+    """
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    try:
+        with open(path, 'rb') as file:
+            info = _probe_header(file)
+    except (HeaderError, struct.error, IndexError, ValueError, ZeroDivisionError):
+        info = None
+
+    if info is None:
+        info = _probe_with_pillow(path)
+
+    _check_pixel_limit(info.size)
+
+    with _cache_lock:
+        _cache[key] = info
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return info
+
+
+def _check_pixel_limit(size):
+    if Image.MAX_IMAGE_PIXELS and size[0] * size[1] > 2 * Image.MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"Image size ({size[0] * size[1]} pixels) exceeds limit of {2 * Image.MAX_IMAGE_PIXELS} pixels, could be "
+            "decompression bomb DOS attack."
+            )
+
+
+def _probe_with_pillow(path):
+    with Image.open(path) as image:
+        return ImageInfo(image.format, image.size, image.info.get('dpi'), bool(image.info.get('icc_profile')))
+
+
+def _probe_header(file):
+    start = file.read(8)
+
+    if start[:3] == b"\xff\xd8\xff":
+        return _probe_jpeg(file)
+    if start == PNG_SIGNATURE:
+        return _probe_png(file)
+    if start[:4] in (b"II*\x00", b"MM\x00*"):
+        return _probe_tiff(file, start)
+    return None
+
+
+def _read_exact(file, length):
+    data = file.read(length)
+    if len(data) != length:
+        raise HeaderError("Truncated header")
+    return data
+
+
+def _probe_jpeg(file):
+    file.seek(2)
+    size = None
+    jfif_dpi = None
+    exif = None
+    has_icc = False
+
+    while True:
+        byte = _read_exact(file, 1)
+        if byte != b"\xff":
+            raise HeaderError("Expected JPEG marker")
+
+        marker = _read_exact(file, 1)[0]
+        while marker == 0xFF: # Fill bytes
+            marker = _read_exact(file, 1)[0]
+
+        if marker == 0xDA or marker == 0xD9: # Start of scan, the headers are done.
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01: # No length field.
+            continue
+
+        length = struct.unpack(">H", _read_exact(file, 2))[0] - 2
+        if length < 0:
+            raise HeaderError("Bad JPEG segment length")
+
+        if marker == 0xE0 or marker == 0xE1 or marker == 0xE2 or marker in JPEG_SOF_MARKERS:
+            segment = _read_exact(file, length)
+        else:
+            file.seek(length, os.SEEK_CUR)
+            continue
+
+        if marker in JPEG_SOF_MARKERS:
+            size = struct.unpack(">H", segment[3:5])[0], struct.unpack(">H", segment[1:3])[0]
+
+        elif marker == 0xE0 and segment.startswith(b"JFIF") and len(segment) >= 12:
+            unit = segment[7]
+            density = struct.unpack(">HH", segment[8:12])
+            if unit == 1:
+                jfif_dpi = density
+            elif unit == 2: # 1 dpcm = 2.54 dpi
+                jfif_dpi = tuple(d * 2.54 for d in density)
+
+        elif marker == 0xE1 and segment.startswith(b"Exif\x00\x00") and exif is None:
+            exif = segment[6:]
+
+        elif marker == 0xE2 and segment.startswith(b"ICC_PROFILE\x00"):
+            has_icc = True
+
+    if size is None:
+        raise HeaderError("No JPEG frame header")
+
+    dpi = jfif_dpi
+    if dpi is None and exif is not None:
+        dpi = _exif_dpi(exif)
+
+    return ImageInfo('JPEG', size, dpi, has_icc)
+
+
+def _exif_dpi(exif):
+    try:
+        tags = _read_ifd(lambda offset, length: exif[offset:offset + length], exif[:4])
+        unit = tags[TAG_RESOLUTION_UNIT]
+        dpi = tags[TAG_X_RESOLUTION]
+        if dpi != dpi: # NaN
+            raise ValueError
+        if unit == 3: # 1 dpcm = 2.54 dpi
+            dpi *= 2.54
+        return dpi, dpi
+    except (HeaderError, KeyError, struct.error, ValueError, ZeroDivisionError, IndexError):
+        return 72, 72
+
+
+def _probe_png(file):
+    length, chunk_type = struct.unpack(">I4s", _read_exact(file, 8))
+    if chunk_type != b"IHDR":
+        raise HeaderError("PNG doesn't start with IHDR")
+
+    size = struct.unpack(">II", _read_exact(file, 8))
+    file.seek(length - 8 + 4, os.SEEK_CUR) # Rest of IHDR and its CRC
+    dpi = None
+    has_icc = False
+
+    while True:
+        length, chunk_type = struct.unpack(">I4s", _read_exact(file, 8))
+
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+
+        if chunk_type == b"pHYs":
+            segment = _read_exact(file, length)
+            if length < 9:
+                raise HeaderError("Truncated pHYs chunk")
+            px, py = struct.unpack(">II", segment[:8])
+            if segment[8] == 1: # meter
+                dpi = px * 0.0254, py * 0.0254
+            file.seek(4, os.SEEK_CUR)
+            continue
+
+        if chunk_type == b"iCCP":
+            has_icc = True
+
+        file.seek(length + 4, os.SEEK_CUR)
+
+    return ImageInfo('PNG', size, dpi, has_icc)
+
+
+def _probe_tiff(file, start):
+    def read_at(offset, length):
+        file.seek(offset)
+        return file.read(length)
+
+    tags = _read_ifd(read_at, start[:4], wanted=(
+        TAG_IMAGE_WIDTH, TAG_IMAGE_LENGTH, TAG_X_RESOLUTION, TAG_Y_RESOLUTION, TAG_RESOLUTION_UNIT, TAG_ICC_PROFILE
+        ))
+
+    size = tags[TAG_IMAGE_WIDTH], tags[TAG_IMAGE_LENGTH]
+    xres = tags.get(TAG_X_RESOLUTION, 1)
+    yres = tags.get(TAG_Y_RESOLUTION, 1)
+    unit = tags.get(TAG_RESOLUTION_UNIT)
+    dpi = None
+
+    if xres and yres:
+        if unit == 2 or unit is None:
+            dpi = (xres, yres)
+        elif unit == 3: # 1 dpcm = 2.54 dpi
+            dpi = (xres * 2.54, yres * 2.54)
+
+    return ImageInfo('TIFF', size, dpi, TAG_ICC_PROFILE in tags)
+
+
+def _read_ifd(read_at, byte_order, wanted = (TAG_X_RESOLUTION, TAG_RESOLUTION_UNIT)):
+    """
+    Reads the first IFD of a TIFF structure (a TIFF file or an EXIF block).
+    Args:
+        read_at (function): Returns length bytes from an offset of the TIFF structure.
+        byte_order (bytes): The TIFF header's first four bytes.
+        wanted (tuple): Tags to return. SHORT, LONG and RATIONAL tags return their first value, others return True.
+    Returns:
+        dict: tag -> value for the wanted tags that are present.
+    """
+
+    if byte_order == b"II*\x00":
+        endian = "<"
+    elif byte_order == b"MM\x00*":
+        endian = ">"
+    else:
+        raise HeaderError("Not a TIFF structure")
+
+    offset = struct.unpack(endian + "I", read_at(4, 4))[0]
+    count = struct.unpack(endian + "H", read_at(offset, 2))[0]
+    entries = read_at(offset + 2, count * 12)
+    if len(entries) != count * 12:
+        raise HeaderError("Truncated IFD")
+
+    tags = {}
+    for index in range(count):
+        tag, field_type, value_count = struct.unpack(endian + "HHI", entries[index * 12:index * 12 + 8])
+        if tag not in wanted:
+            continue
+
+        if field_type not in (3, 4, 5):
+            tags[tag] = True # Only its presence is needed, ie. the ICC profile.
+            continue
+
+        value = entries[index * 12 + 8:index * 12 + 12]
+        if TIFF_TYPE_SIZES[field_type] * value_count > 4:
+            value = read_at(struct.unpack(endian + "I", value)[0], TIFF_TYPE_SIZES[field_type])
+
+        if field_type == 3: # SHORT
+            tags[tag] = struct.unpack(endian + "H", value[:2])[0]
+        elif field_type == 4: # LONG
+            tags[tag] = struct.unpack(endian + "I", value[:4])[0]
+        elif field_type == 5: # RATIONAL
+            numerator, denominator = struct.unpack(endian + "II", value[:8])
+            tags[tag] = numerator / denominator if denominator else float('nan')
+
+    return tags
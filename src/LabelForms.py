@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+'''
+PDF Form XObjects for the assets repeated across nest labels.
+
+A job with a quantity of 20 gets 20 labels with the same thumbnail, QR codes and logos. FormRegistry draws each unique
+asset once into a Form XObject (canvas.beginForm/endForm) and places it on each label with canvas.doForm, so the PDF
+holds one copy of each asset and every later label costs a single "Do" operator instead of the asset's drawing
+operations.
+
+Classes:
+    FormRegistry: Draws assets through forms, keyed by what they show.
+'''
+
+
+class FormRegistry:
+    """
+    Args:
+        c (Canvas): The ReportLab canvas the forms belong to.
+        prefix (str): The start of the form names.
+    """
+
+    def __init__(self, c, prefix = 'LabelAsset'):
+        self.c = c
+        self.prefix = prefix
+        self.names = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def draw(self, key, x, y, width, height, draw_asset):
+        """
+        Places an asset with its bottom left corner at (x, y), registering it as a form the first time its key is seen.
+        Args:
+            key (hashable): Identifies the asset. Assets with the same key must look the same.
+            x (float): The x-coordinate on the page.
+            y (float): The y-coordinate on the page.
+            width (float): The asset's width, the form's bounding box.
+            height (float): The asset's height.
+            draw_asset (callable): Called with the canvas to draw the asset at (0, 0), only when it isn't registered yet.
+        """
+
+        name = self.names.get(key)
+        if name is None:
+            name = f"{self.prefix}{len(self.names)}"
+            self.c.beginForm(name, 0, 0, width, height)
+            draw_asset(self.c)
+            self.c.endForm()
+            self.names[key] = name
+
+        self.c.saveState()
+        self.c.translate(x, y)
+        self.c.doForm(name)
+        self.c.restoreState()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+'''
+Vector QR codes for MOD_Generate_Nest_Labels.py.
+
+QR codes are drawn on the label canvas as one filled ReportLab path built straight from the QR module matrix. This
+replaces saving each code as an SVG and parsing it back with svglib for every label. Dark modules are merged into
+rectangles: first into runs along each row, then runs at the same columns in consecutive rows into one taller
+rectangle. A Notion link code (37x37 modules) is drawn as about 300 rectangles instead of about 700 squares.
+
+LabelQRCode_Benchmark.py compares this with the SVG round trip on a 500 label nest.
+
+Classes:
+    QRCode: A QR code ready to draw, its module rectangles and colors.
+Functions:
+    make_qr_code(qr_value, fill_color, back_color): Encodes a value and merges its modules into rectangles.
+    merge_modules(matrix): Returns the rectangles covering the dark modules of a QR matrix.
+    draw_qr_code(c, qr_code, x, y, max_width, max_height): Draws a QR code on a ReportLab canvas.
+'''
+
+import qrcode
+from collections import namedtuple
+
+QR_VERSION = 3
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_M
+
+QRCode = namedtuple('QRCode', ['value', 'size', 'rects', 'fill_color', 'back_color'])
+
+
+def make_qr_code(qr_value, fill_color = 'black', back_color = 'white'):
+    """
+    Args:
+        qr_value (str): The value to encode.
+        fill_color (str): The color of the dark modules.
+        back_color (str or None): The color behind the code, None for none.
+    Returns:
+        QRCode: size is the modules per side. The code has no quiet zone, as the label leaves space around it.
+    """
+
+    qr = qrcode.QRCode(version=QR_VERSION, error_correction=QR_ERROR_CORRECTION, border=0)
+    qr.add_data(qr_value)
+    qr.make(fit=True)
+
+    matrix = qr.get_matrix()
+    return QRCode(qr_value, len(matrix), merge_modules(matrix), fill_color, back_color)
+
+
+def merge_modules(matrix):
+    """
+    Args:
+        matrix (list): Rows of booleans, True for dark modules.
+    Returns:
+        tuple: (row, column, width, height) rectangles in modules, row 0 at the top.
+    """
+
+    rects = []
+    open_rects = {} # (column, width) -> index in rects of the rectangle reaching the previous row.
+
+    for row_index, row in enumerate(matrix):
+        runs = {}
+        column = 0
+        while column < len(row):
+            if row[column]:
+                start = column
+                while column < len(row) and row[column]:
+                    column += 1
+                runs[(start, column - start)] = None
+            else:
+                column += 1
+
+        next_open = {}
+        for run in runs:
+            if run in open_rects:
+                index = open_rects[run]
+                rects[index] = rects[index][:3] + (rects[index][3] + 1,)
+            else:
+                index = len(rects)
+                rects.append((row_index, run[0], run[1], 1))
+            next_open[run] = index
+        open_rects = next_open
+
+    return tuple(rects)
+
+
+def draw_qr_code(c, qr_code, x, y, max_width, max_height):
+    """
+    Draws a QR code as a vector path, scaled to fit max_width and max_height.
+    Args:
+        c (Canvas): The ReportLab canvas.
+        qr_code (QRCode): From make_qr_code().
+        x (float): The x-coordinate of the code's bottom left corner.
+        y (float): The y-coordinate of the code's bottom left corner.
+        max_width (float): The most width the code can take.
+        max_height (float): The most height the code can take.
+    """
+
+    module = min(max_width, max_height) / qr_code.size
+    side = module * qr_code.size
+    top = y + side
+
+    c.saveState()
+    if qr_code.back_color:
+        c.setFillColor(qr_code.back_color)
+        c.rect(x, y, side, side, stroke=0, fill=1)
+
+    c.setFillColor(qr_code.fill_color)
+    path = c.beginPath()
+    for row, column, width, height in qr_code.rects:
+        path.rect(x + column * module, top - (row + height) * module, width * module, height * module)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark for LabelQRCode.py.
+
+Lays out the two QR codes of every label in a nest of --labels labels over --pages job pages, the way
+MOD_Generate_Nest_Labels.py does: codes are generated once per page and drawn once per label. Times:
+    svg: qrcode's SvgImage saved to a BytesIO per page, copied, parsed with svglib and drawn with renderPDF per label,
+        as generate_qr_code() and draw_svg_on_canvas() did. Needs svglib, and is skipped without it.
+    vector: LabelQRCode.make_qr_code() per page and draw_qr_code() per label.
+and prints the generate, draw and PDF save times and the PDF size for each. svglib takes over a tenth of a second per code,
+so the svg method runs for a few minutes at the defaults. Before timing, the rectangles of every code are checked
+against its QR matrix, and the script exits with status 1 if any differ.
+
+Usage (from the repository root):
+    python src/LabelQRCode_Benchmark.py
+    python src/LabelQRCode_Benchmark.py --labels 100 --pages 20 --repeat 3
+'''
+
+import argparse, random, sys, time, uuid
+from io import BytesIO
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+import qrcode, qrcode.image.svg
+import LabelQRCode
+
+try:
+    from svglib.svglib import svg2rlg
+    from reportlab.graphics import renderPDF
+    SVGLIB_AVAILABLE = True
+except ImportError:
+    SVGLIB_AVAILABLE = False
+
+QR_SIZE = 57 # points, QR_CODE_MAX_SIZE in MOD_Generate_Nest_Labels.py
+LABELS_PER_PAGE = 10
+LABEL_WIDTH = 288
+LABEL_HEIGHT = 144
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark vector QR codes against the SVG round trip.")
+    parser.add_argument('--labels', type=int, default=500, help="Labels in the nest.")
+    parser.add_argument('--pages', type=int, default=60, help="Job and reprint pages the labels are spread over.")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per method, the fastest is reported.")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def make_pages(count, seed):
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        page_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        order_title = f"#{rng.randint(100000, 999999)}-{rng.choice(('SHOP', 'ETSY', 'AMZ'))}"
+        pages.append((f'https://www.notion.so/menoenterprises/{page_id}', order_title))
+    return pages
+
+
+def label_positions(count):
+    for index in range(count):
+        slot = index % LABELS_PER_PAGE
+        yield index, 18 + (slot % 2) * LABEL_WIDTH, 36 + (slot // 2) * LABEL_HEIGHT
+
+
+def svg_generate(qr_value):
+    qr = qrcode.QRCode(version=3, error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=6, border=0)
+    qr.add_data(qr_value)
+    qr.make(fit=True)
+    qr_code_io = BytesIO()
+    qr.make_image(image_factory=qrcode.image.svg.SvgImage).save(qr_code_io)
+    return qr_code_io
+
+
+def svg_draw(c, qr_code, x, y):
+    qr_code_io = BytesIO(qr_code.getvalue())
+    drawing = svg2rlg(qr_code_io)
+    scale = min(QR_SIZE / drawing.width, QR_SIZE / drawing.height)
+    drawing.width *= scale
+    drawing.height *= scale
+    drawing.scale(scale, scale)
+    renderPDF.draw(drawing, c, x, y)
+
+
+def vector_generate(qr_value):
+    return LabelQRCode.make_qr_code(qr_value)
+
+
+def vector_draw(c, qr_code, x, y):
+    LabelQRCode.draw_qr_code(c, qr_code, x, y, QR_SIZE, QR_SIZE)
+
+
+def run(generate, draw, pages, labels):
+    start = time.perf_counter()
+    codes = [(generate(link), generate(order_title)) for link, order_title in pages]
+    generated = time.perf_counter()
+
+    pdf_io = BytesIO()
+    c = canvas.Canvas(pdf_io, pagesize=letter)
+    for index, x, y in label_positions(labels):
+        qr_code, shipstation_qr_code = codes[index * len(pages) // labels]
+        draw(c, qr_code, x + LABEL_WIDTH - QR_SIZE, y)
+        draw(c, shipstation_qr_code, x + 113, y)
+        if index % LABELS_PER_PAGE == LABELS_PER_PAGE - 1:
+            c.showPage()
+    drawn = time.perf_counter()
+    c.save()
+    saved = time.perf_counter()
+
+    return generated - start, drawn - generated, saved - drawn, len(pdf_io.getvalue())
+
+
+def verify(pages):
+    failures = 0
+    for value in (value for page in pages for value in page):
+        qr_code = LabelQRCode.make_qr_code(value)
+        grid = [[False] * qr_code.size for _ in range(qr_code.size)]
+        for row, column, width, height in qr_code.rects:
+            for module_row in range(row, row + height):
+                for module_column in range(column, column + width):
+                    if grid[module_row][module_column]:
+                        failures += 1 # Overlapping rectangles.
+                    grid[module_row][module_column] = True
+
+        qr = qrcode.QRCode(version=3, error_correction=qrcode.constants.ERROR_CORRECT_M, border=0)
+        qr.add_data(value)
+        qr.make(fit=True)
+        if grid != qr.get_matrix():
+            failures += 1
+            print(f"Mismatch: {value!r}")
+    return failures
+
+
+def main():
+    args = parse_args()
+    pages = make_pages(args.pages, args.seed)
+
+    failures = verify(pages)
+    if failures:
+        print(f"{failures} QR codes don't match their matrix.")
+        sys.exit(1)
+    print(f"All {len(pages) * 2} QR codes match their matrix.")
+
+    methods = [('vector', vector_generate, vector_draw)]
+    if SVGLIB_AVAILABLE:
+        methods.insert(0, ('svg', svg_generate, svg_draw))
+    else:
+        print("svglib isn't installed, skipping the svg method.")
+
+    print(f"{args.labels} labels over {args.pages} pages.")
+    print(f"{'method':<8} {'generate s':>10} {'draw s':>8} {'save s':>8} {'total s':>8} {'PDF KB':>8}")
+    for method, generate, draw in methods:
+        times = [run(generate, draw, pages, args.labels) for _ in range(args.repeat)]
+        generate_s, draw_s, save_s, size = min(times, key=lambda result: sum(result[:3]))
+        print(f"{method:<8} {generate_s:>10.3f} {draw_s:>8.3f} {save_s:>8.3f} "
+              f"{generate_s + draw_s + save_s:>8.3f} {size / 1024:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+'''
+Label thumbnails for MOD_Generate_Nest_Labels.py, and their on-disk cache.
+
+Thumbnails are kept in output/mod/label_thumbnails, one PNG per (Drive file ID, file version, thumbnail size), with the
+label size stored in the PNG. The version is the file's Drive md5Checksum, or its modifiedTime for files Drive has no
+checksum for, so replaced artwork is never served from the cache. Lookups touch the file's mtime, and once the folder
+is over max_bytes the least recently used thumbnails are removed.
+
+MOD_Recache_Artwork.py adds the thumbnail when it replaces artwork, so the next nest using it doesn't download it.
+Regenerated nests, reprints and repeat orders are served from the cache too.
+
+Artwork is often hundreds of MB, so on a cache miss MOD_Generate_Nest_Labels.py tries smaller sources first:
+    drive_thumbnail: Drive's own thumbnail of the file (its thumbnailLink), asked for at THUMBNAIL_SCALE times the
+        label size.
+    embedded_thumbnail: The EXIF or Photoshop thumbnail in a JPEG's header, read with a ranged download of the
+        first HEADER_BYTES. Only used if its aspect ratio is within ASPECT_TOLERANCE of the image's own, from the
+        frame header in the same bytes, since cameras often pad or crop their thumbnails to 4:3.
+    download: The whole file, decoded in JPEG draft mode at the smallest scale that still covers the thumbnail.
+Drive's and embedded thumbnails are only used if their long edge covers the label at THUMBNAIL_SCALE, MIN_SOURCE_EDGE
+pixels, so a thumbnail is never cached at less than the resolution a download would give it. Embedded thumbnails are
+usually 160 pixels, so they are only used for artwork whose header holds a larger one. Drive's thumbnail falls short
+when the image itself is small, and then downloading it costs little.
+
+Classes:
+    ThumbnailCache: The on-disk cache.
+Functions:
+    make_thumbnail(data, max_size): Returns the PNG bytes of a thumbnail and its size on the label.
+    file_version(metadata): Returns the cache version from a Drive file resource.
+    get_file_metadata(drive_service, file_id): Gets the Drive fields the thumbnail sources need.
+    drive_thumbnail_url(thumbnail_link, max_size): Returns a thumbnailLink resized for the label.
+    embedded_thumbnail(header): Returns the EXIF or Photoshop thumbnail in the first bytes of a JPEG, or None.
+    covers_label(data): Returns whether an image is large enough to make a label thumbnail from.
+'''
+
+import hashlib, logging, os, re, struct, threading
+from io import BytesIO
+from PIL import Image, ImageEnhance, ExifTags, PngImagePlugin
+
+from ImageMetadata import JPEG_SOF_MARKERS
+
+THUMBNAIL_MAX_SIZE = (110, 144) # pixels
+THUMBNAIL_SCALE = 3 # Thumbnails are saved at 3x their size on the label.
+VERSION_FIELDS = 'md5Checksum,modifiedTime'
+METADATA_FIELDS = f'{VERSION_FIELDS},mimeType,thumbnailLink'
+
+SOURCE_CACHE = 'cache'
+SOURCE_DRIVE = 'drive_thumbnail'
+SOURCE_EMBEDDED = 'embedded_thumbnail'
+SOURCE_DOWNLOAD = 'download'
+
+HEADER_BYTES = 128 * 1024 # EXIF is limited to 64 KB, and comes first in the header.
+MIN_SOURCE_EDGE = max(THUMBNAIL_MAX_SIZE) * THUMBNAIL_SCALE # pixels
+ASPECT_TOLERANCE = 0.01 # Largest relative difference between an embedded thumbnail's aspect ratio and the image's.
+THUMBNAIL_LINK_SIZE_REGEX = re.compile(r'=s\d+$')
+
+TAG_JPEG_OFFSET = 0x0201 # JPEGInterchangeFormat, in IFD1.
+TAG_JPEG_LENGTH = 0x0202 # JPEGInterchangeFormatLength
+PHOTOSHOP_THUMBNAIL_IDS = (0x040C, 0x0409) # Thumbnail resources, Photoshop 5+ and 4.
+PHOTOSHOP_THUMBNAIL_HEADER = 28
+
+CACHE_DIR = 'output/mod/label_thumbnails'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+SIZE_KEY = 'thumbnail_size' # PNG text chunk holding the label size, ie. "110x82".
+TEMP_SUFFIX = ".~#~"
+
+
+def make_thumbnail(data, max_size = THUMBNAIL_MAX_SIZE):
+    """
+    Args:
+        data (bytes): The artwork.
+        max_size (tuple): The largest (width, height) of the thumbnail on the label.
+    Returns:
+        tuple: (PNG bytes, (width, height) on the label).
+    """
+
+    with Image.open(BytesIO(data)) as image:
+        image_width, image_height = image.size
+        if image_height < image_width:
+            thumbnail_size = (max_size[0], int(image_height * (max_size[0] / image_width)))
+        else:
+            thumbnail_size = (int(image_width * (max_size[0] / image_width)), max_size[1])
+
+        # JPEGs decode at 1/2, 1/4 or 1/8 scale when that still covers the thumbnail, a fraction of the full decode.
+        image.draft(None, (thumbnail_size[0] * THUMBNAIL_SCALE, thumbnail_size[1] * THUMBNAIL_SCALE))
+        enhancer = ImageEnhance.Sharpness(image)
+        image = enhancer.enhance(2)
+
+        image.thumbnail((thumbnail_size[0] * THUMBNAIL_SCALE, thumbnail_size[1] * THUMBNAIL_SCALE), Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        info = PngImagePlugin.PngInfo()
+        info.add_text(SIZE_KEY, f"{thumbnail_size[0]}x{thumbnail_size[1]}")
+        image_io = BytesIO()
+        image.save(image_io, format='PNG', pnginfo=info)
+
+    return image_io.getvalue(), thumbnail_size
+
+
+def file_version(metadata):
+    return metadata.get('md5Checksum') or metadata.get('modifiedTime')
+
+
+def get_file_metadata(drive_service, file_id):
+    """
+    Returns:
+        dict: The file's METADATA_FIELDS, empty if Drive couldn't be asked.
+    """
+
+    try:
+        return drive_service.files().get(fileId=file_id, fields=METADATA_FIELDS).execute()
+    except Exception as e:
+        logging.warning(f"Couldn't get the metadata of Drive file {file_id}: {e}")
+        return {}
+
+
+def drive_thumbnail_url(thumbnail_link, max_size = THUMBNAIL_MAX_SIZE):
+    # thumbnailLink ends with "=s220", the long edge Drive scales its thumbnail to.
+    edge = max(max_size) * THUMBNAIL_SCALE
+    if THUMBNAIL_LINK_SIZE_REGEX.search(thumbnail_link):
+        return THUMBNAIL_LINK_SIZE_REGEX.sub(f"=s{edge}", thumbnail_link)
+    return f"{thumbnail_link}=s{edge}"
+
+
+def covers_label(data):
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return max(image.size) >= MIN_SOURCE_EDGE
+    except Exception:
+        return False
+
+
+def embedded_thumbnail(header):
+    """
+    Finds the thumbnail a camera or Photoshop embedded in a JPEG, if it has the same aspect ratio as the image.
+    Args:
+        header (bytes): The start of the file, at least up to its frame header, which follows the APP1 and APP13
+            segments.
+    Returns:
+        bytes or None: The thumbnail JPEG, or None if there isn't a complete one in the header with the image's shape.
+    """
+
+    thumbnails = []
+    frame_size = None
+    for marker, segment in _jpeg_segments(header):
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            thumbnails.append(_exif_thumbnail(segment))
+        elif marker == 0xED and segment.startswith(b"Photoshop 3.0\x00"):
+            thumbnails.append(_photoshop_thumbnail(segment))
+        elif marker in JPEG_SOF_MARKERS:
+            frame_size = _frame_size(segment)
+            break
+
+    if not frame_size:
+        return None
+
+    for thumbnail in thumbnails:
+        if thumbnail and _same_aspect(thumbnail, frame_size):
+            return thumbnail
+    return None
+
+
+def _jpeg_segments(header):
+    # Yields (marker, segment data) up to the start of scan, stopping early at the first segment that is cut off.
+    if header[:2] != b"\xff\xd8":
+        return
+
+    offset = 2
+    while offset + 4 <= len(header):
+        if header[offset] != 0xFF:
+            return
+        marker = header[offset + 1]
+        if marker in (0xDA, 0xD9): # Start of scan, no more metadata.
+            return
+        length = struct.unpack(">H", header[offset + 2:offset + 4])[0]
+        segment = header[offset + 4:offset + 2 + length]
+        if len(segment) < length - 2: # Cut off by the ranged download.
+            return
+
+        yield marker, segment
+        offset += 2 + length
+
+
+def _frame_size(segment):
+    # Precision, then height and width.
+    if len(segment) < 5:
+        return None
+    height, width = struct.unpack(">HH", segment[1:5])
+    return (width, height) if width and height else None # A height of 0 is set later by a DNL marker.
+
+
+def _same_aspect(thumbnail, frame_size):
+    try:
+        with Image.open(BytesIO(thumbnail)) as image:
+            width, height = image.size
+    except Exception:
+        return False
+
+    aspect = frame_size[0] / frame_size[1]
+    return abs(width / height - aspect) <= aspect * ASPECT_TOLERANCE
+
+
+def _exif_thumbnail(segment):
+    try:
+        exif = Image.Exif()
+        exif.load(segment)
+        ifd1 = exif.get_ifd(ExifTags.IFD.IFD1)
+    except Exception:
+        return None
+
+    start, length = ifd1.get(TAG_JPEG_OFFSET), ifd1.get(TAG_JPEG_LENGTH)
+    if not start or not length:
+        return None
+    thumbnail = segment[6 + start:6 + start + length] # Offsets are from the TIFF header, after "Exif\0\0".
+    return thumbnail if len(thumbnail) == length and thumbnail[:2] == b"\xff\xd8" else None
+
+
+def _photoshop_thumbnail(segment):
+    # Image resource blocks: "8BIM", ID, even padded Pascal name, size, even padded data.
+    offset = len(b"Photoshop 3.0\x00")
+    while offset + 12 <= len(segment) and segment[offset:offset + 4] == b"8BIM":
+        resource_id = struct.unpack(">H", segment[offset + 4:offset + 6])[0]
+        name_length = segment[offset + 6]
+        offset += 6 + name_length + 1 + (name_length + 1) % 2
+        if offset + 4 > len(segment):
+            return None
+        size = struct.unpack(">I", segment[offset:offset + 4])[0]
+        data = segment[offset + 4:offset + 4 + size]
+        offset += 4 + size + size % 2
+
+        if resource_id in PHOTOSHOP_THUMBNAIL_IDS and len(data) == size:
+            thumbnail = data[PHOTOSHOP_THUMBNAIL_HEADER:]
+            return thumbnail if thumbnail[:2] == b"\xff\xd8" else None # Photoshop 4 thumbnails are raw BGR.
+
+    return None
+
+
+class ThumbnailCache:
+    """
+    Args:
+        path (str): The cache folder. Created if missing.
+        max_bytes (int): The folder size thumbnails are evicted down to.
+    """
+
+    def __init__(self, path = CACHE_DIR, max_bytes = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file_path(self, file_id, version, max_size):
+        key = f"{file_id}:{version}:{max_size[0]}x{max_size[1]}:{THUMBNAIL_SCALE}"
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".png")
+
+    def get(self, file_id, version, max_size = THUMBNAIL_MAX_SIZE):
+        """
+        Returns:
+            tuple or None: (BytesIO of the PNG, (width, height) on the label), None on a miss.
+        """
+
+        if not version:
+            return None
+
+        file_path = self._file_path(file_id, version, max_size)
+        try:
+            with open(file_path, 'rb') as file:
+                data = file.read()
+            os.utime(file_path) # Most recently used.
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.error(f"Error reading cached thumbnail {file_path}: {e}")
+            return None
+
+        try:
+            with Image.open(BytesIO(data)) as image:
+                width, height = image.text[SIZE_KEY].split("x")
+        except Exception as e:
+            logging.error(f"Unreadable cached thumbnail {file_path}, ignoring it: {e}")
+            return None
+
+        logging.info(f"Thumbnail cache hit for {file_id}.")
+        return BytesIO(data), (int(width), int(height))
+
+    def put(self, file_id, version, png_bytes, max_size = THUMBNAIL_MAX_SIZE):
+        """
+        Saves a thumbnail from make_thumbnail(). Does nothing without a version.
+        """
+
+        if not version:
+            return
+
+        file_path = self._file_path(file_id, version, max_size)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}"
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(png_bytes)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            logging.error(f"Error caching thumbnail for {file_id}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used thumbnails until the folder is under max_bytes.
+        """
+
+        with self.lock:
+            entries = []
+            total = 0
+            with os.scandir(self.path) as scan:
+                for entry in scan:
+                    if not entry.name.endswith(".png"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError: # Evicted by another process.
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            removed = 0
+            for mtime, size, file_path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+                total -= size
+                removed += 1
+
+            logging.info(f"Evicted {removed} thumbnails from {self.path}.")
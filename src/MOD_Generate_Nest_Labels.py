@@ -7,7 +7,10 @@ It interacts with Notion API to fetch and update page information, and uses Repo
 Modules:
     - MOD_Generate_Nest_Labels_Logger: Custom logger for the script.
     - NotionApiHelper: Helper class for interacting with Notion API.
-    - svglib.svglib: Converts SVG files to ReportLab drawing objects.
+    - LabelThumbnails: Label thumbnails and their on-disk cache.
+    - LabelQRCode: QR codes drawn as ReportLab vector paths.
+    - LabelForms: PDF Form XObjects for the assets repeated across labels.
+    - NestLabelLayout: Label text layout with cached truncation and paragraphs.
     - PIL: Python Imaging Library for image processing.
     - io: Core tools for working with streams.
     - google.oauth2.service_account: Google OAuth2 service account credentials.
@@ -15,23 +18,17 @@ Modules:
     - googleapiclient.http: HTTP utilities for Google API client.
     - reportlab.lib.pagesizes: Page size definitions for ReportLab.
     - reportlab.lib.units: Unit definitions for ReportLab.
-    - reportlab.graphics: Graphics utilities for ReportLab.
     - reportlab.lib.utils: Utility functions for ReportLab.
-    - reportlab.lib.styles: Style definitions for ReportLab.
-    - reportlab.platypus: High-level layout and document generation for ReportLab.
     - reportlab.pdfgen: PDF generation utilities for ReportLab.
-    - reportlab.pdfbase: Base utilities for PDF generation in ReportLab.
     - math: Mathematical functions.
     - sys: System-specific parameters and functions.
     - logging: Logging utilities.
     - datetime: Basic date and time types.
     - json: JSON encoder and decoder.
-    - qrcode: QR code generation library.
     - re: Regular expression operations.
     - uuid: UUID generation library.
 Pip Dependencies:
     - Pillow
-    - svglib
     - google-auth
     - google-auth-oauthlib
     - google-auth-httplib2
@@ -49,15 +46,17 @@ Functions:
     - update_page_info(id, package): Updates page information in Notion.
     - update_nest_page_info(content_dict, label_dict, file_id): Updates the nest page information with the provided label URL and completion status.
     - process_nest_content(nest_id, jobs, reprints): Queries the jobs and reprints databases for their page content.
-    - generate_qr_code(qr_value, fill_color, back_color): Generates a QR code with the given value and returns it as an SVG image in a BytesIO object.
-    - generate_thumbnail(isid, page_id): Generates a thumbnail for the given internal storage ID and returns the image in memory and its height.
-    - save_image_to_memory(image, format, quality): Saves an image to memory.
+    - generate_qr_code(qr_value, fill_color, back_color): Generates a QR code with the given value, ready to draw on the labels.
+    - generate_thumbnail(isid, page_id): Returns the thumbnail for the given internal storage ID, from the thumbnail cache or the smallest source that covers the label, and caches it.
+    - get_thumbnail_source(isid, metadata): Returns the image a thumbnail is made from and which source served it.
+    - generate_thumbnails(thumbnail_requests): Generates the thumbnails for a nest concurrently, once per internal storage ID.
+    - get_drive_service(): Returns the Google Drive service for the current thread.
+    - get_drive_session(): Returns an authorized requests session for the current thread.
     - download_file_from_drive(file_id): Downloads a file from Google Drive.
+    - download_file_header(file_id, length): Downloads the first bytes of a file from Google Drive.
     - upload_file_to_drive(file_io, file_name, mime_type, folder_id): Uploads a file to Google Drive.
     - process_jobrep_content(content_dict): Processes job and reprint content from a given content dictionary and generates a list of label dictionaries.
-    - truncate_text(text, max_width, font_name, font_size): Truncates text to fit within a specified width.
-    - draw_svg_on_canvas(c, svg_io, x, y, max_width, max_height): Draws an SVG image on a ReportLab canvas with specified maximum width and height.
-    - draw_label(c, label, x, y, notion_logo, shipstation_logo): Draws a label on the given canvas at the specified coordinates.
+    - draw_label(c, label, x, y, notion_logo, shipstation_logo, forms, layout): Draws a label on the given canvas at the specified coordinates.
     - load_logo(logo_path): Loads a logo image from the given path.
     - generate_labels(label_dict): Generates a PDF containing labels based on the provided label dictionary.
     - main(): Main function that orchestrates the label generation process.
@@ -68,23 +67,25 @@ Usage:
 
 from MOD_Generate_Nest_Labels_Logger import logger
 from NotionApiHelper import NotionApiHelper
-from svglib.svglib import svg2rlg
-from PIL import Image, ImageEnhance
+import LabelThumbnails
+from LabelThumbnails import ThumbnailCache, make_thumbnail, THUMBNAIL_MAX_SIZE
+from LabelQRCode import make_qr_code, draw_qr_code
+from LabelForms import FormRegistry
+from NestLabelLayout import LabelLayout, truncate_text
+from PIL import Image
 from io import BytesIO
 from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
-from reportlab.graphics import renderPDF
 from reportlab.lib.utils import ImageReader
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Paragraph
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
 from math import floor
-import sys, logging, datetime, json, qrcode, re, uuid, subprocess
-import qrcode.image.svg
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import sys, logging, datetime, json, re, uuid, subprocess, threading
 
 
 notion = NotionApiHelper()
@@ -103,7 +104,10 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 gdrive_credentials = service_account.Credentials.from_service_account_file(
     SERVICE_ACCOUNT_FILE, scopes=SCOPES)
 
-drive_service = build('drive', 'v3', credentials=gdrive_credentials)
+# googleapiclient services share one httplib2 connection, which isn't thread safe, so each thread builds its own.
+drive_local = threading.local()
+
+thumbnail_cache = ThumbnailCache()
 
 LABEL_GEN_PACKAGE = {'Print Status': {'select': {'name': 'Label generating'}}, 'Regenerate Trigger': {'number': 0}}
 LABEL_CREATED_PACKAGE = {'Print Status': {'select': {'name': 'Label created'}}}
@@ -164,7 +168,8 @@ CENTER_DEVISOR = 5
 HEADER_PLACEMENT = (PAGE_LR_MARGIN, PAGE_HEIGHT - PAGE_TB_MARGIN + (PADDING*2))
 HEADER_FONT_SIZE = 20
 
-THUMBNAIL_MAX_SIZE = (110, 144) # pixels
+THUMBNAIL_WORKERS = 6 # Thumbnails downloaded and resized at once.
+THUMBNAIL_LINK_TIMEOUT = 30 # seconds
 THUMBNAIL_POS = (0, 0)
 
 QR_CODE_MAX_SIZE = (floor(LABEL_HEIGHT * (2/5)), floor(LABEL_HEIGHT * (2/5))) # pixels
@@ -183,6 +188,7 @@ SHIP_BY_ROW = (ROW_NEST[0] + ROW_NEST_MAX_WIDTH, QR_CODE_MAX_SIZE[1] + PADDING)
 PROD_DESCRIPTION = (THUMBNAIL_MAX_SIZE[0] + PADDING, ROW_NEST[1] + BOLD_FONT_SIZE + PADDING)
 PROD_DESCRIPTION_MAX_WIDTH = LABEL_WIDTH - THUMBNAIL_MAX_SIZE[0]
 PROD_DESCRIPTION_MAX_HEIGHT = 30 # pixels
+PROD_DESCRIPTION_LEADING = 11 # pt
 
 ORDER_NUMBER = (THUMBNAIL_MAX_SIZE[0] + PADDING, PROD_DESCRIPTION[1] + PROD_DESCRIPTION_MAX_HEIGHT + PADDING)
 ORDER_NUMBER_MAX_WIDTH = LABEL_WIDTH - THUMBNAIL_MAX_SIZE[0]
@@ -346,86 +352,104 @@ def process_nest_content(nest_id, jobs, reprints):
 
 def generate_qr_code(qr_value, fill_color = 'black', back_color = 'white'):
     """
-    Generates a QR code with the given value and returns it as an SVG image in a BytesIO object.
+    Generates a QR code with the given value, drawn on the labels by draw_qr_code().
     Args:
         qr_value (str): The value to encode in the QR code.
         fill_color (str, optional): The color of the QR code. Defaults to 'black'.
         back_color (str, optional): The background color of the QR code. Defaults to 'white'.
     Returns:
-        BytesIO: A BytesIO object containing the SVG image of the generated QR code.
+        QRCode: The QR code's module rectangles and colors.
     """
     
     logger.info(f"Generating QR code for {qr_value}")
     
-    qr = qrcode.QRCode(
-        version=3,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=6,
-        border=0,
-    )
-    
-    qr.add_data(qr_value)
-    qr.make(fit=True)
-    
-    factory = qrcode.image.svg.SvgImage
-    qr_code_io = BytesIO()
-    qr_code_image = qr.make_image(image_factory=factory, fill_color=fill_color, back_color=back_color)
-    qr_code_image.save(qr_code_io)
-    
-    return qr_code_io
+    return make_qr_code(qr_value, fill_color, back_color)
 
 
 def generate_thumbnail(isid, page_id): #isid:internal_storage_id
     """
-    Generates a thumbnail for the given internal storage ID (isid) and returns the image in memory and its height.
+    Gets the thumbnail for the given internal storage ID (isid) from the thumbnail cache. On a miss, generates it from
+    the smallest source that covers the label and caches it under the file's current Drive version.
     Args:
         isid (str): The internal storage ID of the file to generate a thumbnail for.
         page_id (str): The page ID associated with the thumbnail.
     Returns:
         tuple: A tuple containing:
             - image_io (BytesIO): The in-memory image file of the generated thumbnail.
-            - image_height (int): The height of the generated thumbnail image.
+            - thumbnail_size (tuple): The width and height of the thumbnail on the label.
+            - source (str): Which LabelThumbnails source served it, ie. "cache" or "drive_thumbnail".
     Raises:
         Exception: If there is an error in downloading the file, opening the image, or saving the image to memory.
     """
     
-    logger.info(f"Generating thumbnail for {isid}")
+    metadata = LabelThumbnails.get_file_metadata(get_drive_service(), isid)
+    version = LabelThumbnails.file_version(metadata)
+    cached = thumbnail_cache.get(isid, version, THUMBNAIL_MAX_SIZE)
+    if cached:
+        logger.info(f"Thumbnail for {isid} ({page_id}) from {LabelThumbnails.SOURCE_CACHE}.")
+        return (*cached, LabelThumbnails.SOURCE_CACHE)
     
-    source_fh = download_file_from_drive(isid)
+    source, data = get_thumbnail_source(isid, metadata)
+    png_bytes, thumbnail_size = make_thumbnail(data, THUMBNAIL_MAX_SIZE)
+    thumbnail_cache.put(isid, version, png_bytes, THUMBNAIL_MAX_SIZE)
     
-    with Image.open(BytesIO(source_fh.read())) as image:
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(2)
-            
-            image_height = image.size[1]
-            image_width = image.size[0]
-            
-            
-            
-            if image_height < image_width:
-                thumbnail_size = (THUMBNAIL_MAX_SIZE[0], int(image_height * (THUMBNAIL_MAX_SIZE[0] / image_width)))
-            else:
-                thumbnail_size = (int(image_width * (THUMBNAIL_MAX_SIZE[0] / image_width)), THUMBNAIL_MAX_SIZE[1])
-            
-            image.thumbnail((thumbnail_size[0]*3, thumbnail_size[1]*3), Image.LANCZOS)
-            
-            image_io = save_image_to_memory(image)
-
-    
-    return image_io, thumbnail_size
+    logger.info(f"Thumbnail for {isid} ({page_id}) from {source}.")
+    return BytesIO(png_bytes), thumbnail_size, source
 
 
-def save_image_to_memory(image, format='PNG', quality=100):
-    logger.info("Saving image to memory.")
+def get_thumbnail_source(isid, metadata):
+    """
+    Tries Drive's thumbnail, then the thumbnail embedded in a JPEG's header, and downloads the whole file only when
+    neither is large enough.
+    Args:
+        isid (str): The internal storage ID of the artwork.
+        metadata (dict): The file's LabelThumbnails.METADATA_FIELDS, empty if they couldn't be fetched.
+    Returns:
+        tuple: (source, image bytes)
+    """
+    
+    if metadata.get('thumbnailLink'):
+        try:
+            response = get_drive_session().get(
+                LabelThumbnails.drive_thumbnail_url(metadata['thumbnailLink'], THUMBNAIL_MAX_SIZE),
+                timeout=THUMBNAIL_LINK_TIMEOUT)
+            response.raise_for_status()
+            if LabelThumbnails.covers_label(response.content):
+                return LabelThumbnails.SOURCE_DRIVE, response.content
+        except Exception as e:
+            logger.warning(f"Error getting the Drive thumbnail of {isid}: {e}")
+    
+    if metadata.get('mimeType') in (None, 'image/jpeg'):
+        try:
+            thumbnail = LabelThumbnails.embedded_thumbnail(download_file_header(isid, LabelThumbnails.HEADER_BYTES))
+            if thumbnail and LabelThumbnails.covers_label(thumbnail):
+                return LabelThumbnails.SOURCE_EMBEDDED, thumbnail
+        except Exception as e:
+            logger.warning(f"Error reading the embedded thumbnail of {isid}: {e}")
+    
+    return LabelThumbnails.SOURCE_DOWNLOAD, download_file_from_drive(isid).read()
+
+
+def generate_thumbnails(thumbnail_requests):
+    """
+    Generates thumbnails on THUMBNAIL_WORKERS threads, so Drive downloads overlap with resizing the images already
+    downloaded. Labels that share artwork share one thumbnail.
+    Args:
+        thumbnail_requests (dict): Internal storage IDs mapped to the page ID of the first label using them.
+    Returns:
+        dict: Internal storage IDs mapped to the (image_io, thumbnail_size, source) tuple from generate_thumbnail().
+    Raises:
+        Exception: The first error from generate_thumbnail(), once every thumbnail has finished.
+    """
     
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    logger.info(f"Generating {len(thumbnail_requests)} thumbnails on {THUMBNAIL_WORKERS} threads.")
     
-    image_io = BytesIO()
-    image.save(image_io, format=format, quality=quality)
-    image_io.seek(0)
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail') as executor:
+        futures = {
+            isid: executor.submit(generate_thumbnail, isid, page_id) for isid, page_id in thumbnail_requests.items()
+            }
     
-    return image_io
+    return {isid: future.result() for isid, future in futures.items()}
 
 
 def download_file_from_drive(file_id):
@@ -439,7 +463,7 @@ def download_file_from_drive(file_id):
     
     logger.info(f"Downloading file {file_id} from Google Drive.")
     
-    request = drive_service.files().get_media(fileId=file_id)
+    request = get_drive_service().files().get_media(fileId=file_id)
     fh = BytesIO()
     downloader = MediaIoBaseDownload(fh, request)
     
@@ -452,6 +476,33 @@ def download_file_from_drive(file_id):
     return fh
 
 
+def download_file_header(file_id, length):
+    """
+    Downloads the first length bytes of a file from Google Drive with a ranged request.
+    Returns:
+        bytes: The start of the file, shorter if the file is.
+    """
+    
+    logger.info(f"Downloading the first {length} bytes of {file_id} from Google Drive.")
+    
+    request = get_drive_service().files().get_media(fileId=file_id)
+    request.headers['Range'] = f"bytes=0-{length - 1}"
+    return request.execute()
+
+
+def get_drive_service():
+    if not hasattr(drive_local, 'service'):
+        drive_local.service = build('drive', 'v3', credentials=gdrive_credentials)
+    return drive_local.service
+
+
+def get_drive_session():
+    # For thumbnailLink, which is outside the Drive API but needs the same credentials.
+    if not hasattr(drive_local, 'session'):
+        drive_local.session = AuthorizedSession(gdrive_credentials)
+    return drive_local.session
+
+
 def upload_file_to_drive(file_io, file_name, mime_type, folder_id):
     """
     Uploads a file to Google Drive.
@@ -477,7 +528,7 @@ def upload_file_to_drive(file_io, file_name, mime_type, folder_id):
     
     media = MediaIoBaseUpload(file_io, mimetype=mime_type)
     
-    file = drive_service.files().create(
+    file = get_drive_service().files().create(
         body=file_metadata,
         media_body=media,
         fields='id'
@@ -503,7 +554,7 @@ def process_jobrep_content(content_dict):
     Returns:
         list: A list of dictionaries, each representing a label with various properties such as page_id, ship_date, 
                 order_number, nest_name, quantity, product_description, customer, shipstation_qr_code, qr_code, 
-                thumbnail, thumbnail_size, line_code, uid, and label_urls.
+                thumbnail, thumbnail_size, thumbnail_source, line_code, uid, and label_urls.
     Raises:
         Exception: If there is an error parsing the ship date or any other unexpected error occurs during processing.
     """    
@@ -537,10 +588,16 @@ def process_jobrep_content(content_dict):
         'qr_code': None,
         'thumbnail': None,
         'thumbnail_size': THUMBNAIL_MAX_SIZE[1],
+        'thumbnail_source': None,
+        'thumbnail_id': None,
         'line_code': None,
         'uid': None,
         'label_urls': []
     }
+    
+    # Thumbnails are generated together after the loop, so each page's label is held until then.
+    page_labels = []
+    thumbnail_requests = {}
 
     # Iterate through jobs and reprints
     for jobrep in LIST_NAMES:
@@ -598,8 +655,7 @@ def process_jobrep_content(content_dict):
                 single_label_dict['label_urls'] = notion.return_property_value(page_props['Label URL'], page_id)
                 
                 # Images and QR codes
-                single_label_dict['thumbnail'], single_label_dict['thumbnail_size'] = generate_thumbnail(
-                    internal_storage_id, page_id)
+                thumbnail_requests.setdefault(internal_storage_id, page_id)
                 single_label_dict['qr_code'] = generate_qr_code(notion_link)
                 single_label_dict['shipstation_qr_code'] = generate_qr_code(
                     notion.return_property_value(page_props['Order Title'], page_id), fill_color='green')
@@ -610,55 +666,30 @@ def process_jobrep_content(content_dict):
                 except:
                     quantity = int(notion.return_property_value(page_props['Reprint quantity'], page_id))
                 
-                # Generates one label per quantity
-                for i in range(1, quantity+1):
-                    single_label_dict['quantity'] = f"{i}-{quantity}"
-                    label_dict.append(single_label_dict.copy())
-            
-    return label_dict
-
-
-def truncate_text(text, max_width, font_name, font_size):
-    while pdfmetrics.stringWidth(text, font_name, font_size) > max_width:
-        text = text[:-1]
+                page_labels.append((single_label_dict, internal_storage_id, quantity))
     
-    return text
-
-
-def draw_svg_on_canvas(c, svg_io, x, y, max_width, max_height):
-    """
-    Draws an SVG image on a ReportLab canvas with specified maximum width and height.
-    Args:
-        c (Canvas): The ReportLab canvas object where the SVG will be drawn.
-        svg_io (BytesIO): A BytesIO object containing the SVG data.
-        x (float): The x-coordinate on the canvas where the SVG will be drawn.
-        y (float): The y-coordinate on the canvas where the SVG will be drawn.
-        max_width (float): The maximum width for the SVG on the canvas.
-        max_height (float): The maximum height for the SVG on the canvas.
-    Returns:
-        None
-    """
-    
-    # Convert the SVG to a ReportLab drawing object
-    drawing = svg2rlg(svg_io)
+    thumbnails = generate_thumbnails(thumbnail_requests)
     
-    # Calculate the scaling factor
-    scale_x = max_width / drawing.width
-    scale_y = max_height / drawing.height
-    scale = min(scale_x, scale_y)
-    
-    # Apply the scaling factor
-    drawing.width *= scale
-    drawing.height *= scale
-    drawing.scale(scale, scale)
+    for single_label_dict, internal_storage_id, quantity in page_labels:
+        (single_label_dict['thumbnail'], single_label_dict['thumbnail_size'],
+         single_label_dict['thumbnail_source']) = thumbnails[internal_storage_id]
+        single_label_dict['thumbnail_id'] = internal_storage_id
+        
+        # Generates one label per quantity
+        for i in range(1, quantity+1):
+            single_label_dict['quantity'] = f"{i}-{quantity}"
+            label_dict.append(single_label_dict.copy())
     
-    # Draw the scaled drawing on the canvas
-    renderPDF.draw(drawing, c, x, y)
+    sources = Counter(label['thumbnail_source'] for label in label_dict)
+    logger.info(f"Label thumbnails by source: {dict(sources)}")
+            
+    return label_dict
 
 
-def draw_label(c, label, x, y, notion_logo, shipstation_logo):
+def draw_label(c, label, x, y, notion_logo, shipstation_logo, forms, layout):
     """
-    Draws a label on the given canvas at the specified coordinates.
+    Draws a label on the given canvas at the specified coordinates. The thumbnail, QR codes and logos are drawn through
+    forms, so each is stored in the PDF once however many labels show it.
     Args:
         c (Canvas): The canvas object to draw on.
         label (dict): A dictionary containing label information with the following keys:
@@ -670,25 +701,21 @@ def draw_label(c, label, x, y, notion_logo, shipstation_logo):
             - 'line_code' (str): Job quantity.
             - 'product_description' (str): Description of the product.
             - 'ship_date' (str): Shipping date.
-            - 'qr_code' (BytesIO): QR code image data.
-            - 'shipstation_qr_code' (BytesIO): Shipstation QR code image data.
+            - 'qr_code' (QRCode): QR code from generate_qr_code().
+            - 'shipstation_qr_code' (QRCode): Shipstation QR code from generate_qr_code().
             - 'thumbnail' (BytesIO): Thumbnail image data.
             - 'thumbnail_size' (touple): Size of the thumbnail image.
+            - 'thumbnail_id' (str): Internal storage ID of the thumbnail's artwork.
         x (float): The x-coordinate to start drawing the label.
         y (float): The y-coordinate to start drawing the label.
+        notion_logo (ImageReader): The Notion logo.
+        shipstation_logo (ImageReader): The ShipStation logo.
+        forms (FormRegistry): The canvas's form registry.
+        layout (LabelLayout): The product description style and its wrapped paragraphs.
     Returns:
         None
     """
     
-    styles = getSampleStyleSheet()
-    styleN = ParagraphStyle(
-        'CustomStyle',
-        parent=styles['Normal'],
-        fontName=LABEL_FONT,
-        fontSize=FONT_SIZE,
-        leading=11
-    )
-    
     c.setFont(LABEL_FONT_BOLD, BOLD_FONT_SIZE)
     c.drawString(x+ROW_UID[0], y+ROW_UID[1], f"{label['uid']}")
 
@@ -708,37 +735,33 @@ def draw_label(c, label, x, y, notion_logo, shipstation_logo):
     truncated_text = truncate_text(f"Job Qty:{label['line_code']}", JOB_QUANT_MAX_WIDTH, LABEL_FONT, FONT_SIZE)
     c.drawString(x+JOB_QUANT[0], y+JOB_QUANT[1], truncated_text)
     
-    product_description = Paragraph(label['product_description'], styleN)
-    product_description.wrapOn(c, PROD_DESCRIPTION_MAX_WIDTH, PROD_DESCRIPTION_MAX_HEIGHT)
+    product_description = layout.paragraph(c, label['product_description'])
     product_description.drawOn(c, x + PROD_DESCRIPTION[0], y + PROD_DESCRIPTION[1])
     
     c.drawString(x + SHIP_BY_ROW[0], y + SHIP_BY_ROW[1], f"SHIP-BY:{label['ship_date']}")
 
-    if label['qr_code']:
-        qr_code_io = BytesIO(label['qr_code'].getvalue())
-        qr_code_io.seek(0)
-        draw_svg_on_canvas(
-            c, qr_code_io, x + QR_CODE_2_POS[0], y + QR_CODE_2_POS[1], QR_CODE_MAX_SIZE[0], QR_CODE_MAX_SIZE[1])
-        qr_code_io.close()
-
-    if label['shipstation_qr_code']:
-        shipstation_qr_code_io = BytesIO(label['shipstation_qr_code'].getvalue())
-        shipstation_qr_code_io.seek(0) 
-        draw_svg_on_canvas(
-            c, shipstation_qr_code_io, x + QR_CODE_1_POS[0], y + QR_CODE_1_POS[1], QR_CODE_MAX_SIZE[0], QR_CODE_MAX_SIZE[1])
-        shipstation_qr_code_io.close()
+    for qr_code, position in [(label['qr_code'], QR_CODE_2_POS), (label['shipstation_qr_code'], QR_CODE_1_POS)]:
+        if qr_code:
+            forms.draw(
+                ('qr_code', qr_code.value, qr_code.fill_color, qr_code.back_color),
+                x + position[0], y + position[1], QR_CODE_MAX_SIZE[0], QR_CODE_MAX_SIZE[1],
+                lambda form_canvas, qr_code=qr_code: draw_qr_code(
+                    form_canvas, qr_code, 0, 0, QR_CODE_MAX_SIZE[0], QR_CODE_MAX_SIZE[1]))
 
     if label['thumbnail']:
-        thumbnail_io = BytesIO(label['thumbnail'].getvalue())
-        thumbnail_io.seek(0)
+        width, height = label['thumbnail_size']
+        ypos = y + THUMBNAIL_POS[1] if height == THUMBNAIL_MAX_SIZE[1] else y + int((LABEL_HEIGHT - height) / 2)
         
-        ypos = y + THUMBNAIL_POS[1] if label['thumbnail_size'][1] == THUMBNAIL_MAX_SIZE[1] else y + int((LABEL_HEIGHT - label['thumbnail_size'][1]) / 2)
-        
-        c.drawImage(ImageReader(thumbnail_io), x + THUMBNAIL_POS[0], ypos, width=label['thumbnail_size'][0], height=label['thumbnail_size'][1])
-        thumbnail_io.close()
-        
-    c.drawImage(notion_logo, x + NOTION_LOGO_POS[0], y + NOTION_LOGO_POS[1], width=LOGO_MAX_SIZE[0], height=LOGO_MAX_SIZE[1])
-    c.drawImage(shipstation_logo,x + SHIPSTATION_LOGO_POS[0], y + SHIPSTATION_LOGO_POS[1], width=LOGO_MAX_SIZE[0], height=LOGO_MAX_SIZE[1])
+        forms.draw(
+            ('thumbnail', label['thumbnail_id'], width, height), x + THUMBNAIL_POS[0], ypos, width, height,
+            lambda form_canvas: form_canvas.drawImage(
+                ImageReader(BytesIO(label['thumbnail'].getvalue())), 0, 0, width=width, height=height))
+    
+    for logo, name, position in [(notion_logo, 'notion', NOTION_LOGO_POS), (shipstation_logo, 'shipstation', SHIPSTATION_LOGO_POS)]:
+        forms.draw(
+            ('logo', name), x + position[0], y + position[1], LOGO_MAX_SIZE[0], LOGO_MAX_SIZE[1],
+            lambda form_canvas, logo=logo: form_canvas.drawImage(
+                logo, 0, 0, width=LOGO_MAX_SIZE[0], height=LOGO_MAX_SIZE[1]))
 
 
 def load_logo(logo_path):
@@ -772,6 +795,8 @@ def generate_labels(label_dict):
     
     notion_logo = load_logo(NOTION_LOGO_PATH)
     shipstation_logo = load_logo(SHIPSTATION_LOGO_PATH)
+    forms = FormRegistry(c)
+    layout = LabelLayout(LABEL_FONT, FONT_SIZE, PROD_DESCRIPTION_LEADING, PROD_DESCRIPTION_MAX_WIDTH, PROD_DESCRIPTION_MAX_HEIGHT)
     
     for index, label in enumerate(label_dict):
         label_counter = index % LABELS_PER_PAGE
@@ -782,7 +807,7 @@ def generate_labels(label_dict):
         
         y_pos = PAGE_TB_MARGIN + ((index % LABEL_ROWS) * LABEL_HEIGHT)
 
-        draw_label(c, label, x_pos, y_pos, notion_logo, shipstation_logo)
+        draw_label(c, label, x_pos, y_pos, notion_logo, shipstation_logo, forms, layout)
        
         if label_counter == 0:
             c.setFont(LABEL_FONT_BOLD, HEADER_FONT_SIZE)
@@ -792,7 +817,7 @@ def generate_labels(label_dict):
             c.showPage()
        
     c.save()
-    logger.info(f"Labels saved to PDF in memory.")
+    logger.info(f"Labels saved to PDF in memory, {len(forms)} assets drawn as forms.")
     return pdf_io
 
 
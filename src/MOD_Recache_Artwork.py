@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from NotionApiHelper import NotionApiHelper
+from LabelThumbnails import ThumbnailCache, make_thumbnail, file_version, VERSION_FIELDS
 import logging, sys, re, subprocess, requests
 from datetime import datetime
 from google.oauth2 import service_account
@@ -98,10 +99,22 @@ def recache_artwork(url, internal_storage_id):
     media = MediaIoBaseUpload(file_io, mimetype=mimetype, resumable=True)
     updated_file = drive_service.files().update(
         fileId=internal_storage_id,
-        media_body=media
+        media_body=media,
+        fields=f"id,{VERSION_FIELDS}"
     ).execute()
+    
+    cache_thumbnail(file_io.getvalue(), internal_storage_id, updated_file)
     return
 
+def cache_thumbnail(data, internal_storage_id, updated_file):
+    # Adds the new artwork's label thumbnail, so MOD_Generate_Nest_Labels.py doesn't have to download it.
+    try:
+        png_bytes, thumbnail_size = make_thumbnail(data)
+        ThumbnailCache().put(internal_storage_id, file_version(updated_file), png_bytes)
+        logger.info(f"Cached label thumbnail for {internal_storage_id}")
+    except Exception as e:
+        logger.error(f"Error caching label thumbnail for {internal_storage_id}: {e}", exc_info=True)
+
 def main():
     page_id = catch_variable()
     page_data = get_page_info(page_id)
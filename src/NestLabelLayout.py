@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+'''
+Text layout for MOD_Generate_Nest_Labels.py.
+
+A nest's labels repeat the same text over and over: every label shows the nest name, and each job's customer, order
+number and product description appear once per unit of quantity. This module builds the label's paragraph style once
+and caches its layout results:
+    truncate_text(): Finds where to cut text with a binary search over its cumulative glyph widths, instead of
+        dropping one character at a time and measuring the whole string again. Results are cached per (text, width,
+        font, size).
+    LabelLayout.paragraph(): Wraps each distinct product description once and reuses the wrapped Paragraph.
+
+Glyph widths are looked up once per (font, character) in font units (1/1000 of the font size). The cut found from their
+running sums is checked with pdfmetrics.stringWidth(), so it is the same as the old character by character loop's.
+
+Classes:
+    LabelLayout: The label's paragraph style and its cached wrapped paragraphs.
+Functions:
+    truncate_text(text, max_width, font_name, font_size): Returns the longest start of text that fits max_width.
+'''
+
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import Paragraph
+
+CACHE_SIZE = 4096 # Texts, per cache.
+
+_glyph_widths = {} # (font name, character) -> width in font units
+
+
+def glyph_width(char, font_name):
+    key = (font_name, char)
+    width = _glyph_widths.get(key)
+    if width is None:
+        width = _glyph_widths[key] = pdfmetrics.stringWidth(char, font_name, 1000)
+    return width
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def truncate_text(text, max_width, font_name, font_size):
+    """
+    Args:
+        text (str): The text.
+        max_width (float): The width it has to fit, in points.
+        font_name (str): A registered ReportLab font.
+        font_size (float): The font size in points.
+    Returns:
+        str: The longest start of text no wider than max_width, all of it if it fits.
+    """
+
+    scale = 0.001 * font_size
+    widths = [units * scale for units in accumulate((glyph_width(char, font_name) for char in text), initial=0)]
+    end = bisect_right(widths, max_width) - 1
+
+    # The sums can differ from stringWidth() in the last bit, which matters when a cut lands exactly on max_width.
+    while end < len(text) and pdfmetrics.stringWidth(text[:end + 1], font_name, font_size) <= max_width:
+        end += 1
+    while end > 0 and pdfmetrics.stringWidth(text[:end], font_name, font_size) > max_width:
+        end -= 1
+    return text[:end]
+
+
+class LabelLayout:
+    """
+    Args:
+        font_name (str): The paragraph font.
+        font_size (float): The paragraph font size.
+        leading (float): The paragraph line spacing.
+        max_width (float): The width paragraphs are wrapped to.
+        max_height (float): The height paragraphs are wrapped to.
+    """
+
+    def __init__(self, font_name, font_size, leading, max_width, max_height):
+        styles = getSampleStyleSheet()
+        self.style = ParagraphStyle(
+            'CustomStyle',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=font_size,
+            leading=leading
+        )
+        self.max_width = max_width
+        self.max_height = max_height
+        self.paragraphs = OrderedDict()
+
+    def paragraph(self, c, text):
+        """
+        Returns:
+            Paragraph: text wrapped to max_width, ready for drawOn(). The same object for the same text.
+        """
+
+        paragraph = self.paragraphs.get(text)
+        if paragraph is not None:
+            self.paragraphs.move_to_end(text)
+            return paragraph
+
+        paragraph = Paragraph(text, self.style)
+        paragraph.wrapOn(c, self.max_width, self.max_height)
+
+        self.paragraphs[text] = paragraph
+        while len(self.paragraphs) > CACHE_SIZE:
+            self.paragraphs.popitem(last=False)
+        return paragraph
@@ -64,16 +64,18 @@ get_object(string) -> dict
         dict: The JSON response from the Notion API.
 """
 
-#  get_page_property(self, pageID, propID):
+#  get_page_property(self, pageID, propID, start_cursor = None):
 """
 Sends a get request to a specified Notion page property, returning the response as a JSON property item object. Will return {} if the request fails.
 https://developers.notion.com/reference/property-item-object
+Paginated properties (relation, rich_text, title, people, rollup) return "has_more" and "next_cursor". Pass "next_cursor" back as start_cursor to get the next page of results.
 
-get_object(string) -> dict
+get_object(string, string, string(opt.)) -> dict
 
     Args:
         pageID (str): The ID of the Notion database.
         propID (str): The ID of the property to retrieve.
+        start_cursor (str): The next_cursor value from a previous response. Optional.
 
     Returns:
         dict: The JSON response from the Notion API.
@@ -93,6 +95,22 @@ create_page(string, dict) -> dict
         dict: The dictionary response from the Notion API.
 """
 
+#  create_pages(self, databaseID, properties_list, max_workers = 3):
+"""
+Creates several pages in a Notion database concurrently. Like every request the helper makes, each one waits on the process-wide rate limiter, so the combined rate of all helpers stays within Notion's limit.
+Returns the responses in the same order as properties_list. A failed request returns {} in its position.
+
+create_pages(string, list of dict, int(opt.)) -> list of dict
+
+    Args:
+        databaseID (str): The ID of the Notion database.
+        properties_list (list of dict): The properties of each new page.
+        max_workers (int): The number of requests to run at once. Optional.
+
+    Returns:
+        list of dict: The dictionary responses from the Notion API.
+"""
+
 #  update_page(self, pageID, properties, trash = False):
 '''
 Sends a patch request to a specified Notion page, updating the page with the specified properties. Returns the response as a dictionary. Will return {} if the request errors out.
@@ -184,12 +202,36 @@ Accepts a range of property types and generates a dictionary based on the input.
             Acceptable Colors: Colors: "blue", "blue_background", "brown", "brown_background", "default", "gray", "gray_background", "green", "green_background", "orange", "orange_background", "pink", "pink_background", "purple", "purple_background", "red", "red_background", "yellow", "yellow_background"
 '''
 
-import requests, time, json, logging, sys
+import requests, time, json, logging, sys, threading, copy
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    '''
+    Spaces calls to wait() at least 1/rate seconds apart, across every thread that shares the limiter.
+    '''
+    
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+            
+        if delay > 0:
+            time.sleep(delay)
+
 
 class NotionApiHelper:
     MAX_RETRIES = 3
     RETRY_DELAY = 30  # seconds
     PAGE_SIZE = 100
+    RATE_LIMIT = 3 # requests per second, Notion's average request limit.
+    rate_limiter = RateLimiter(RATE_LIMIT) # Every request method waits on it. Shared by every helper in the process.
     
 
     def __init__(self, header_path = 'src/headers.json'):
@@ -243,6 +285,7 @@ class NotionApiHelper:
             dict: The JSON response from the Notion API.
         """
         try:
+            self.rate_limiter.wait()
             print("Sending post request...")
             print(f"{self.endPoint}/databases/{databaseID}/query{filter_properties}")
             response = requests.post(f"{self.endPoint}/databases/{databaseID}/query{filter_properties}", headers=self.headers, json=bodyJson)
@@ -267,6 +310,7 @@ class NotionApiHelper:
     def get_page(self, pageID):
         try:
             time.sleep(0.5) # To avoid rate limiting
+            self.rate_limiter.wait()
             print(f"{self.endPoint}/pages/{pageID}")
             response = requests.get(f"{self.endPoint}/pages/{pageID}", headers=self.headers)
             response.raise_for_status()
@@ -284,11 +328,13 @@ class NotionApiHelper:
                 self.counter = 0
                 return {}
         
-    def get_page_property(self, pageID, propID):
+    def get_page_property(self, pageID, propID, start_cursor = None):
         try:
             time.sleep(0.5) # To avoid rate limiting
-            print(f"{self.endPoint}/pages/{pageID}/properties/{propID}")
-            response = requests.get(f"{self.endPoint}/pages/{pageID}/properties/{propID}", headers=self.headers)
+            self.rate_limiter.wait()
+            cursor = f"?start_cursor={start_cursor}" if start_cursor else ""
+            print(f"{self.endPoint}/pages/{pageID}/properties/{propID}{cursor}")
+            response = requests.get(f"{self.endPoint}/pages/{pageID}/properties/{propID}{cursor}", headers=self.headers)
             response.raise_for_status()
             self.counter = 0
             return response.json()
@@ -297,7 +343,7 @@ class NotionApiHelper:
                 logging.error(f"Network error occurred: {e}. Trying again in {self.RETRY_DELAY} seconds.")
                 time.sleep(self.RETRY_DELAY)
                 self.counter += 1
-                return self.get_page_property(pageID, propID)
+                return self.get_page_property(pageID, propID, start_cursor)
             else:    
                 logging.error(f"Network error occurred too many times: {e}")
                 time.sleep(3)
@@ -307,6 +353,7 @@ class NotionApiHelper:
     def create_page(self, databaseID, properties): # Will update to allow icon and cover images later.
         jsonBody = {"parent": {"database_id": databaseID}, "properties": properties}
         try:
+            self.rate_limiter.wait()
             print(f"{self.endPoint}/pages")
             response = requests.post(f"{self.endPoint}/pages", headers=self.headers, json=jsonBody)
             response.raise_for_status()
@@ -323,11 +370,23 @@ class NotionApiHelper:
                 time.sleep(3)
                 self.counter = 0
                 return {}
+    
+    def create_pages(self, databaseID, properties_list, max_workers = 3):
+        if not properties_list:
+            return []
+        
+        # Each request gets its own copy of the helper so retry counters aren't shared between threads.
+        def _create(properties):
+            return copy.copy(self).create_page(databaseID, properties)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_create, properties_list))
             
     def update_page(self, pageID, properties, trash = False): # Will update to allow icon and cover images later.
         jsonBody = {"properties": properties}
         print(jsonBody)
         try:
+            self.rate_limiter.wait()
             print("Sending patch request...")
             print(f"{self.endPoint}/pages/{pageID}")
             response = requests.patch(f"{self.endPoint}/pages/{pageID}", headers=self.headers, json=jsonBody)
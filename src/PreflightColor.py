@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+'''
+Color conversion for PreflightImageOps.py.
+
+When turned on, images the preflight re-encodes are converted from their embedded ICC profile (or sRGB when an RGB
+image has none) to the printer's profile with Pillow's ImageCms, and saved with the printer's profile embedded.
+Building an ImageCms transform parses both profiles and precomputes the conversion, which takes far longer than applying
+it, and customer images mostly share a handful of profiles. Transforms are kept in an LRU cache keyed by (source profile
+hash, target profile, intent, modes), so each image worker builds a transform once per source profile instead of once
+per image.
+
+Off by default. It is set in conf/MOD_Preflight_Conf.json and passed to the image workers by init_worker():
+    {"color": {"enabled": true, "target_profile": "conf/profiles/printer.icc", "intent": "perceptual"}}
+intent is "perceptual", "relative", "saturation" or "absolute".
+
+Images are left as they are when:
+    - The image has no profile and isn't RGB, since there is no safe guess for its color space.
+    - The image already has the target profile.
+    - The output format can't hold the target's color space, ie. a CMYK profile and a PNG.
+
+Classes:
+    ColorSettings: The color settings passed to the image workers.
+Functions:
+    load_color_settings(conf): Returns ColorSettings from the "color" section of the preflight conf.
+    convert_image(image, icc_profile, settings, image_format): Returns the converted image and the profile to embed.
+    clear_cache(): Empties the transform and profile caches.
+'''
+
+import hashlib, io, logging, os, threading
+from collections import OrderedDict, namedtuple
+from PIL import ImageCms
+
+ColorSettings = namedtuple('ColorSettings', ['enabled', 'target_profile', 'intent'])
+
+DEFAULT_SETTINGS = ColorSettings(False, None, 'perceptual')
+CACHE_SIZE = 32 # Transforms per image worker.
+
+INTENTS = {
+    'perceptual': ImageCms.Intent.PERCEPTUAL,
+    'relative': ImageCms.Intent.RELATIVE_COLORIMETRIC,
+    'saturation': ImageCms.Intent.SATURATION,
+    'absolute': ImageCms.Intent.ABSOLUTE_COLORIMETRIC
+    }
+PROFILE_MODES = {'RGB': 'RGB', 'CMYK': 'CMYK', 'GRAY': 'L'} # ICC color space -> Pillow mode
+FORMAT_MODES = {'PNG': ('RGB', 'RGBA', 'L'), 'JPEG': ('RGB', 'CMYK', 'L'), 'TIFF': ('RGB', 'RGBA', 'CMYK', 'L')}
+
+_transforms = OrderedDict()
+_profiles = {} # (path, mtime) -> (ImageCmsProfile, profile bytes, profile hash, mode)
+_lock = threading.Lock()
+_srgb = None
+
+
+def load_color_settings(conf):
+    """
+    Args:
+        conf (dict or None): The "color" section of the preflight conf.
+    Returns:
+        ColorSettings: Disabled unless "enabled" is true and a target profile is given.
+    """
+
+    conf = conf or {}
+    intent = conf.get('intent', DEFAULT_SETTINGS.intent)
+    if intent not in INTENTS:
+        logging.error(f"Unknown rendering intent {intent}, using {DEFAULT_SETTINGS.intent}.")
+        intent = DEFAULT_SETTINGS.intent
+
+    enabled = bool(conf.get('enabled')) and bool(conf.get('target_profile'))
+    return ColorSettings(enabled, conf.get('target_profile'), intent)
+
+
+def clear_cache():
+    with _lock:
+        _transforms.clear()
+        _profiles.clear()
+
+
+def profile_hash(profile_bytes):
+    return hashlib.sha1(profile_bytes).hexdigest()
+
+
+def _target_profile(path):
+    key = (os.path.abspath(path), os.path.getmtime(path))
+
+    with _lock:
+        if key in _profiles:
+            return _profiles[key]
+
+    profile = ImageCms.getOpenProfile(path)
+    profile_bytes = profile.tobytes()
+    mode = PROFILE_MODES.get(profile.profile.xcolor_space.strip())
+    if mode is None:
+        raise ValueError(f"Unsupported target profile color space {profile.profile.xcolor_space!r} in {path}.")
+
+    entry = (profile, profile_bytes, profile_hash(profile_bytes), mode)
+    with _lock:
+        _profiles[key] = entry
+    return entry
+
+
+def _source_profile(profile_bytes):
+    global _srgb
+
+    if profile_bytes:
+        return ImageCms.ImageCmsProfile(io.BytesIO(profile_bytes))
+    if _srgb is None:
+        _srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+    return _srgb
+
+
+def get_transform(source_bytes, target_path, intent, in_mode, out_mode):
+    """
+    Returns a cached ImageCms transform, building it on a miss.
+    Args:
+        source_bytes (bytes or None): The source ICC profile, None for sRGB.
+        target_path (str): The target ICC profile file.
+        intent (str): A key of INTENTS.
+        in_mode (str): The image's Pillow mode.
+        out_mode (str): The output Pillow mode.
+    """
+
+    key = (profile_hash(source_bytes) if source_bytes else 'sRGB', target_path, intent, in_mode, out_mode)
+
+    with _lock:
+        if key in _transforms:
+            _transforms.move_to_end(key)
+            return _transforms[key]
+
+    transform = ImageCms.buildTransform(
+        _source_profile(source_bytes), _target_profile(target_path)[0], in_mode, out_mode, INTENTS[intent]
+        )
+
+    with _lock:
+        _transforms[key] = transform
+        while len(_transforms) > CACHE_SIZE:
+            _transforms.popitem(last=False)
+
+    return transform
+
+
+def convert_image(image, icc_profile, settings, image_format):
+    """
+    Converts an image to the target profile when color conversion is on.
+    Args:
+        image (PIL.Image): The image.
+        icc_profile (bytes or None): Its embedded ICC profile.
+        settings (ColorSettings or None): The color settings.
+        image_format (str): The Pillow format it will be saved in.
+    Returns:
+        tuple: (image, icc_profile) to save. The same objects when nothing was converted.
+    """
+
+    if not settings or not settings.enabled:
+        return image, icc_profile
+
+    if not icc_profile and image.mode not in ('RGB', 'RGBA', 'P'):
+        return image, icc_profile
+
+    target, target_bytes, target_hash, out_mode = _target_profile(settings.target_profile)
+    if icc_profile and profile_hash(icc_profile) == target_hash:
+        return image, icc_profile
+
+    if image.mode not in ('RGB', 'RGBA', 'CMYK', 'L'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    in_mode = image.mode
+    if in_mode == 'RGBA' and out_mode == 'RGB':
+        out_mode = 'RGBA' # Keeps the alpha band.
+
+    if out_mode not in FORMAT_MODES.get(image_format, (out_mode,)):
+        logging.warning(f"{image_format} can't hold {out_mode}, leaving the image's colors as they are.")
+        return image, icc_profile
+
+    transform = get_transform(icc_profile, settings.target_profile, settings.intent, in_mode, out_mode)
+    return ImageCms.applyTransform(image, transform), target_bytes
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+'''
+Batched Notion lookups for CheckImageThenHotfolder.py.
+
+process_new_file() needs the job page, the order's customer, the customer's preflight approval and the product page
+for every image, and made those calls one after another. PreflightContextLoader resolves them for a whole batch of
+Hopper files at once:
+
+    1. Jobs: One database query per 100 jobs, using an "or" filter on the job's Notion record formula, the same way
+        MOD_Generate_Nest_Labels.py gathers a nest's jobs.
+    2. Orders and products: As each chunk of jobs comes back, the customer of every order and every product page are
+        fetched concurrently. Each order, customer or product is only fetched once per batch, however many jobs share it.
+    3. Customers: Each order's customer preflight approval is fetched as soon as the order's customer is known.
+
+Every request waits on NotionApiHelper.rate_limiter, which the loader threads share with the preflight workers' own
+helpers, so running them in parallel doesn't take the process over Notion's average of 3 requests per second.
+
+Lookups are futures, so a preflight worker that asks for something still loading waits for it instead of asking
+Notion again, and anything not prefetched is fetched on demand through the same path. Orders, customers and products
+are cached for ttl_seconds. Job pages change as the preflight runs (status, log), so each prefetched job page is handed
+out once and then dropped.
+
+Lookups return the same responses as NotionApiHelper.get_page() and get_page_property(), so the caller's parsing
+doesn't change. A failed query or request returns {} like NotionApiHelper does. Responses without the field the
+caller reads (RESPONSE_KEYS) are handed to the callers already waiting for them but not cached, so the next caller asks
+Notion again.
+
+Classes:
+    PreflightContextLoader: Prefetches and caches the preflight context for job IDs.
+'''
+
+import time, threading, logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from NotionApiHelper import NotionApiHelper
+
+JOB_DB_ID = 'f11c954da24143acb6e2bf0254b64079'
+JOB_PROP_NOTION_RECORD = 'Notion record'
+ORDER_PROP_CUSTOMER = r"iegJ"
+CUSTOMER_PROP_PREFLIGHT = r"I%3E%7Cy"
+QUERY_CHUNK_SIZE = 100 # Conditions per query filter.
+TTL_SECONDS = 300
+RESPONSE_KEYS = {'order': 'results', 'customer': 'select', 'product': 'properties'} # Present in every valid response.
+
+
+class PreflightContextLoader:
+    """
+    Prefetches and caches the Notion pages preflight needs for each job.
+    Args:
+        workers (int): Threads making Notion requests.
+        ttl_seconds (float): How long order, customer and product lookups are kept.
+        notion_factory (callable): Returns a NotionApiHelper. Each loader thread makes its own.
+    """
+
+    def __init__(self, workers = 4, ttl_seconds = TTL_SECONDS, notion_factory = NotionApiHelper):
+        self.ttl_seconds = ttl_seconds
+        self.notion_factory = notion_factory
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preflight_context')
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.jobs = {}      # job_id -> (Future of the job page or None if not found, time)
+        self.lookups = {'order': {}, 'customer': {}, 'product': {}} # kind -> {page_id: (Future, time)}
+
+    @property
+    def notion(self):
+        if not hasattr(self.local, 'notion'):
+            self.local.notion = self.notion_factory()
+        return self.local.notion
+
+    def shutdown(self, wait = True):
+        self.executor.shutdown(wait=wait)
+
+    def prefetch(self, job_ids):
+        """
+        Starts loading the context for the given jobs and returns without waiting.
+        Args:
+            job_ids (list): Job page IDs.
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            self._expire(self.jobs, now) # Jobs that were prefetched but never processed.
+            new_jobs = []
+            for job_id in dict.fromkeys(job_ids):
+                if job_id not in self.jobs:
+                    self.jobs[job_id] = (Future(), now)
+                    new_jobs.append((job_id, self.jobs[job_id][0]))
+
+        for start in range(0, len(new_jobs), QUERY_CHUNK_SIZE):
+            self.executor.submit(self._load_jobs, new_jobs[start:start + QUERY_CHUNK_SIZE])
+
+    def get_job(self, job_id):
+        """
+        Returns the job page, from the prefetch if there was one. Each prefetched page is only returned once.
+        """
+
+        with self.lock:
+            future = self.jobs.pop(job_id, (None, 0))[0]
+
+        page = future.result() if future is not None else None
+
+        return page if page else self.notion.get_page(job_id)
+
+    def get_order_customer(self, order_id):
+        """
+        Returns the order's customer relation property, as get_page_property(order_id, "iegJ") does.
+        """
+
+        return self._lookup('order', order_id).result()
+
+    def get_customer_preflight(self, customer_id):
+        """
+        Returns the customer's preflight approval property, as get_page_property(customer_id, "I%3E%7Cy") does.
+        """
+
+        return self._lookup('customer', customer_id).result()
+
+    def get_product(self, product_id):
+        return self._lookup('product', product_id).result()
+
+    def _lookup(self, kind, page_id):
+        """
+        Returns the Future for a lookup, starting it if it isn't cached or already running.
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            cached = self.lookups[kind].get(page_id)
+            if cached is not None and not (cached[0].done() and cached[0].exception()):
+                if not cached[0].done() or now - cached[1] < self.ttl_seconds:
+                    return cached[0]
+
+            future = Future()
+            self.lookups[kind][page_id] = (future, now)
+            for cache in self.lookups.values():
+                self._expire(cache, now)
+
+        self.executor.submit(self._run_lookup, kind, page_id, future)
+        return future
+
+    def _expire(self, cache, now):
+        for key, (future, since) in list(cache.items()):
+            if future.done() and now - since >= self.ttl_seconds:
+                del cache[key]
+
+    def _run_lookup(self, kind, page_id, future):
+        try:
+            if kind == 'order':
+                response = self.notion.get_page_property(page_id, ORDER_PROP_CUSTOMER)
+            elif kind == 'customer':
+                response = self.notion.get_page_property(page_id, CUSTOMER_PROP_PREFLIGHT)
+            else:
+                response = self.notion.get_page(page_id)
+        except Exception as e:
+            logging.error(f"Error loading {kind} {page_id}: {e}")
+            future.set_exception(e)
+            return
+
+        if not isinstance(response, dict) or RESPONSE_KEYS[kind] not in response:
+            logging.warning(f"No valid response loading {kind} {page_id}, not caching it.")
+            self._forget(kind, page_id, future)
+            future.set_result(response)
+            return
+
+        future.set_result(response)
+
+        if kind == 'order':
+            try:
+                self._lookup('customer', response['results'][0]['relation']['id'])
+            except (KeyError, IndexError, TypeError):
+                pass # Reported by the worker that reads it.
+
+    def _forget(self, kind, page_id, future):
+        with self.lock:
+            cached = self.lookups[kind].get(page_id)
+            if cached is not None and cached[0] is future:
+                del self.lookups[kind][page_id]
+
+    def _load_jobs(self, jobs):
+        """
+        Queries a chunk of jobs and starts their order and product lookups.
+        Args:
+            jobs (list): (job_id, Future) pairs. Every Future gets a result, None for jobs the query didn't return.
+        """
+
+        content_filter = {'or': [
+            {'property': JOB_PROP_NOTION_RECORD, 'formula': {'string': {'contains': job_id.replace("-", "")}}}
+            for job_id, future in jobs
+            ]}
+
+        try:
+            results = self.notion.query(JOB_DB_ID, content_filter=content_filter) or []
+            pages = {page['id'].replace("-", ""): page for page in results}
+        except Exception as e:
+            logging.error(f"Error querying {len(jobs)} jobs: {e}")
+            pages = {}
+
+        for job_id, future in jobs:
+            page = pages.get(job_id.replace("-", ""))
+            future.set_result(page) # None falls back to get_page() in get_job().
+
+            if not page:
+                continue
+
+            try:
+                self._lookup('order', page['properties']['Order']['relation'][0]['id'])
+                self._lookup('product', page['properties']['Product']['relation'][0]['id'])
+            except (KeyError, IndexError, TypeError):
+                continue # Missing relations are reported by the worker that reads the job.
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+'''
+Image operations for CheckImageThenHotfolder.py.
+
+These are module level functions that take file paths instead of PIL images, so they can run in the preflight
+process pool (see PreflightPipeline.py) without sending pixel data between processes. Each one opens the source
+image, does its work and writes the result at 150 DPI. Errors are raised to the caller, which reports them to Notion.
+
+Output:
+    Each function takes dst_paths, one path or a list of them (ie. the hotfolder and Hotfolders/tmp). The result is
+    encoded once into memory and the same bytes are written to every destination at the same time. Each destination is
+    written to "<name>.~#~" first and then renamed over the final name with os.replace(), so Caldera never sees a
+    partial file and an older file of the same name is swapped out in one step.
+
+Functions:
+    init_worker(max_image_pixels, stream_pixels, memory_budget_mb, limit_memory, color, oversize): Process pool
+        initializer, applies the Pillow settings the handler uses and the worker's memory budget.
+    center_crop_box(size, target_xpix, target_ypix): Returns the centered crop box for the target size.
+    write_outputs(data, dst_paths): Writes encoded bytes to every destination, atomically.
+    set_dpi(src_path, dst_paths): Rewrites the image at 150 DPI, by patching the metadata for JPEG and PNG.
+    crop_to_target(src_path, dst_paths, target_xpix, target_ypix): Crops the image to the target size.
+    resize_and_crop(src_path, dst_paths, target_xpix, target_ypix): Scales the image to cover the target size and
+        crops the excess. The crop box is computed first and mapped back to the source, so only kept pixels are
+        resampled.
+
+Downscaling:
+    When resize_and_crop shrinks an image below REDUCE_THRESHOLD of its size, JPEGs are decoded in draft mode, letting
+    libjpeg scale by 1/2, 1/4 or 1/8 in the DCT domain so the full size image is never held in memory. Draft stops at
+    twice the output size, the same as Image.thumbnail(). Every format is then resized with reducing_gap, which
+    shrinks by an integer factor with Image.reduce() first and only runs LANCZOS over the last step.
+
+Oversize images:
+    Images of stream_pixels or more are processed with libvips (pip install pyvips) when it is installed. The file is
+    opened for sequential access and resized, cropped and saved as one pipeline that works through the image in strips,
+    so memory use depends on the image width, not its size. For JPEG resizes the size after draft mode is what counts.
+    Smaller images use Pillow inside memory_budget(), which checks that the decoded image fits in the worker's
+    memory_budget_mb. With libvips installed, images that don't fit raise MemoryBudgetError instead of running the
+    preflight box out of memory, and pool workers also get a hard address space limit (RLIMIT_AS) of the budget plus
+    ADDRESS_SPACE_MARGIN_MB where the platform supports it (not Windows), so a worker that goes over fails with a
+    MemoryError on its own.
+    Without libvips Pillow is the only way to process an image up to MAX_IMAGE_PIXELS, so images over the budget are
+    still processed, but one at a time: they wait on oversize_lock, shared by every image worker. Peak memory stays
+    under one MAX_IMAGE_PIXELS image plus the budget of each other worker, however many oversize images arrive.
+
+Color:
+    With color conversion on (see PreflightColor.py), every re-encoded image is converted to the printer profile in
+    save_image(), or with icc_transform() on the libvips path, and DPI fixes re-encode instead of patching metadata.
+'''
+
+import io, math, os, threading, warnings
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+import ImageMetadata, PreflightColor
+
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except (ImportError, OSError): # OSError when pyvips is installed but libvips isn't.
+    pyvips = None
+    PYVIPS_AVAILABLE = False
+
+TARGET_DPI = (150, 150)
+MAX_IMAGE_PIXELS = 600000000 # Accounts for large 300DPI images.
+REDUCE_THRESHOLD = 0.5 # Scale factors below this use draft decoding and reducing_gap.
+REDUCING_GAP = 3.0 # Pillow's recommended gap for results indistinguishable from a plain LANCZOS resize.
+DRAFT_GAP = 2.0
+STREAM_PIXELS = 150000000 # Images this large are streamed through libvips when it is installed.
+MEMORY_BUDGET_MB = 2048 # Per image worker.
+ADDRESS_SPACE_MARGIN_MB = 1024 # Interpreter, libraries and thread stacks on top of the budget.
+TEMP_SUFFIX = ".~#~" # Partial outputs, ignored by the Hopper watcher and Caldera.
+
+stream_pixels = STREAM_PIXELS
+memory_budget_mb = MEMORY_BUDGET_MB
+color_settings = PreflightColor.DEFAULT_SETTINGS
+oversize_lock = threading.Lock() # Replaced by the pool's multiprocessing lock in pool workers.
+
+
+class MemoryBudgetError(MemoryError):
+    pass
+
+
+def init_worker(max_image_pixels = MAX_IMAGE_PIXELS, stream_pixel_limit = STREAM_PIXELS,
+                memory_budget = MEMORY_BUDGET_MB, limit_memory = True, color = None, oversize = None):
+    """
+    Applies the preflight image settings to this process.
+    Args:
+        max_image_pixels (int): Pillow's decompression bomb limit.
+        stream_pixel_limit (int): Images with at least this many pixels use libvips when it is installed.
+        memory_budget (int): MB of image data a worker may hold. 0 turns the budget off.
+        limit_memory (bool): Also set RLIMIT_AS, when libvips is installed. Only for pool workers, never the main
+            process.
+        color (PreflightColor.ColorSettings): Color conversion settings. None leaves colors alone.
+        oversize (multiprocessing.Lock): Held while a worker processes an image over the budget without libvips.
+            Shared by every worker in the pool. None keeps this process's own lock.
+    """
+
+    global stream_pixels, memory_budget_mb, color_settings, oversize_lock
+
+    warnings.simplefilter('ignore', Image.DecompressionBombWarning) # Suppresses DecompressionBombWarning
+    Image.MAX_IMAGE_PIXELS = max_image_pixels
+    stream_pixels = stream_pixel_limit
+    memory_budget_mb = memory_budget
+    color_settings = color or PreflightColor.DEFAULT_SETTINGS
+    if oversize is not None:
+        oversize_lock = oversize
+
+    # Without libvips an oversize image must still fit, so the address space isn't limited.
+    if limit_memory and memory_budget and PYVIPS_AVAILABLE:
+        try:
+            import resource
+            limit = (memory_budget + ADDRESS_SPACE_MARGIN_MB) * 1024 * 1024
+            soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        except (ImportError, ValueError, OSError): # No resource module on Windows.
+            pass
+
+
+def _as_list(dst_paths):
+    return [dst_paths] if isinstance(dst_paths, str) else list(dst_paths)
+
+
+def write_atomic(data, path):
+    temp_path = f"{path}{TEMP_SUFFIX}"
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_outputs(data, dst_paths):
+    """
+    Writes the same encoded image to each destination, in parallel, through a temp name and a rename.
+    Args:
+        data (bytes): The encoded image.
+        dst_paths (str or list): The destination paths.
+    """
+
+    dst_paths = _as_list(dst_paths)
+
+    if len(dst_paths) == 1:
+        write_atomic(data, dst_paths[0])
+        return
+
+    with ThreadPoolExecutor(max_workers=len(dst_paths)) as executor:
+        futures = [executor.submit(write_atomic, data, path) for path in dst_paths]
+        for future in futures:
+            future.result() # Raises the first write error.
+
+
+def save_image(image, dst_paths, icc_profile = None):
+    """
+    Encodes the image once at 150 DPI, in the format of the first destination's extension, and writes it out. Colors
+    are converted to the printer profile first when color conversion is on.
+    """
+
+    dst_paths = _as_list(dst_paths)
+    image_format = Image.registered_extensions().get(os.path.splitext(dst_paths[0])[1].lower())
+    image, icc_profile = PreflightColor.convert_image(image, icc_profile, color_settings, image_format)
+    buffer = io.BytesIO()
+
+    if icc_profile:
+        image.save(buffer, image_format, dpi=TARGET_DPI, icc_profile=icc_profile)
+    else:
+        image.save(buffer, image_format, dpi=TARGET_DPI)
+
+    write_outputs(buffer.getvalue(), dst_paths)
+
+
+def center_crop_box(size, target_xpix, target_ypix):
+    """
+    Returns the (left, top, right, bottom) box that crops an image of the given size down to the target size,
+    keeping the center.
+    """
+
+    left = (size[0] - target_xpix) / 2
+    top = (size[1] - target_ypix) / 2
+    right = (size[0] + target_xpix) / 2
+    bottom = (size[1] + target_ypix) / 2
+
+    return left, top, right, bottom
+
+
+def bytes_per_pixel(mode):
+    """
+    Returns how many bytes Pillow stores per pixel for a mode. Multi band modes are padded to 4 bytes.
+    """
+
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+@contextmanager
+def memory_budget(size, mode, output_size = (0, 0), factor = 1.0):
+    """
+    Wraps the Pillow work on an image. Decoding an image of this size, times factor for intermediate buffers, plus
+    the output, must fit the worker's memory budget. If it doesn't, MemoryBudgetError is raised when libvips is
+    installed, and otherwise the work waits for oversize_lock so only one worker holds an oversize image at a time.
+    """
+
+    needed = (size[0] * size[1] * factor + output_size[0] * output_size[1]) * bytes_per_pixel(mode) / 1024 / 1024
+    if not memory_budget_mb or needed <= memory_budget_mb:
+        yield
+    elif PYVIPS_AVAILABLE:
+        raise MemoryBudgetError(
+            f"Processing a {size[0]}x{size[1]} {mode} image needs about {needed:.0f} MB, over the {memory_budget_mb} MB "
+            f"image worker budget. Lower stream_pixels or raise memory_budget_mb in the preflight conf."
+            )
+    else:
+        with oversize_lock:
+            yield
+
+
+def use_vips(size):
+    return PYVIPS_AVAILABLE and size[0] * size[1] >= stream_pixels
+
+
+def _vips_open(src_path):
+    return pyvips.Image.new_from_file(src_path, access='sequential')
+
+
+def _vips_save(image, dst_paths):
+    # libvips stores resolution in pixels per mm. JPEG density is written in inches only when asked, otherwise
+    # Pillow would read it back as 149.86 DPI from centimeters.
+    dst_paths = _as_list(dst_paths)
+    if color_settings.enabled:
+        image = image.icc_transform(color_settings.target_profile, intent=color_settings.intent, embedded=True,
+                                    input_profile='srgb')
+    image = image.copy(xres=TARGET_DPI[0] / 25.4, yres=TARGET_DPI[1] / 25.4)
+    image.set_type(pyvips.GValue.gstr_type, 'resolution-unit', 'in')
+    data = image.write_to_buffer(os.path.splitext(dst_paths[0])[1].lower()) # Keeps the ICC profile.
+    write_outputs(data, dst_paths)
+
+
+def _crop_and_save(image, dst_paths, target_xpix, target_ypix, icc_profile):
+    left, top, right, bottom = center_crop_box(image.size, target_xpix, target_ypix)
+
+    if left == 0 and top == 0 and right == image.size[0] and bottom == image.size[1]:
+        save_image(image, dst_paths, icc_profile)
+    else:
+        save_image(image.crop((int(left), int(top), int(right), int(bottom))), dst_paths, icc_profile)
+
+
+def set_dpi(src_path, dst_paths):
+    """
+    Rewrites the image at 150 DPI. JPEGs and PNGs only have their resolution metadata patched (see ImageMetadata.py),
+    so the pixels are copied as is. Other formats, JPEGs and PNGs that can't be patched safely, and any image when color
+    conversion is on, are re-encoded.
+    """
+
+    with open(src_path, 'rb') as file:
+        if not color_settings.enabled and ImageMetadata.can_patch(file.read(8)):
+            file.seek(0)
+            data = ImageMetadata.set_dpi_bytes(file.read(), TARGET_DPI)
+            if data is not None:
+                write_outputs(data, dst_paths)
+                return
+
+    with Image.open(src_path) as image:
+        if use_vips(image.size):
+            _vips_save(_vips_open(src_path), dst_paths)
+            return
+
+        with memory_budget(image.size, image.mode):
+            save_image(image, dst_paths, image.info.get('icc_profile')) # Only the DPI, unless colors are converted.
+
+
+def crop_to_target(src_path, dst_paths, target_xpix, target_ypix):
+    with Image.open(src_path) as image:
+        if use_vips(image.size):
+            left, top, right, bottom = (int(edge) for edge in center_crop_box(image.size, target_xpix, target_ypix))
+            cropped = _vips_open(src_path).crop(left, top, right - left, bottom - top)
+            _vips_save(cropped, dst_paths)
+            return
+
+        with memory_budget(image.size, image.mode, (target_xpix, target_ypix)):
+            _crop_and_save(image, dst_paths, target_xpix, target_ypix, image.info.get('icc_profile'))
+
+
+def resize_and_crop(src_path, dst_paths, target_xpix, target_ypix):
+    """
+    Scales the image so it covers the target size, crops the excess and saves it. The result matches scaling the
+    whole image and then cropping, but only the kept region is resampled.
+    Returns:
+        tuple: The image size before scaling.
+    """
+
+    with Image.open(src_path) as image:
+        icc_profile = image.info.get('icc_profile')
+        original_size = image.size
+
+        scale_factor = max(target_xpix / original_size[0], target_ypix / original_size[1])
+        scaled_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
+        left, top, right, bottom = (int(edge) for edge in center_crop_box(scaled_size, target_xpix, target_ypix))
+        reducing_gap = None
+
+        if scale_factor < REDUCE_THRESHOLD:
+            reducing_gap = REDUCING_GAP
+            if image.format == 'JPEG':
+                image.draft(image.mode, (math.ceil(scaled_size[0] * DRAFT_GAP), math.ceil(scaled_size[1] * DRAFT_GAP)))
+
+        if use_vips(image.size): # Checked after draft, which often brings a JPEG under the streaming threshold.
+            scaled = _vips_open(src_path).resize(
+                scaled_size[0] / original_size[0], vscale=scaled_size[1] / original_size[1], kernel='lanczos3'
+                )
+            _vips_save(scaled.crop(left, top, right - left, bottom - top), dst_paths)
+            return original_size
+
+        # Only the region kept by the crop is resampled. Its box is mapped back to the source, in the coordinates of
+        # the image as decoded since draft mode may have shrunk it.
+        x_ratio = image.size[0] / scaled_size[0]
+        y_ratio = image.size[1] / scaled_size[1]
+        box = (left * x_ratio, top * y_ratio, right * x_ratio, bottom * y_ratio)
+
+        # reduce() makes a copy at up to 1/4 of the decoded size before the last resample.
+        with memory_budget(image.size, image.mode, (right - left, bottom - top), 1.25 if reducing_gap else 1.0):
+            cropped_image = image.resize((right - left, bottom - top), Image.LANCZOS, box=box,
+                                         reducing_gap=reducing_gap)
+            save_image(cropped_image, dst_paths, icc_profile)
+
+    return original_size
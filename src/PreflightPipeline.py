@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+'''
+Parallel preflight pipeline for CheckImageThenHotfolder.py.
+
+Files in the Hopper are handed to a bounded thread pool, where each worker runs HotfolderHandler.process_new_file().
+The Notion lookups in process_new_file are I/O bound, so threads overlap them, and each batch of files is handed to
+HotfolderHandler.prefetch_context() first so their lookups are batched. The Pillow work is sent on to a separate
+process pool through HotfolderHandler.run_image_task(), so a large resize only ties up one image worker instead of
+blocking every other file.
+
+Before a worker touches a file it claims it. A claim is held in memory for this process and as a lock file in the
+claim directory, created with O_EXCL so only one preflight process can hold it. Two workers, or two preflight
+machines watching the same Hopper, never take the same file. Lock files older than STALE_CLAIM_SECONDS are assumed to
+be left over from a crash and are taken over.
+
+Classes:
+    FileClaims: Per-file claim/lock handling.
+    PreflightPipeline: Feeds Hopper files to the worker pool.
+'''
+
+import os, time, threading, logging
+from concurrent.futures import ThreadPoolExecutor
+
+STALE_CLAIM_SECONDS = 1800
+IGNORED_FILES = ['Thumbs.db', 'desktop.ini']
+
+
+class FileClaims:
+    """
+    Claims files so only one worker, in any preflight process, works on a file at a time.
+    Args:
+        claim_dir (str): Directory for the lock files. Shared by every preflight process watching the same Hopper.
+    """
+
+    def __init__(self, claim_dir):
+        self.claim_dir = claim_dir
+        self.lock = threading.Lock()
+        self.claimed = set()
+        os.makedirs(claim_dir, exist_ok=True)
+
+    def _lock_path(self, file_name):
+        return os.path.join(self.claim_dir, f"{file_name}.lock")
+
+    def is_claimed(self, file_name):
+        with self.lock:
+            return file_name in self.claimed
+
+    def claim(self, file_name):
+        """
+        Claims a file.
+        Returns:
+            bool: True if this call now holds the claim, False if it is held elsewhere.
+        """
+
+        with self.lock:
+            if file_name in self.claimed:
+                return False
+            self.claimed.add(file_name)
+
+        lock_path = self._lock_path(file_name)
+
+        for attempt in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, f"{os.getpid()} {time.time()}".encode())
+                os.close(fd)
+                return True
+
+            except FileExistsError:
+                # Another process holds the claim, unless its lock file is stale.
+                try:
+                    stale = time.time() - os.path.getmtime(lock_path) > STALE_CLAIM_SECONDS
+                except OSError:
+                    stale = True # Released in the meantime, try again.
+
+                if attempt == 0 and stale:
+                    logging.info(f"Taking over stale claim on {file_name}.")
+                    try:
+                        os.remove(lock_path)
+                    except OSError:
+                        pass
+                    continue
+                break
+
+            except OSError as e:
+                logging.error(f"Error claiming {file_name}: {e}")
+                break
+
+        with self.lock:
+            self.claimed.discard(file_name)
+        return False
+
+    def release(self, file_name):
+        try:
+            os.remove(self._lock_path(file_name))
+        except OSError:
+            pass
+
+        with self.lock:
+            self.claimed.discard(file_name)
+
+
+class PreflightPipeline:
+    """
+    Feeds Hopper files to a bounded pool of preflight workers.
+    Args:
+        handler (HotfolderHandler): The handler whose process_new_file() runs for each file.
+        hopper_path (str): The Hopper directory.
+        claims (FileClaims): Claims shared by the workers.
+        workers (int): Number of files processed at once.
+    """
+
+    def __init__(self, handler, hopper_path, claims, workers = 4):
+        self.handler = handler
+        self.hopper_path = hopper_path
+        self.claims = claims
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preflight')
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.failed = set() # Files that raised, not retried until the script restarts.
+
+    def submit(self, file_names):
+        """
+        Queues Hopper files for processing. Files already queued, claimed, or failed are skipped, and no more than two
+        files per worker are queued at once.
+        Args:
+            file_names (list): File names in the Hopper.
+        Returns:
+            list: The files that weren't queued because the pool is full. Pass them again on the next call.
+        """
+
+        queued = []
+        backlog = []
+
+        for index, file_name in enumerate(file_names):
+            if file_name in IGNORED_FILES or ".~#~" in file_name: # Still copying, picked up once renamed.
+                continue
+
+            with self.lock:
+                if len(self.in_flight) >= self.workers * 2:
+                    backlog = list(dict.fromkeys(file_names[index:]))
+                    break
+                if file_name in self.in_flight or file_name in self.failed:
+                    continue
+                self.in_flight.add(file_name)
+            queued.append(file_name)
+
+        if queued:
+            # Started before the workers so they find the batch's Notion lookups already under way.
+            try:
+                self.handler.prefetch_context(queued)
+            except Exception as e:
+                logging.error(f"Error prefetching preflight context: {e}")
+
+        for file_name in queued:
+            self.executor.submit(self._run, file_name)
+
+        return backlog
+
+    def _run(self, file_name):
+        try:
+            if not self.claims.claim(file_name):
+                logging.info(f"{file_name} is claimed by another worker. Skipping.")
+                return
+
+            try:
+                if os.path.exists(f"{self.hopper_path}/{file_name}"):
+                    self.handler.process_new_file(f"{self.hopper_path}/{file_name}")
+            finally:
+                self.claims.release(file_name)
+
+        except Exception as e:
+            logging.error(f"Critical error processing {file_name}: {e}", exc_info=True)
+            with self.lock:
+                self.failed.add(file_name)
+
+        finally:
+            with self.lock:
+                self.in_flight.discard(file_name)
+
+    def busy(self):
+        with self.lock:
+            return len(self.in_flight)
+
+    def shutdown(self, wait = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+'''
+Preflight decisions for CheckImageThenHotfolder.py, without any I/O.
+
+plan_preflight() takes what process_new_file() has gathered about an image (its size and DPI, the product's target
+size and the customer's preflight approval tier) and returns what to do with it. It doesn't touch Notion, Pillow or
+the file system, so it can be run over any number of images at once, offline.
+
+Actions:
+    move: Size and DPI are right, move the file to the hotfolder as is.
+    dpi_fix: Size is right (within SIZE_TOLERANCE pixels), DPI isn't. Rewrite the DPI and move.
+    resize: Wrong size, customer approval tier 1. Scale to cover the target, crop the excess and move.
+    crop: Wrong size, customer approval tier 3. Crop to the target without scaling and move.
+    cancel: Wrong size for any other tier, or an aspect ratio outside ASPECT_TOLERANCE for tier 2. Cancel the order.
+    reject: Aspect ratio outside ASPECT_TOLERANCE for tiers other than 2. Report it and trash the file, the order stands.
+
+Dry run (from the repository root):
+    The manifest is a CSV with the columns file, width, height, dpi_x, dpi_y, xpix, ypix and allow_alter. Rows with an
+    empty width or height are probed from the file with ImageProbe. Plans are written as CSV to --output, and a count
+    per action and the planning time are printed.
+        python src/PreflightPlanner.py manifest.csv --output plans.csv
+        python src/PreflightPlanner.py --synthetic 100000
+'''
+
+import argparse, csv, random, sys, time
+from collections import Counter, namedtuple
+
+TARGET_DPI = (150, 150)
+SIZE_TOLERANCE = 38 # Pixels, 1/4 inch at 150 DPI.
+ASPECT_TOLERANCE = 0.05
+
+APPROVAL_RESIZE = 1
+APPROVAL_CANCEL = 2
+APPROVAL_CROP = 3
+
+PreflightPlan = namedtuple('PreflightPlan', ['action', 'reason', 'xpix', 'ypix', 'image_aspect', 'target_aspect'])
+
+MANIFEST_COLUMNS = ['file', 'width', 'height', 'dpi_x', 'dpi_y', 'xpix', 'ypix', 'allow_alter']
+
+
+def plan_preflight(size, dpi, xpix, ypix, allow_alter):
+    """
+    Decides what preflight does with an image.
+    Args:
+        size (tuple): The image's (width, height) in pixels.
+        dpi (tuple or None): The image's DPI.
+        xpix (int): The product's target width in pixels at 150 DPI.
+        ypix (int): The product's target height in pixels at 150 DPI.
+        allow_alter (int): The customer's preflight approval tier.
+    Returns:
+        PreflightPlan: The action, its reason ("aspect_ratio", "size", "dpi" or None), the target size turned to match
+            the image's orientation, and both aspect ratios.
+    """
+
+    # Turn the target to whichever orientation is closer to the image.
+    if abs(xpix - size[0]) + abs(ypix - size[1]) > abs(xpix - size[1]) + abs(ypix - size[0]):
+        xpix, ypix = ypix, xpix
+    image_aspect = size[0] / size[1]
+    target_aspect = xpix / ypix
+
+    if image_aspect <= target_aspect * (1 - ASPECT_TOLERANCE) or image_aspect >= target_aspect * (1 + ASPECT_TOLERANCE):
+        action = 'cancel' if allow_alter == APPROVAL_CANCEL else 'reject'
+        reason = 'aspect_ratio'
+
+    elif ((xpix - SIZE_TOLERANCE <= size[0] <= xpix + SIZE_TOLERANCE and
+           ypix - SIZE_TOLERANCE <= size[1] <= ypix + SIZE_TOLERANCE) or
+          (xpix - SIZE_TOLERANCE <= size[1] <= xpix + SIZE_TOLERANCE and
+           ypix - SIZE_TOLERANCE <= size[0] <= ypix + SIZE_TOLERANCE)):
+        action, reason = ('move', None) if dpi == TARGET_DPI else ('dpi_fix', 'dpi')
+
+    else:
+        action = {APPROVAL_RESIZE: 'resize', APPROVAL_CROP: 'crop'}.get(allow_alter, 'cancel')
+        reason = 'size'
+
+    return PreflightPlan(action, reason, xpix, ypix, image_aspect, target_aspect)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dry run preflight decisions over a manifest of images.")
+    parser.add_argument('manifest', nargs='?', help="CSV with the columns " + ", ".join(MANIFEST_COLUMNS) + ".")
+    parser.add_argument('--output', help="Write the plans to this CSV.")
+    parser.add_argument('--synthetic', type=int, metavar='ROWS', help="Plan this many random rows instead of a manifest.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for --synthetic.")
+    return parser.parse_args()
+
+
+def synthetic_rows(count, seed):
+    """
+    Random images around a handful of product sizes, with every DPI and approval tier mixed in.
+    """
+
+    rng = random.Random(seed)
+    products = [(1800, 2400), (3000, 2000), (1500, 1500), (4500, 3000), (2100, 3000)]
+
+    for index in range(count):
+        xpix, ypix = rng.choice(products)
+        scale = rng.choice((1, 1, 1, 2, 0.5, rng.uniform(0.4, 3)))
+        width, height = int(xpix * scale * rng.uniform(0.97, 1.03)), int(ypix * scale * rng.uniform(0.97, 1.03))
+        if rng.random() < 0.5:
+            width, height = height, width
+        dpi = rng.choice(((150, 150), (150, 150), (300, 300), (72, 72), None))
+        yield {'file': f"synthetic_{index}.jpg", 'width': width, 'height': height,
+               'dpi_x': dpi and dpi[0], 'dpi_y': dpi and dpi[1], 'xpix': xpix, 'ypix': ypix,
+               'allow_alter': rng.choice((0, 1, 2, 3))}
+
+
+def manifest_rows(path):
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            if not row.get('width') or not row.get('height'):
+                from ImageProbe import probe_image # Only needed for rows without a size.
+                info = probe_image(row['file'])
+                row['width'], row['height'] = info.size
+                row['dpi_x'], row['dpi_y'] = info.dpi or ('', '')
+            yield row
+
+
+def number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def main():
+    args = parse_args()
+    if args.synthetic:
+        rows = list(synthetic_rows(args.synthetic, args.seed))
+    elif args.manifest:
+        rows = list(manifest_rows(args.manifest))
+    else:
+        sys.exit("Give a manifest or --synthetic ROWS.")
+
+    start = time.perf_counter()
+    plans = []
+    for row in rows:
+        dpi = (number(row['dpi_x']), number(row['dpi_y'])) if row['dpi_x'] not in ('', None) else None
+        plans.append(plan_preflight((int(row['width']), int(row['height'])), dpi, int(row['xpix']),
+                                    int(row['ypix']), int(row['allow_alter'] or 0)))
+    seconds = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['file', 'action', 'reason', 'xpix', 'ypix', 'image_aspect', 'target_aspect'])
+            for row, plan in zip(rows, plans):
+                writer.writerow([row['file'], plan.action, plan.reason, plan.xpix, plan.ypix,
+                                 round(plan.image_aspect, 4), round(plan.target_aspect, 4)])
+
+    for action, count in sorted(Counter(plan.action for plan in plans).items()):
+        print(f"{action:<8} {count:>8}")
+    rate = len(plans) / seconds if seconds else float('inf')
+    print(f"Planned {len(plans)} images in {seconds:.3f}s ({rate:,.0f} per second).")
+
+
+if __name__ == '__main__':
+    main()
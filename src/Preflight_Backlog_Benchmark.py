@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+'''
+Backlog benchmark for CheckImageThenHotfolder.py against a rate limited fake Notion.
+
+Starts a CalderaReplayServer with its Notion endpoints limited to --notion-rate requests per second (answering 429
+past it, as Notion does), seeds it with the job, order, customer and product pages of --files Hopper files, and
+writes the files to a Hopper in a temp directory. The files are then fed to a PreflightPipeline the way the main loop
+does, once a --tick, with the worker counts from the preflight conf, until the Hopper is empty.
+
+The files are small JPEGs split evenly between the move, dpi_fix and resize actions, so the run time is the Notion
+traffic: about 3.6 requests per file, batched lookups included. At Notion's 3 requests per second a 500 file backlog
+takes about 10 minutes.
+
+Reports the wall time, the files per minute, the requests to each Notion endpoint and the number answered 429. Exits
+with status 1 if any request was answered 429, or any file was left in the Hopper or failed. With --no-rate-limiter
+NotionApiHelper.rate_limiter is turned off, leaving only the per-call sleeps, to show the 429s and 30 second retry
+stalls the shared limiter prevents.
+
+Usage (from the repository root):
+    python src/Preflight_Backlog_Benchmark.py --files 500
+    python src/Preflight_Backlog_Benchmark.py --files 60 --no-rate-limiter
+'''
+
+import argparse, contextlib, io, json, logging, os, shutil, sys, tempfile, time, uuid
+from collections import Counter
+from PIL import Image
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+
+from CalderaReplayServer import ReplayServer
+from NotionApiHelper import NotionApiHelper, RateLimiter
+from PreflightPipeline import FileClaims, PreflightPipeline
+import PreflightContext
+
+PRODUCTS = [(300, 200), (200, 300), (240, 240)] # Target sizes, small so the run time is the Notion traffic.
+ACTIONS = ['move', 'dpi_fix', 'resize']
+ORDER_PROP_NUMBER = 'Order%20number'
+CUSTOMER_APPROVAL = '1 - Resize' # Approval tier 1, wrong sizes are resized.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a preflight backlog against a rate limited fake Notion.")
+    parser.add_argument('--files', type=int, default=100, help="Files in the Hopper backlog.")
+    parser.add_argument('--files-per-order', type=int, default=2)
+    parser.add_argument('--customers', type=int, default=20)
+    parser.add_argument('--notion-workers', type=int, help="Defaults to the preflight conf.")
+    parser.add_argument('--image-workers', type=int, help="Defaults to the preflight conf.")
+    parser.add_argument('--notion-rate', type=float, default=3, help="Fake Notion's average requests per second.")
+    parser.add_argument('--notion-burst', type=int, default=3, help="Fake Notion requests allowed at once.")
+    parser.add_argument('--no-rate-limiter', action='store_true', help="Turn off NotionApiHelper's shared limiter.")
+    parser.add_argument('--tick', type=float, default=1.0, help="Seconds between submits, as in the main loop.")
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--verbose', action='store_true', help="Keep the preflight's output and logging.")
+    return parser.parse_args()
+
+
+def text(value):
+    return [{'type': 'text', 'text': {'content': value, 'link': None}, 'plain_text': value, 'href': None}]
+
+
+def seed_notion(server, file_count, files_per_order, customer_count):
+    """
+    Adds the products, customers, orders and jobs of the backlog to the fake Notion.
+    Returns:
+        list: (job page ID, product index, action) per file.
+    """
+
+    products = []
+    for index, (xpix, ypix) in enumerate(PRODUCTS):
+        products.append(server.add_page('products', {
+            'xpix': {'id': 'xpix', 'type': 'number', 'number': xpix},
+            'ypix': {'id': 'ypix', 'type': 'number', 'number': ypix},
+            'Hot Folder': {'id': 'Hot%20Folder', 'type': 'select', 'select': {'name': f"Bench_{index}"}},
+            'Product Code': {'id': 'title', 'type': 'title', 'title': text(f"BENCH-{xpix}x{ypix}")}
+            }))
+
+    customers = [
+        server.add_page('customers', {
+            'Preflight Approval': {'id': PreflightContext.CUSTOMER_PROP_PREFLIGHT, 'type': 'select',
+                                   'select': {'name': CUSTOMER_APPROVAL}}
+            })
+        for _ in range(customer_count)
+        ]
+
+    jobs = []
+    order_id = None
+    for index in range(file_count):
+        if index % files_per_order == 0:
+            order_id = server.add_page('orders', {
+                'Order number': {'id': ORDER_PROP_NUMBER, 'type': 'rich_text', 'rich_text': text(f"BENCH-{index}")},
+                'Customer': {'id': PreflightContext.ORDER_PROP_CUSTOMER, 'type': 'relation', 'has_more': False,
+                             'relation': [{'id': customers[index % customer_count]}]}
+                })
+
+        product_index = index % len(PRODUCTS)
+        job_id = uuid.uuid4().hex
+        server.add_page(PreflightContext.JOB_DB_ID, {
+            'Log': {'id': 'Log', 'type': 'rich_text', 'rich_text': []},
+            'Product': {'id': 'Product', 'type': 'relation', 'has_more': False,
+                        'relation': [{'id': products[product_index]}]},
+            'Order ID': {'id': 'Order%20ID', 'type': 'formula', 'formula': {'type': 'string', 'string': f"BENCH-{index}"}},
+            'Order': {'id': 'Order', 'type': 'relation', 'has_more': False, 'relation': [{'id': order_id}]},
+            'Image source': {'id': 'Image%20source', 'type': 'rich_text', 'rich_text': []},
+            PreflightContext.JOB_PROP_NOTION_RECORD: {
+                'id': 'Notion%20record', 'type': 'formula',
+                'formula': {'type': 'string', 'string': f"https://www.notion.so/{job_id}"}
+                }
+            }, page_id=job_id)
+        jobs.append((job_id, product_index, ACTIONS[(index // len(PRODUCTS)) % len(ACTIONS)]))
+
+    return jobs
+
+
+def make_images():
+    """
+    Returns:
+        dict: JPEG bytes per (product index, action).
+    """
+
+    images = {}
+    for product_index, (xpix, ypix) in enumerate(PRODUCTS):
+        for action in ACTIONS:
+            size, dpi = (xpix, ypix), (150, 150)
+            if action == 'dpi_fix':
+                dpi = (72, 72)
+            elif action == 'resize':
+                size = (xpix * 2, ypix * 2)
+            buffer = io.BytesIO()
+            Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, 'JPEG', dpi=dpi)
+            images[(product_index, action)] = buffer.getvalue()
+    return images
+
+
+def main():
+    args = parse_args()
+    os.chdir(REPO_DIR) # NotionApiHelper reads src/headers.json, and the preflight logs to logs/.
+
+    import CheckImageThenHotfolder
+    from CanceledOrders import CanceledOrderRegistry
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL) # Job errors are logged at ERROR, and are expected here.
+
+    server = ReplayServer({'jobs': {}, 'devices': []}, notion_rate=args.notion_rate, notion_burst=args.notion_burst)
+    server.start()
+    jobs = seed_notion(server, args.files, args.files_per_order, args.customers)
+
+    workdir = tempfile.mkdtemp(prefix='preflight_backlog_')
+    hotfolders = os.path.join(workdir, 'Hotfolders')
+    hopper = os.path.join(hotfolders, 'Hopper')
+    for folder in ['Hopper', 'tmp'] + [f"Bench_{index}" for index in range(len(PRODUCTS))]:
+        os.makedirs(os.path.join(hotfolders, folder))
+
+    images = make_images()
+    for index, (job_id, product_index, action) in enumerate(jobs):
+        with open(os.path.join(hopper, f"PR--JOB-{index}_1-1_BENCH_{job_id}__1.jpg"), 'wb') as file:
+            file.write(images[(product_index, action)])
+
+    class ReplayNotionApiHelper(NotionApiHelper):
+        def __init__(self, *helper_args, **helper_kwargs):
+            super().__init__(*helper_args, **helper_kwargs)
+            self.endPoint = f"{server.base_url}/v1"
+
+    if args.no_rate_limiter:
+        NotionApiHelper.rate_limiter = RateLimiter(float('inf'))
+
+    conf = CheckImageThenHotfolder.load_preflight_conf()
+    notion_workers = args.notion_workers or conf['notion_workers']
+    image_workers = conf['image_workers'] if args.image_workers is None else args.image_workers
+
+    # The handler's helpers and its canceled order file are pointed at the fake Notion and the temp directory.
+    CheckImageThenHotfolder.NotionApiHelper = ReplayNotionApiHelper
+    CheckImageThenHotfolder.CanceledOrderRegistry = lambda path: CanceledOrderRegistry(
+        os.path.join(workdir, os.path.basename(path)))
+    handler = CheckImageThenHotfolder.HotfolderHandler(image_workers, notion_workers=notion_workers)
+    handler.HOTFOLDER_PATH = hotfolders
+    handler.context.notion_factory = ReplayNotionApiHelper
+    pipeline = PreflightPipeline(handler, hopper, FileClaims(os.path.join(hotfolders, 'Preflight_Claims')),
+                                 notion_workers)
+
+    print(f"{args.files} files, {notion_workers} workers, {image_workers} image processes, fake Notion at "
+          f"{args.notion_rate:g} requests/s, rate limiter {'off' if args.no_rate_limiter else 'on'}.")
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output:
+        backlog = sorted(os.listdir(hopper))
+        while True:
+            if backlog:
+                backlog = pipeline.submit(backlog)
+            if not backlog and not pipeline.busy():
+                break
+            time.sleep(args.tick)
+        elapsed = time.perf_counter() - start
+        pipeline.shutdown(wait=True)
+        handler.shutdown()
+
+    server.stop()
+    counts = server.snapshot_counts()
+    rate_limited = counts.pop('429', 0)
+    left = os.listdir(hopper)
+    outputs = Counter(folder for folder in os.listdir(hotfolders) if folder.startswith('Bench_')
+                      for _ in os.listdir(os.path.join(hotfolders, folder)))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        'files': args.files, 'notion_workers': notion_workers, 'image_workers': image_workers,
+        'rate_limiter': not args.no_rate_limiter, 'notion_rate': args.notion_rate, 'seconds': round(elapsed, 2),
+        'files_per_minute': round(args.files / elapsed * 60, 1), 'notion_requests': sum(counts.values()),
+        'rate_limited': rate_limited, 'left_in_hopper': len(left), 'failed': len(pipeline.failed),
+        'outputs': dict(sorted(outputs.items())), 'requests': dict(sorted(counts.items()))
+        }
+
+    print(f"{summary['seconds']} s, {summary['files_per_minute']} files/min, {summary['notion_requests']} Notion "
+          f"requests, {rate_limited} answered 429.")
+    print(f"Left in the Hopper: {len(left)}, failed: {len(pipeline.failed)}, outputs: {summary['outputs']}")
+    print(f"Requests: {summary['requests']}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+    if rate_limited or left or pipeline.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+'''
+Resize benchmark for PreflightImageOps.resize_and_crop().
+
+Generates synthetic large images (a gradient with noise, so they compress like a photo and not like a flat color),
+then runs three resize paths on each one:
+    legacy: Full decode, LANCZOS over the whole image, then crop.
+    scale_then_crop: Draft decoding and reducing_gap, but still resampling the whole image before cropping.
+    current: PreflightImageOps.resize_and_crop(), which only resamples the region kept by the crop.
+Every run happens in a fresh process, so the peak RSS reported is that run's alone. Each process gets the image
+worker settings from --stream-pixels and --memory-budget. Sources of stream_pixels or more go through libvips in the
+current method when pyvips is installed, and runs that go over the memory budget report the error instead of a result.
+Without pyvips, runs over the budget go ahead, as the image workers would run them one at a time.
+
+With --verify, the current output is compared pixel by pixel with the scale_then_crop output, which decodes the same
+way, so only the crop-before-resize ordering is checked. The check fails if the sizes differ or the mean absolute
+difference is over --tolerance (0-255 scale), and the script exits with status 1. The difference from the legacy
+output is printed too, for reference only, since draft decoding differs slightly from a full decode. Sources streamed
+through libvips use its own resampler and encoder, so expect larger (if still invisible) differences for those.
+
+Usage (from the repository root):
+    python src/Preflight_Resize_Benchmark.py --megapixels 60 --target 3000 2000
+    python src/Preflight_Resize_Benchmark.py --formats JPEG PNG --megapixels 24 100 --repeat 3 --json output/resize.json
+    python src/Preflight_Resize_Benchmark.py --formats PNG JPEG --megapixels 2 8 --target 1234 987 --verify
+'''
+
+import argparse, json, math, multiprocessing, os, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageChops, ImageStat
+
+import PreflightImageOps
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'TIFF': 'tif'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the preflight resize path on synthetic large images.")
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[60], help="Source image sizes, 3:2 aspect.")
+    parser.add_argument('--formats', nargs='+', default=['JPEG'], choices=sorted(EXTENSIONS), help="Source formats.")
+    parser.add_argument('--target', type=int, nargs=2, default=[3000, 2000], metavar=('XPIX', 'YPIX'))
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per method, the fastest is reported.")
+    parser.add_argument('--workdir', help="Where to write the synthetic images. Defaults to a temp directory.")
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--stream-pixels', type=int, default=PreflightImageOps.STREAM_PIXELS,
+                        help="Sources this large use libvips in the current method, when pyvips is installed.")
+    parser.add_argument('--memory-budget', type=int, default=PreflightImageOps.MEMORY_BUDGET_MB,
+                        help="Image worker memory budget in MB, 0 for none. Also applied as RLIMIT_AS where supported, "
+                             "with pyvips installed.")
+    parser.add_argument('--verify', action='store_true', help="Compare current outputs with scale_then_crop outputs.")
+    parser.add_argument('--tolerance', type=float, default=1.0, help="Max mean absolute difference for --verify.")
+    return parser.parse_args()
+
+
+def legacy_resize_and_crop(src_path, dst_path, target_xpix, target_ypix):
+    """
+    The resize path before draft decoding and reducing_gap: decode everything, LANCZOS the whole image, then crop.
+    """
+
+    with Image.open(src_path) as image:
+        icc_profile = image.info.get('icc_profile')
+        original_size = image.size
+
+        scale_factor = max(target_xpix / original_size[0], target_ypix / original_size[1])
+        scaled_image = image.resize(
+            (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor)), Image.LANCZOS
+            )
+
+        PreflightImageOps._crop_and_save(scaled_image, dst_path, target_xpix, target_ypix, icc_profile)
+
+    return original_size
+
+
+def scale_then_crop(src_path, dst_path, target_xpix, target_ypix):
+    """
+    Decodes like resize_and_crop(), but resamples the whole image and crops afterwards.
+    """
+
+    with Image.open(src_path) as image:
+        icc_profile = image.info.get('icc_profile')
+        original_size = image.size
+
+        scale_factor = max(target_xpix / original_size[0], target_ypix / original_size[1])
+        scaled_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
+        reducing_gap = None
+
+        if scale_factor < PreflightImageOps.REDUCE_THRESHOLD:
+            reducing_gap = PreflightImageOps.REDUCING_GAP
+            if image.format == 'JPEG':
+                gap = PreflightImageOps.DRAFT_GAP
+                image.draft(image.mode, (math.ceil(scaled_size[0] * gap), math.ceil(scaled_size[1] * gap)))
+
+        scaled_image = image.resize(scaled_size, Image.LANCZOS, reducing_gap=reducing_gap)
+        PreflightImageOps._crop_and_save(scaled_image, dst_path, target_xpix, target_ypix, icc_profile)
+
+    return original_size
+
+
+METHODS = {
+    'legacy': legacy_resize_and_crop,
+    'scale_then_crop': scale_then_crop,
+    'current': PreflightImageOps.resize_and_crop
+    }
+
+
+def make_image(path, megapixels, image_format):
+    if os.path.exists(path):
+        return
+
+    width = int((megapixels * 1000000 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    image.save(path, image_format, dpi=(300, 300))
+
+
+def compare_images(path_a, path_b):
+    """
+    Returns the mean and max absolute pixel difference between two images, or None if their sizes differ.
+    """
+
+    with Image.open(path_a) as image_a, Image.open(path_b) as image_b:
+        if image_a.size != image_b.size:
+            return None
+
+        diff = ImageChops.difference(image_a.convert('RGB'), image_b.convert('RGB'))
+        mean = sum(ImageStat.Stat(diff).mean) / 3
+        return mean, max(high for low, high in diff.getextrema())
+
+
+def peak_rss_mb():
+    # Linux carries ru_maxrss over from the parent, even across exec, so the child's own high water mark is read
+    # from /proc where it exists.
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def timed_run(method, src_path, dst_path, target_xpix, target_ypix, stream_pixels, memory_budget):
+    PreflightImageOps.init_worker(PreflightImageOps.MAX_IMAGE_PIXELS, stream_pixels, memory_budget)
+    start = time.perf_counter()
+    try:
+        METHODS[method](src_path, dst_path, target_xpix, target_ypix)
+        error = None
+    except MemoryError as e:
+        error = str(e) or type(e).__name__
+    return time.perf_counter() - start, peak_rss_mb(), error
+
+
+def run_in_fresh_process(method, src_path, dst_path, args):
+    # Spawned, not forked, so the child doesn't start with a copy of this process's memory.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(timed_run, method, src_path, dst_path, args.target[0], args.target[1],
+                           args.stream_pixels, args.memory_budget).result()
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='preflight_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    failures = 0
+
+    print(f"{'source':<28} {'method':<16} {'seconds':>8} {'peak RSS MB':>12}")
+
+    for image_format in args.formats:
+        for megapixels in args.megapixels:
+            src_path = os.path.join(workdir, f"source_{megapixels:g}mp.{EXTENSIONS[image_format]}")
+            make_image(src_path, megapixels, image_format)
+
+            for method in METHODS:
+                dst_path = os.path.join(workdir, f"out_{method}_{megapixels:g}mp.{EXTENSIONS[image_format]}")
+                if os.path.exists(dst_path):
+                    os.remove(dst_path)
+
+                runs = [run_in_fresh_process(method, src_path, dst_path, args) for _ in range(args.repeat)]
+                seconds = min(run[0] for run in runs)
+                rss = max(run[1] for run in runs) if runs[0][1] is not None else None
+                error = runs[-1][2]
+
+                results.append({'format': image_format, 'megapixels': megapixels, 'method': method,
+                                'seconds': round(seconds, 3), 'peak_rss_mb': round(rss, 1) if rss else None,
+                                'error': error})
+                rss_text = f"{rss:.1f}" if rss else "n/a"
+                verify_text = f"  {error}" if error else ""
+
+                if args.verify and method == 'current' and not error:
+                    output_path = lambda name: os.path.join(
+                        workdir, f"out_{name}_{megapixels:g}mp.{EXTENSIONS[image_format]}")
+                    difference = compare_images(output_path('scale_then_crop'), dst_path)
+                    legacy_difference = compare_images(output_path('legacy'), dst_path)
+                    passed = difference is not None and difference[0] <= args.tolerance
+                    failures += not passed
+
+                    results[-1]['verify'] = {'passed': passed, 'mean_diff': difference and round(difference[0], 4),
+                                             'max_diff': difference and difference[1],
+                                             'legacy_mean_diff': legacy_difference and round(legacy_difference[0], 4)}
+                    verify_text = "  size mismatch  FAILED" if difference is None else (
+                        f"  mean diff {difference[0]:.4f}, max diff {difference[1]}{'' if passed else '  FAILED'}")
+                    if legacy_difference:
+                        verify_text += f" (vs legacy: mean {legacy_difference[0]:.4f})"
+
+                print(f"{os.path.basename(src_path):<28} {method:<16} {seconds:>8.3f} {rss_text:>12}{verify_text}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'target': args.target, 'workdir': workdir, 'results': results}, file, indent=4)
+
+    if failures:
+        print(f"{failures} verification(s) failed.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()